@@ -0,0 +1,478 @@
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+
+BAR_KINDS = ("tick", "volume", "dollar", "range")
+BAR_COLUMNS = [
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "buy",
+    "sell",
+    "trades",
+    "vwap",
+    "avgSize",
+    "maxSize",
+    "imbalance",
+]
+PROFILE_SLOT = 300
+
+
+def isTimeInterval(interval):
+    # Trade-driven bars are written kind:threshold, e.g. volume:1000000
+    return ":" not in interval
+
+
+def parseBarSpec(interval):
+    kind, threshold = interval.split(":")
+    if kind not in BAR_KINDS:
+        raise ValueError("Unknown bar type {}".format(kind))
+    return kind, float(threshold)
+
+
+def flowBars(df, interval, origin="start_day"):
+    # One resample only finds each bin's first trade, the bars themselves are
+    # reduced in one pass like trade-driven bars; empty bins come back as rows
+    # with no trades
+    positions = pd.Series(np.arange(len(df)), index=df.index)
+    first = positions.resample(interval, origin=origin).first()
+    traded = first.notna().to_numpy()
+    bars = reduceBars(df, first.to_numpy()[traded].astype(np.int64))
+    bars.index = first.index[traded]
+
+    bars = bars.reindex(first.index)
+    for column in ("volume", "buy", "sell", "trades"):
+        bars[column] = bars[column].fillna(0)
+    return bars
+
+
+def rangeStarts(price, threshold, window=256):
+    starts = []
+    i = 0
+    while i < len(price):
+        starts.append(i)
+        size = window
+        while True:
+            # Running high - low from the bar's first trade, widened until it breaks
+            chunk = price[i : i + size]
+            span = np.maximum.accumulate(chunk) - np.minimum.accumulate(chunk)
+            hit = np.flatnonzero(span >= threshold)
+            if len(hit):
+                i += hit[0] + 1
+                break
+            if i + size >= len(price):
+                i = len(price)
+                break
+            size *= 2
+
+    return np.array(starts, dtype=np.int64)
+
+
+def barStarts(df, kind, threshold, offset=0.0):
+    # Index of each bar's first trade, and the running total before each trade
+    price = df.price.to_numpy(dtype="f8")
+    if kind == "range":
+        return rangeStarts(price, threshold), None
+
+    if kind == "tick":
+        measure = np.ones(len(price))
+    elif kind == "volume":
+        measure = df["size"].to_numpy(dtype="f8")
+    else:
+        measure = df["size"].to_numpy(dtype="f8") * price
+
+    cum = offset + np.cumsum(measure)
+    ids = np.ceil(cum / threshold) - 1
+    starts = np.flatnonzero(np.diff(ids)) + 1
+    return np.insert(starts, 0, 0), cum - measure
+
+
+def reduceBars(df, starts):
+    if not len(df):
+        return pd.DataFrame(columns=BAR_COLUMNS, index=df.index[:0], dtype="f8")
+
+    # Every column comes from the same reduceat cuts over the trade arrays
+    price = df.price.to_numpy(dtype="f8")
+    size = df["size"].to_numpy(dtype="f8")
+    ends = np.append(starts[1:], len(price))
+    trades = np.diff(np.append(starts, len(price))).astype("f8")
+    volume = np.add.reduceat(size, starts)
+    buy = np.add.reduceat(np.where(df.side.to_numpy() == "Buy", size, 0), starts)
+    notional = np.add.reduceat(price * size, starts)
+    return pd.DataFrame(
+        {
+            "open": price[starts],
+            "high": np.maximum.reduceat(price, starts),
+            "low": np.minimum.reduceat(price, starts),
+            "close": price[ends - 1],
+            "volume": volume,
+            "buy": buy,
+            "sell": volume - buy,
+            "trades": trades,
+            "vwap": notional / volume,
+            "avgSize": volume / trades,
+            "maxSize": np.maximum.reduceat(size, starts),
+            "imbalance": (2 * buy - volume) / volume,
+        },
+        index=df.index[starts],
+    )
+
+
+def makeBars(df, interval):
+    # Bars carry their buy and sell volume, so the volume pane reads the same
+    # rows as the candles instead of going back to the trades
+    if isTimeInterval(interval):
+        return flowBars(df, interval)
+
+    kind, threshold = parseBarSpec(interval)
+    starts, _ = barStarts(df, kind, threshold)
+    return reduceBars(df, starts)
+
+
+class BarBuilder(object):
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self.reset()
+
+    def reset(self):
+        self.seen = 0
+        self.first = None
+        self.closed = None
+        self.pending = None
+        self.offset = 0.0
+        self.ohlc = None
+
+    def update(self, df):
+        # The live frame only grows within a day, anything else starts over
+        if len(df) < self.seen or (len(df) and df.index[0] != self.first):
+            self.reset()
+        if self.ohlc is not None and len(df) == self.seen:
+            return self.ohlc
+
+        # Only the forming bar's trades are aggregated again
+        new = df.iloc[self.seen :]
+        data = new if self.pending is None else pd.concat([self.pending, new])
+        self.seen = len(df)
+        self.first = df.index[0] if len(df) else None
+
+        if isTimeInterval(self.interval):
+            bars = flowBars(data, self.interval)
+            if len(bars):
+                self.pending = data[data.index >= bars.index[-1]]
+        else:
+            kind, threshold = parseBarSpec(self.interval)
+            starts, before = barStarts(data, kind, threshold, self.offset)
+            bars = reduceBars(data, starts)
+            if len(bars):
+                last = starts[-1]
+                self.pending = data.iloc[last:]
+                if before is not None:
+                    self.offset = before[last]
+
+        if self.closed is None:
+            self.closed = bars.iloc[:-1]
+        else:
+            self.closed = pd.concat([self.closed, bars.iloc[:-1]])
+        self.ohlc = pd.concat([self.closed, bars.iloc[-1:]])
+        return self.ohlc
+
+
+class PriceHistogram(object):
+    def __init__(self, low, step, buy, sell, maxBins):
+        super().__init__()
+        self.low = low
+        self.step = step
+        self.buy = buy
+        self.sell = sell
+        self.maxBins = maxBins
+
+    @classmethod
+    def fromTrades(cls, df, num):
+        low = df.price.min()
+        high = df.price.max()
+        step = (high - low) / num or 1.0
+
+        hist = cls(low, step, np.zeros(num), np.zeros(num), 2 * num)
+        hist.add(df)
+        return hist
+
+    @property
+    def high(self):
+        return self.low + self.step * len(self.buy)
+
+    def add(self, df):
+        if not len(df):
+            return
+
+        price = df.price.to_numpy(dtype="f8")
+        size = df["size"].to_numpy(dtype="f8")
+        isBuy = (df.side == "Buy").to_numpy()
+
+        # A wider range adds whole bins at the ends, the existing bins keep
+        # their counts and no trade is binned twice
+        low, high = price.min(), price.max()
+        below = max(0, int(np.ceil((self.low - low) / self.step)))
+        above = max(0, int(np.ceil((high - self.high) / self.step)))
+        if below or above:
+            self.buy = np.pad(self.buy, (below, above))
+            self.sell = np.pad(self.sell, (below, above))
+            self.low -= below * self.step
+
+        # Too many bins halves the resolution by summing neighbours
+        while len(self.buy) > self.maxBins:
+            if len(self.buy) % 2:
+                self.buy = np.append(self.buy, 0)
+                self.sell = np.append(self.sell, 0)
+            self.buy = self.buy.reshape(-1, 2).sum(axis=1)
+            self.sell = self.sell.reshape(-1, 2).sum(axis=1)
+            self.step *= 2
+
+        # Right-closed bins with the lowest edge included, as pd.cut does
+        n = len(self.buy)
+        bins = np.clip(np.ceil((price - self.low) / self.step) - 1, 0, n - 1)
+        bins = bins.astype(np.int64)
+        self.buy += np.bincount(bins[isBuy], size[isBuy], n)
+        self.sell += np.bincount(bins[~isBuy], size[~isBuy], n)
+
+    def toFrame(self):
+        edges = self.low + self.step * np.arange(len(self.buy) + 1)
+        return pd.DataFrame(
+            {"buy": self.buy, "sell": self.sell},
+            index=pd.IntervalIndex.from_breaks(edges),
+        )
+
+
+def profileBucket(price):
+    # One price grid per symbol so days can be summed, about 2000 steps at price
+    return 10.0 ** np.floor(np.log10(price / 2000))
+
+
+class DayProfile(object):
+    def __init__(self, bucket, slot=PROFILE_SLOT):
+        super().__init__()
+        self.bucket = bucket
+        self.slot = slot
+
+        # One entry per (time slot, price bucket) that traded, in time order
+        self.slots = np.empty(0, dtype=np.int64)
+        self.buckets = np.empty(0, dtype=np.int64)
+        self.buyEntries = np.empty(0)
+        self.sellEntries = np.empty(0)
+
+        # Whole-day totals, dense from bucket low
+        self.low = 0
+        self.buy = np.empty(0)
+        self.sell = np.empty(0)
+
+    @property
+    def nbytes(self):
+        return sum(
+            a.nbytes
+            for a in (
+                self.slots,
+                self.buckets,
+                self.buyEntries,
+                self.sellEntries,
+                self.buy,
+                self.sell,
+            )
+        )
+
+    def copy(self):
+        # Entries are only ever replaced, the dense totals are added to in place
+        profile = DayProfile(self.bucket, self.slot)
+        profile.slots = self.slots
+        profile.buckets = self.buckets
+        profile.buyEntries = self.buyEntries
+        profile.sellEntries = self.sellEntries
+        profile.low = self.low
+        profile.buy = self.buy.copy()
+        profile.sell = self.sell.copy()
+        return profile
+
+    def add(self, df):
+        if not len(df):
+            return
+
+        seconds = df.index.values.astype("datetime64[s]").astype(np.int64)
+        slot = seconds // self.slot
+        bucket = np.floor(df.price.to_numpy(dtype="f8") / self.bucket)
+        bucket = bucket.astype(np.int64)
+        size = df["size"].to_numpy(dtype="f8")
+        isBuy = (df.side == "Buy").to_numpy()
+
+        # Collapse the batch to one entry per (slot, bucket)
+        s0 = slot[0]
+        b0 = bucket.min()
+        nb = bucket.max() - b0 + 1
+        keys, inverse = np.unique((slot - s0) * nb + bucket - b0, return_inverse=True)
+        buy = np.bincount(inverse, size * isBuy, len(keys))
+        sell = np.bincount(inverse, size * ~isBuy, len(keys))
+
+        self.slots = np.append(self.slots, s0 + keys // nb)
+        self.buckets = np.append(self.buckets, b0 + keys % nb)
+        self.buyEntries = np.append(self.buyEntries, buy)
+        self.sellEntries = np.append(self.sellEntries, sell)
+
+        if not len(self.buy):
+            self.low = b0
+        below = max(0, self.low - b0)
+        above = max(0, b0 + nb - self.low - len(self.buy))
+        if below or above:
+            self.buy = np.pad(self.buy, (below, above))
+            self.sell = np.pad(self.sell, (below, above))
+            self.low -= below
+
+        n = len(self.buy)
+        self.buy += np.bincount(bucket - self.low, size * isBuy, n)
+        self.sell += np.bincount(bucket - self.low, size * ~isBuy, n)
+
+    def window(self, startTs, endTs):
+        # (low, buy, sell) for the slots overlapping [startTs, endTs]
+        if not len(self.slots):
+            return None
+
+        first = startTs // self.slot
+        last = endTs // self.slot
+        if first <= self.slots[0] and self.slots[-1] <= last:
+            return self.low, self.buy, self.sell
+
+        i = self.slots.searchsorted(first)
+        j = self.slots.searchsorted(last, side="right")
+        if i >= j:
+            return None
+
+        index = self.buckets[i:j] - self.low
+        n = len(self.buy)
+        return (
+            self.low,
+            np.bincount(index, self.buyEntries[i:j], n),
+            np.bincount(index, self.sellEntries[i:j], n),
+        )
+
+
+def mergeProfiles(parts, bucket, rows):
+    # Sum day windows on the shared grid, then group the grid into display rows
+    parts = [part for part in parts if part is not None]
+    if not parts:
+        return None
+
+    low = min(part[0] for part in parts)
+    high = max(part[0] + len(part[1]) for part in parts)
+    buy = np.zeros(high - low)
+    sell = np.zeros(high - low)
+    for start, b, s in parts:
+        buy[start - low : start - low + len(b)] += b
+        sell[start - low : start - low + len(s)] += s
+
+    # Drop empty buckets at the ends so rows span the traded range only
+    traded = np.flatnonzero(buy + sell)
+    if not len(traded):
+        return None
+    buy = buy[traded[0] : traded[-1] + 1]
+    sell = sell[traded[0] : traded[-1] + 1]
+    low += traded[0]
+
+    rows = min(rows, len(buy))
+    starts = np.linspace(0, len(buy), rows + 1).astype(np.int64)
+    edges = (low + starts) * bucket
+    return (
+        edges,
+        np.add.reduceat(buy, starts[:-1]),
+        np.add.reduceat(sell, starts[:-1]),
+    )
+
+
+class SizeIndex(object):
+    def __init__(self):
+        super().__init__()
+        # Trades ordered by size, so the trades of at least a size are a
+        # suffix one binary search away
+        self.size = np.empty(0)
+        self.time = np.empty(0)
+        self.price = np.empty(0)
+        self.buy = np.empty(0, dtype=bool)
+
+    def __len__(self):
+        return len(self.size)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.size, self.time, self.price, self.buy))
+
+    def copy(self):
+        # add replaces the arrays, so the copy can share them
+        index = SizeIndex()
+        index.size, index.time, index.price, index.buy = (
+            self.size,
+            self.time,
+            self.price,
+            self.buy,
+        )
+        return index
+
+    def add(self, df):
+        if not len(df):
+            return
+
+        # The batch is sorted on its own, merging two sorted runs with a
+        # stable sort is close to linear
+        size = df["size"].to_numpy(dtype="f8")
+        order = np.argsort(size, kind="stable")
+        seconds = df.index.values.astype("datetime64[ns]").astype(np.int64) / 1e9
+        columns = [
+            np.concatenate([old, new[order]])
+            for old, new in (
+                (self.size, size),
+                (self.time, seconds),
+                (self.price, df.price.to_numpy(dtype="f8")),
+                (self.buy, (df.side == "Buy").to_numpy()),
+            )
+        ]
+        order = np.argsort(columns[0], kind="stable")
+        self.size, self.time, self.price, self.buy = [c[order] for c in columns]
+
+    def query(self, minSize, startTs, endTs):
+        # (time, price, size, buy) of trades of at least minSize in
+        # [startTs, endTs], largest first
+        n = np.searchsorted(self.size, minSize)
+        time = self.time[n:][::-1]
+        mask = (time >= startTs) & (time <= endTs)
+        return (
+            time[mask],
+            self.price[n:][::-1][mask],
+            self.size[n:][::-1][mask],
+            self.buy[n:][::-1][mask],
+        )
+
+
+def splitsDays(interval):
+    # True when bars of this interval never straddle midnight UTC
+    offset = to_offset(interval)
+    if not isinstance(offset, pd.offsets.Tick):
+        return False
+    seconds = pd.Timedelta(offset).total_seconds()
+    return seconds <= 86400 and 86400 % seconds == 0
+
+
+def mergeBars(parts, interval, origin="start_day"):
+    # Parts must share the origin they were binned from, a bar straddling
+    # midnight then has the same edges in both days and is summed back whole
+    bars = pd.concat(parts)
+    if splitsDays(interval) or not len(bars):
+        return bars
+
+    # Per-bar ratios are recombined from the merged sums
+    bars = bars.assign(notional=bars.vwap.fillna(0) * bars.volume)
+    agg = {"open": "first", "high": "max", "low": "min", "close": "last"}
+    agg.update({"maxSize": "max", "vwap": "last", "avgSize": "last"})
+    agg["imbalance"] = "last"
+    agg.update({c: "sum" for c in bars.columns if c not in agg})
+    bars = bars.resample(interval, origin=origin).agg(agg)
+    bars["vwap"] = bars.notional / bars.volume
+    bars["avgSize"] = bars.volume / bars.trades
+    bars["imbalance"] = (bars.buy - bars.sell) / bars.volume
+    return bars[BAR_COLUMNS]
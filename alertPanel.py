@@ -0,0 +1,138 @@
+import datetime
+from time import time
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+from alerts import KIND_NAMES, makeRules, parseRule, ruleText
+from utils import logger
+
+
+class AlertPanel(QtWidgets.QWidget):
+    sigAlerts = QtCore.pyqtSignal(object, object, object)
+
+    def __init__(self, parent, service, maxEvents=500):
+        super().__init__(parent)
+        self.service = service
+        self.maxEvents = maxEvents
+        self.rules = {symbol: [] for symbol in service.symbols}
+        self.nextId = 0
+
+        self.cbSymbol = QtWidgets.QComboBox(self)
+        self.cbSymbol.addItems(service.symbols)
+        self.cbSymbol.currentIndexChanged.connect(self.showRules)
+        self.leRule = QtWidgets.QLineEdit(self)
+        self.leRule.setPlaceholderText("above 65000, move -1% 60s, volume 5M 30s")
+        self.leRule.returnPressed.connect(self.btnAddClicked)
+        self.btnAdd = QtWidgets.QPushButton("Add", self)
+        self.btnAdd.clicked.connect(self.btnAddClicked)
+        self.btnRemove = QtWidgets.QPushButton("Remove", self)
+        self.btnRemove.clicked.connect(self.btnRemoveClicked)
+
+        self.ruleList = QtWidgets.QListWidget(self)
+        self.ruleList.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.eventList = QtWidgets.QListWidget(self)
+        self.label = QtWidgets.QLabel("No rules", self)
+
+        top = QtWidgets.QHBoxLayout()
+        top.addWidget(self.cbSymbol)
+        top.addWidget(self.leRule, 1)
+        top.addWidget(self.btnAdd)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(top)
+        layout.addWidget(self.ruleList, 1)
+        layout.addWidget(self.btnRemove)
+        layout.addWidget(self.eventList, 2)
+        layout.addWidget(self.label)
+
+        self.buyBrush = QtGui.QBrush(QtGui.QColor(0, 200, 0))
+        self.sellBrush = QtGui.QBrush(QtGui.QColor(230, 0, 0))
+
+        # Triggers arrive on the service's alert thread and are shown on the
+        # GUI thread
+        self.sigAlerts.connect(self.addEvents)
+        service.onAlerts(self.sigAlerts.emit)
+
+    def symbol(self):
+        return self.cbSymbol.currentText()
+
+    def showRules(self):
+        self.ruleList.clear()
+        for rule in makeRules(self.rules[self.symbol()]):
+            item = QtWidgets.QListWidgetItem(ruleText(rule))
+            item.setData(QtCore.Qt.UserRole, int(rule["id"]))
+            self.ruleList.addItem(item)
+
+    def publish(self, symbol):
+        if not self.service.setAlerts(symbol, makeRules(self.rules[symbol])):
+            self.label.setText(
+                "{}: the feed did not take the new rules, edit them to retry".format(
+                    symbol
+                )
+            )
+        self.showRules()
+
+    def addEvents(self, symbol, events, metrics):
+        # Delivery is measured from the feed process putting the message
+        delivery = (time() - metrics["sentAt"]) * 1000
+        self.label.setText(
+            "{}: {} rules, eval p50 {:.2f} ms p99 {:.2f} ms, delivered in {:.1f} ms".format(
+                symbol, metrics["rules"], metrics["p50"], metrics["p99"], delivery
+            )
+        )
+
+        for rule, kind, timestamp, price, value in events:
+            name = KIND_NAMES[kind]
+            if name == "move":
+                observed = "{:+.2%}".format(value)
+            elif name == "volume":
+                observed = "{:,.0f}".format(value)
+            else:
+                observed = "{:,.2f}".format(value)
+
+            item = QtWidgets.QListWidgetItem(
+                "{} {} {} {} at {:,.2f}".format(
+                    datetime.datetime.fromtimestamp(timestamp).strftime("%H:%M:%S"),
+                    symbol,
+                    name,
+                    observed,
+                    price,
+                )
+            )
+            if name == "above" or (name == "move" and value > 0):
+                item.setForeground(self.buyBrush)
+            elif name != "volume":
+                item.setForeground(self.sellBrush)
+            self.eventList.insertItem(0, item)
+            self.window().statusBar().showMessage(item.text(), 10000)
+
+        while self.eventList.count() > self.maxEvents:
+            self.eventList.takeItem(self.eventList.count() - 1)
+
+        if events:
+            logger.debug("Alerts | {} --- {} triggered".format(symbol, len(events)))
+
+    @QtCore.pyqtSlot()
+    def btnAddClicked(self):
+        try:
+            kind, value, seconds, cooldown = parseRule(self.leRule.text())
+        except ValueError as e:
+            self.label.setText(str(e))
+            return
+
+        symbol = self.symbol()
+        self.rules[symbol].append((self.nextId, kind, value, seconds, cooldown))
+        self.nextId += 1
+        self.leRule.clear()
+        self.publish(symbol)
+
+    @QtCore.pyqtSlot()
+    def btnRemoveClicked(self):
+        ids = {item.data(QtCore.Qt.UserRole) for item in self.ruleList.selectedItems()}
+        if not ids:
+            return
+
+        symbol = self.symbol()
+        self.rules[symbol] = [rule for rule in self.rules[symbol] if rule[0] not in ids]
+        self.publish(symbol)
@@ -0,0 +1,266 @@
+from time import perf_counter, time
+
+import numpy as np
+import pandas as pd
+
+from utils import logger
+
+ABOVE, BELOW, MOVE, VOLUME = 0, 1, 2, 3
+KIND_NAMES = {ABOVE: "above", BELOW: "below", MOVE: "move", VOLUME: "volume"}
+SECOND = 10 ** 9
+
+# One row per rule; value is the level, the fractional move (signed, negative
+# for drops) or the size traded within seconds
+RULE = np.dtype(
+    [
+        ("id", "<i8"),
+        ("kind", "i1"),
+        ("value", "<f8"),
+        ("seconds", "<f8"),
+        ("cooldown", "<f8"),
+    ]
+)
+
+
+def parseAmount(text):
+    scale = {"k": 1e3, "M": 1e6, "B": 1e9}.get(text[-1], 1)
+    if scale != 1:
+        text = text[:-1]
+    return float(text) * scale
+
+
+def parseRule(text, cooldown=60.0):
+    # "above 65000", "below 60k", "move 1% 60s", "move -2% 5m", "volume 5M 60s"
+    words = text.split()
+    if not words:
+        raise ValueError("Expected an alert, e.g. 'above 65000'")
+    kind = {name: kind for kind, name in KIND_NAMES.items()}.get(words[0].lower())
+    if kind is None:
+        raise ValueError("Unknown alert '{}'".format(words[0]))
+
+    if kind in (ABOVE, BELOW):
+        if len(words) != 2:
+            raise ValueError("Expected '{} <price>'".format(words[0]))
+        return kind, parseAmount(words[1]), 0.0, cooldown
+
+    if len(words) != 3:
+        raise ValueError("Expected '{} <amount> <seconds>'".format(words[0]))
+    if kind == MOVE:
+        value = float(words[1].rstrip("%")) / 100
+    else:
+        value = parseAmount(words[1])
+    unit = {"s": 1, "m": 60, "h": 3600}.get(words[2][-1])
+    seconds = float(words[2][:-1]) * unit if unit else float(words[2])
+    if not value or seconds <= 0:
+        raise ValueError("'{}' never triggers".format(text))
+    return kind, value, seconds, cooldown
+
+
+def ruleText(rule):
+    kind = int(rule["kind"])
+    if kind in (ABOVE, BELOW):
+        return "{} {:,.2f}".format(KIND_NAMES[kind], rule["value"])
+    if kind == MOVE:
+        return "move {:+.2%} in {:g}s".format(rule["value"], rule["seconds"])
+    return "volume {:,.0f} in {:g}s".format(rule["value"], rule["seconds"])
+
+
+def makeRules(rules):
+    # rules are (id, kind, value, seconds, cooldown) tuples
+    return np.array([tuple(rule) for rule in rules], dtype=RULE)
+
+
+def firstReaching(values, starts, levels):
+    # Index of the first values[i] >= levels[j] with i >= starts[j], or
+    # len(values). Blocks of 2**k trades are skipped while their maximum
+    # stays below the level, so each rule costs log(n) lookups.
+    n = len(values)
+    table = [values]
+    while 2 ** len(table) <= n:
+        h = 2 ** (len(table) - 1)
+        table.append(np.maximum(table[-1][:-h], table[-1][h:]))
+
+    pos = np.asarray(starts, dtype=np.int64).copy()
+    for k in reversed(range(len(table))):
+        block = table[k]
+        inside = pos < len(block)
+        skip = inside & (block[np.minimum(pos, len(block) - 1)] < levels)
+        pos[skip] += 2 ** k
+
+    found = pos < n
+    found[found] = values[pos[found]] >= levels[found]
+    return np.where(found, pos, n)
+
+
+class AlertEngine(object):
+    def __init__(self, window=200, reportEvery=10):
+        super().__init__()
+        self.window = window
+        self.reportEvery = reportEvery
+        self.setRules(makeRules([]))
+        self.reset(None)
+
+    def reset(self, symbol):
+        self.symbol = symbol
+        self.last = np.nan
+        self.tail = (np.empty(0, "i8"), np.empty(0), np.empty(0))
+        self.fired[:] = -np.inf
+
+        self.latencies = []
+        self.trades = 0
+        self.lastReport = time()
+
+    def setRules(self, rules):
+        # Cooldowns carry over for rules that stay, so an edit does not re-fire
+        # the rest
+        fired = np.full(len(rules), -np.inf)
+        if hasattr(self, "rules") and len(self.rules):
+            _, i, j = np.intersect1d(
+                rules["id"], self.rules["id"], assume_unique=True, return_indices=True
+            )
+            fired[i] = self.fired[j]
+        self.rules = rules
+        self.fired = fired
+
+        kind = rules["kind"]
+        self.above = np.flatnonzero(kind == ABOVE)
+        self.below = np.flatnonzero(kind == BELOW)
+        # Windowed rules are grouped by length, each window is computed once
+        self.moves = self.groups(MOVE)
+        self.volumes = self.groups(VOLUME)
+        windowed = rules["seconds"][(kind == MOVE) | (kind == VOLUME)]
+        self.span = int(windowed.max() * SECOND) if len(windowed) else 0
+
+    def groups(self, kind):
+        rules = np.flatnonzero(self.rules["kind"] == kind)
+        seconds = self.rules["seconds"][rules]
+        return [(int(s * SECOND), rules[seconds == s]) for s in np.unique(seconds)]
+
+    def evaluate(self, df, quiet=False):
+        if not len(df) or not len(self.rules):
+            if len(df):
+                self.last = float(df.price.iloc[-1])
+            return []
+
+        t = df.index.values.astype("datetime64[ns]").astype("i8")
+        price = df.price.to_numpy(dtype="f8")
+        size = df["size"].to_numpy(dtype="f8")
+
+        # Per rule: did it trigger in this batch, and at which trade
+        n = len(self.rules)
+        hit = np.zeros(n, dtype=bool)
+        at = np.zeros(n, dtype=np.int64)
+        observed = self.rules["value"].copy()
+
+        # Each trade is compared with the one before it, so a level crossed
+        # and left again within the batch still fires. Trade i crosses up
+        # through a level first when it is the first trade at or above it
+        # after a trade (or the previous batch's last) below it.
+        prev = price[0] if np.isnan(self.last) else self.last
+        before = np.concatenate([[prev], price[:-1]])
+        low = np.minimum.accumulate(before)
+        high = np.maximum.accumulate(before)
+        level = self.rules["value"][self.above]
+        i = firstReaching(price, (-low).searchsorted(-level, side="right"), level)
+        hit[self.above] = i < len(price)
+        at[self.above] = i
+        level = self.rules["value"][self.below]
+        i = firstReaching(-price, high.searchsorted(level, side="right"), -level)
+        hit[self.below] = i < len(price)
+        at[self.below] = i
+
+        # Windows reach back into the trades kept from earlier batches
+        tailT, tailPrice, tailSize = self.tail
+        allT = np.concatenate([tailT, t])
+        allPrice = np.concatenate([tailPrice, price])
+        allSize = np.concatenate([tailSize, size])
+        k = len(tailT)
+
+        if self.moves:
+            series = pd.Series(allPrice, index=pd.DatetimeIndex(allT.view("M8[ns]")))
+        for span, rules in self.moves:
+            rolling = series.rolling("{}ns".format(span))
+            up = price / rolling.min().to_numpy()[k:] - 1
+            down = price / rolling.max().to_numpy()[k:] - 1
+            value = self.rules["value"][rules]
+            rise = np.maximum.accumulate(up)
+            fall = -np.minimum.accumulate(down)
+            i = np.where(
+                value > 0, rise.searchsorted(value), fall.searchsorted(-value)
+            )
+            hit[rules] = i < len(price)
+            at[rules] = np.minimum(i, len(price) - 1)
+            observed[rules] = np.where(value > 0, up[at[rules]], down[at[rules]])
+
+        if self.volumes:
+            total = np.concatenate([[0.0], np.cumsum(allSize)])
+        for span, rules in self.volumes:
+            start = allT.searchsorted(t - span, side="right")
+            volume = total[k + 1 :] - total[start]
+            peak = np.maximum.accumulate(volume)
+            i = peak.searchsorted(self.rules["value"][rules])
+            hit[rules] = i < len(price)
+            at[rules] = np.minimum(i, len(price) - 1)
+            observed[rules] = volume[at[rules]]
+
+        # Cooldowns are per rule, a condition that holds does not fire each batch
+        at = np.minimum(at, len(price) - 1)
+        when = t[at] / SECOND
+        fire = hit & (when - self.fired >= self.rules["cooldown"])
+        self.fired[fire] = when[fire]
+
+        self.last = float(price[-1])
+        keep = allT.searchsorted(allT[-1] - self.span, side="right")
+        self.tail = (allT[keep:], allPrice[keep:], allSize[keep:])
+
+        if quiet:
+            return []
+        return [
+            (
+                int(self.rules["id"][i]),
+                int(self.rules["kind"][i]),
+                float(when[i]),
+                float(price[at[i]]),
+                float(observed[i]),
+            )
+            for i in np.flatnonzero(fire)
+        ]
+
+    def check(self, df, alert_q, quiet=False):
+        # Evaluated before the batch is queued for the GUI, so a trigger never
+        # waits behind the frame it came from
+        t = perf_counter()
+        events = self.evaluate(df, quiet)
+        self.latencies.append(perf_counter() - t)
+        self.latencies = self.latencies[-self.window :]
+        self.trades += len(df)
+
+        now = time()
+        report = len(self.rules) and now - self.lastReport >= self.reportEvery
+        if alert_q is not None and (events or report):
+            alert_q.put([self.symbol, events, self.metrics(now)])
+        if report:
+            self.report(now)
+
+    def metrics(self, now):
+        latency = np.array(self.latencies or [0.0]) * 1000
+        return {
+            "rules": len(self.rules),
+            "p50": float(np.percentile(latency, 50)),
+            "p99": float(np.percentile(latency, 99)),
+            "sentAt": now,
+        }
+
+    def report(self, now):
+        metrics = self.metrics(now)
+        logger.debug(
+            "Alerts | {} --- {} rules, {:,} trades, eval p50 {:.2f} ms p99 {:.2f} ms".format(
+                self.symbol,
+                metrics["rules"],
+                self.trades,
+                metrics["p50"],
+                metrics["p99"],
+            )
+        )
+        self.trades = 0
+        self.lastReport = now
@@ -0,0 +1,141 @@
+import asyncio
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from database import DataService
+from utils import logger
+
+
+class AsyncDataClient(object):
+    def __init__(self, service, workers=8, period=0.5, owned=False):
+        super().__init__()
+        self.service = service
+        self.period = period
+        # A service open() started is stopped with the client
+        self.owned = owned
+        # Blocking service calls run here so the event loop never waits on a queue
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="data")
+
+    @classmethod
+    async def open(cls, workers=8, period=0.5, **kwargs):
+        loop = asyncio.get_running_loop()
+        service = await loop.run_in_executor(None, lambda: DataService(**kwargs))
+        return cls(service, workers, period, owned=True)
+
+    async def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.owned:
+            # Joins the reader and feed processes, off the event loop
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.service.close)
+            self.owned = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        # Cancelling the caller returns at once, a read already in flight still
+        # lands in the shared cache
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    @property
+    def symbols(self):
+        return self.service.symbols
+
+    @property
+    def days(self):
+        return list(self.service.days)
+
+    async def keys(self, symbol, startDt, endDt):
+        return await self.run(
+            self.service.loadRange, None, symbol, startDt.date(), endDt.date(), 0
+        )
+
+    async def trades(self, symbol, startDt, endDt):
+        keys = await self.keys(symbol, startDt, endDt)
+        return await self.run(self.tradesBetween, symbol, keys, startDt, endDt)
+
+    def tradesBetween(self, symbol, keys, startDt, endDt):
+        # Runs on the executor, the cache and the live frame wait on the
+        # service lock
+        df = self.service.trades(keys)
+        df = df[(df.index >= startDt) & (df.index <= endDt)] if len(df) else df
+
+        feed = self.service.feeds.get(symbol)
+        if feed is not None:
+            live = self.service.live(symbol)
+            live = live[(live.index >= startDt) & (live.index <= endDt)]
+            df = pd.concat([df, live])
+
+        return df
+
+    async def ohlc(self, symbol, interval, startDt, endDt):
+        keys = await self.keys(symbol, startDt, endDt)
+        return await self.run(self.barsBetween, symbol, interval, keys, startDt, endDt)
+
+    def barsBetween(self, symbol, interval, keys, startDt, endDt):
+        # Runs on the executor like tradesBetween
+        ohlc = self.service.bars(keys, interval)
+        if len(ohlc):
+            ohlc = ohlc[(ohlc.index >= startDt) & (ohlc.index <= endDt)]
+
+        feed = self.service.feeds.get(symbol)
+        if feed is not None:
+            self.service.live(symbol)
+            live = self.service.liveBars(symbol, interval)
+            live = live[(live.index >= startDt) & (live.index <= endDt)]
+            ohlc = pd.concat([ohlc, live])
+
+        return ohlc
+
+    async def ohlcMany(self, queries):
+        # Independent queries overlap, cached days never wait behind a read
+        return await asyncio.gather(*(self.ohlc(*query) for query in queries))
+
+    async def bars(self, symbol, interval):
+        # Bars are yielded as trades arrive. Each wait gives up after period, so
+        # a cancelled stream frees its executor thread soon after.
+        await self.run(self.service.subscribe, symbol)
+        try:
+            cursor = None
+            while True:
+                df, end = await self.run(
+                    self.service.waitLive, symbol, cursor or 0, self.period
+                )
+                if symbol not in self.service.feeds:
+                    # The service was closed underneath the stream
+                    return
+                if cursor is None or len(df):
+                    cursor = end
+                    yield await self.run(self.service.liveBars, symbol, interval)
+        finally:
+            # The loop's own executor, the client's may be shut down already
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.service.unsubscribe, symbol)
+            logger.debug("Async | Unsubscribed {} {}".format(symbol, interval))
+
+
+if __name__ == "__main__":
+
+    async def main():
+        async with await AsyncDataClient.open() as client:
+            endDt = datetime.datetime.now(datetime.timezone.utc)
+            startDt = endDt - datetime.timedelta(days=3)
+            for symbol, ohlc in zip(
+                client.symbols,
+                await client.ohlcMany(
+                    [(s, "1h", startDt, endDt) for s in client.symbols]
+                ),
+            ):
+                logger.debug("Async | {} {} bars".format(symbol, len(ohlc)))
+
+            async for ohlc in client.bars(client.symbols[0], "1min"):
+                logger.debug("Async | {}".format(ohlc.iloc[-1].to_dict()))
+
+    asyncio.run(main())
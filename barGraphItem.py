@@ -5,20 +5,70 @@ import numpy as np
 import pyqtgraph as pg
 from pyqtgraph import QtCore, QtGui
 
+from rangeQuery import SparseTable, appendStart
 from utils import logger
 
 
+try:
+    from pyqtgraph.Qt.internals import PrimitiveArray
+except ImportError:
+    PrimitiveArray = None
+
+
+class RectArray(object):
+    def __init__(self):
+        super().__init__()
+        # QRectF storage shared with numpy, so the rectangles are written in bulk
+        # and handed to QPainter.drawRects without a Python object per bar
+        self.array = PrimitiveArray(QtCore.QRectF, 4) if PrimitiveArray else None
+        self.rects = []
+
+    def set(self, x, y, w, h):
+        if self.array is None:
+            x, y, w, h = np.broadcast_arrays(x, y, w, h)
+            self.rects = list(map(QtCore.QRectF, x, y, w, h))
+            return
+
+        self.array.resize(len(x))
+        memory = self.array.ndarray()
+        memory[:, 0] = x
+        memory[:, 1] = y
+        memory[:, 2] = w
+        memory[:, 3] = h
+
+    def draw(self, p):
+        if self.array is None:
+            p.drawRects(self.rects)
+        else:
+            p.drawRects(*self.array.drawargs())
+
+
 class barGraphItem(pg.GraphicsObject):
     def __init__(self):
         super().__init__()
         self.data = None
         self.path = None
+        self.redBars = RectArray()
+        self.greenBars = RectArray()
+        self.barWidth = 0.0
 
         self.autoRangeEnabled = True
         self._boundingRect = None
         self._boundsCache = [None, None]
+        self.lows = SparseTable(np.minimum, np.inf)
+        self.highs = SparseTable(np.maximum, -np.inf)
+
+        self.pen = pg.mkPen("k")
+        self.noPen = pg.mkPen(None)
+        self.redBrush = pg.mkBrush(255, 0, 0, 255)
+        self.greenBrush = pg.mkBrush(0, 255, 0, 255)
 
     def setData(self, data):
+        if data is not None:
+            start = appendStart(self.data, data)
+            total = data[:, 1] + data[:, 2]
+            self.lows.update(total, start)
+            self.highs.update(total, start)
         self.data = data
 
         self.invalidateBounds()
@@ -31,29 +81,36 @@ class barGraphItem(pg.GraphicsObject):
     def paint(self, p, *args):
         redBars, greenBars = self.getPath()
 
-        p.setPen(pg.mkPen("k"))
-        p.setBrush(pg.mkBrush(0, 255, 0, 255))
-        p.drawPath(greenBars)
+        # Outlines cost more than the fills and hide the bars once they are
+        # only a few pixels wide
+        if self.barWidth * abs(p.transform().m11()) > 3:
+            p.setPen(self.pen)
+        else:
+            p.setPen(self.noPen)
+        p.setBrush(self.greenBrush)
+        greenBars.draw(p)
 
-        p.setBrush(pg.mkBrush(255, 0, 0, 255))
-        p.drawPath(redBars)
+        p.setBrush(self.redBrush)
+        redBars.draw(p)
 
     def getPath(self):
         if self.path is None:
             if self.data is None or len(self.data) < 2:
-                self.path = [QtGui.QPainterPath(), QtGui.QPainterPath()]
+                empty = np.empty(0)
+                self.redBars.set(empty, empty, empty, empty)
+                self.greenBars.set(empty, empty, empty, empty)
             else:
-                redBars = QtGui.QPainterPath()
-                greenBars = QtGui.QPainterPath()
+                t, buy, sell = np.nan_to_num(self.data).T
+                w = np.median(np.diff(t)) / 3.0
+                self.barWidth = w * 2
 
-                step = self.data[1][0] - self.data[0][0]
-                w = step / 3.0
-                for t, buy, sell in self.data:
-                    if buy + sell != 0:
-                        redBars.addRect(QtCore.QRectF(t - w, 0, w * 2, sell))
-                        greenBars.addRect(QtCore.QRectF(t - w, sell, w * 2, buy))
+                # Sell stacks from zero, buy on top of it; empty sides are skipped
+                red = sell > 0
+                green = buy > 0
+                self.redBars.set(t[red] - w, 0.0, w * 2, sell[red])
+                self.greenBars.set(t[green] - w, sell[green], w * 2, buy[green])
 
-                self.path = [redBars, greenBars]
+            self.path = [self.redBars, self.greenBars]
 
         return self.path
 
@@ -80,36 +137,31 @@ class barGraphItem(pg.GraphicsObject):
         if cache is not None and cache[0] == (frac, orthoRange):
             return cache[1]
 
-        if self.data is None:
+        data = self.data
+        if data is None or len(data) == 0:
             return (None, None)
 
-        zeros = np.zeros((len(self.data), 1))
-        total = self.data[:, 1:2] + self.data[:, 2:3]
-        x = self.data[:, 0]
-        y = np.append(zeros, total, axis=1)
-
+        x = data[:, 0]
         if ax == 0:
-            d = x
-            d2 = y
-        elif ax == 1:
-            d = y
-            d2 = x
-
-        if orthoRange is not None:
-            mask = (d2 >= orthoRange[0]) * (d2 <= orthoRange[1])
-            d = d[mask]
-
-        if len(d) == 0:
-            return (None, None)
-
-        b = (np.nanmin(d), np.nanmax(d))
-
-        if any(np.isinf(b)):
-            mask = np.isfinite(d)
-            d = d[mask]
-            if len(d) == 0:
+            if orthoRange is None:
+                b = (x[0], x[-1])
+            else:
+                total = data[:, 1] + data[:, 2]
+                mask = (total >= orthoRange[0]) & (total <= orthoRange[1])
+                if orthoRange[0] <= 0 <= orthoRange[1]:
+                    mask[:] = True
+                if not mask.any():
+                    return (None, None)
+                b = (x[mask].min(), x[mask].max())
+        else:
+            # Bars stand on zero, so only the visible totals' extremes matter
+            i, j = 0, len(x)
+            if orthoRange is not None:
+                i = x.searchsorted(orthoRange[0])
+                j = x.searchsorted(orthoRange[1], side="right")
+            if j <= i:
                 return (None, None)
-            b = (d.min(), d.max())
+            b = (min(0, self.lows.query(i, j)), max(0, self.highs.query(i, j)))
 
         self._boundsCache[ax] = [(frac, orthoRange), b]
         return b
@@ -0,0 +1,365 @@
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+from time import perf_counter, sleep
+
+import numpy as np
+import pandas as pd
+import pyqtgraph as pg
+from pyqtgraph import QtGui
+
+import monthFile
+import store
+from aggregator import DayProfile, mergeProfiles, profileBucket
+from alerts import ABOVE, BELOW, MOVE, AlertEngine, makeRules
+from barGraphItem import barGraphItem
+from database import DataService
+from endpoints import Endpoints
+from exchangeStandIn import ExchangeStandIn, Faults, generateFixtures
+from utils import logger
+
+
+def offlineService(endpoints):
+    # Skip __init__, which spawns the reader and live processes
+    service = DataService.__new__(DataService)
+    service.symbols = ["XBTUSD", "ETHUSD"]
+    service.endpoints = endpoints
+    return service
+
+
+def benchBackfill(endpoints, dates):
+    service = offlineService(endpoints)
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        os.mkdir("data")
+        try:
+            start = perf_counter()
+            with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+                for date in dates:
+                    service.downloadData(date.strftime("%Y%m%d"), temp_dir)
+            elapsed = perf_counter() - start
+
+            size = sum(
+                os.path.getsize(os.path.join("data", f)) for f in os.listdir("data")
+            )
+        finally:
+            os.chdir(cwd)
+
+    logger.debug(
+        "Backfill | {} days in {:.2f}s | {:.2f} days/s | {:.1f} MB/s written".format(
+            len(dates), elapsed, len(dates) / elapsed, size / 1e6 / elapsed
+        )
+    )
+    return elapsed
+
+
+def benchPolling(endpoints, symbol, polls, count=1000):
+    start_dt = datetime.datetime.now(datetime.timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+    trades = 0
+    start = perf_counter()
+    for _ in range(polls):
+        result = endpoints.getTrades(symbol, start_dt, count=count)
+        if not result:
+            break
+        trades += len(result)
+        start_dt = pd.Timestamp(result[-1]["timestamp"]).to_pydatetime()
+    elapsed = perf_counter() - start
+
+    logger.debug(
+        "Polling | {} requests in {:.2f}s | {:.1f} req/s | {:.0f} trades/s".format(
+            polls, elapsed, polls / elapsed, trades / elapsed
+        )
+    )
+    return elapsed
+
+
+def cpuSeconds(pid):
+    # utime and stime of a running process, without waiting on it
+    with open("/proc/{}/stat".format(pid)) as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def benchIdle(endpoints, symbol, seconds, settle=5.0):
+    if not os.path.exists("/proc"):
+        logger.debug("Idle | needs /proc, skipped")
+        return
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            service = DataService(endpoints=endpoints)
+            feed = service.subscribe(symbol)
+            # Let the feed catch up before the idle window
+            sleep(settle)
+
+            pids = {"reader": service.reader.pid, "live": feed.process.pid}
+            before = {name: cpuSeconds(pid) for name, pid in pids.items()}
+            sleep(seconds)
+            after = {name: cpuSeconds(pid) for name, pid in pids.items()}
+
+            start = perf_counter()
+            service.close()
+            closed = perf_counter() - start
+        finally:
+            os.chdir(cwd)
+
+    logger.debug(
+        "Idle | {:.0f}s | {} | close {:.2f}s".format(
+            seconds,
+            " ".join(
+                "{} {:.1f}% CPU".format(name, 100 * (after[name] - before[name]) / seconds)
+                for name in pids
+            ),
+            closed,
+        )
+    )
+
+
+def benchCompaction(endpoints, dates, hours=1):
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            service = offlineService(endpoints)
+            os.mkdir("data")
+            with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+                for date in dates:
+                    service.downloadData(date.strftime("%Y%m%d"), temp_dir)
+
+            # A range in the middle of the last day, as a zoomed in chart reads
+            start = pd.Timestamp(dates[-1], tz="UTC") + pd.Timedelta(hours=12)
+            end = start + pd.Timedelta(hours=hours)
+
+            results = {}
+            for layout in ("csv", monthFile.CODEC_NAMES[monthFile.bestCodec()]):
+                if layout != "csv":
+                    for month in sorted({d.replace(day=1) for d in dates}):
+                        store.compactMonth(month)
+
+                size = sum(
+                    os.path.getsize(os.path.join("data", f))
+                    for f in os.listdir("data")
+                )
+
+                t = perf_counter()
+                trades = sum(len(store.readDay(date)) for date in dates)
+                decode = perf_counter() - t
+
+                t = perf_counter()
+                store.readRange(start, end, "XBTUSD")
+                latency = perf_counter() - t
+
+                results[layout] = (size, trades / decode, latency)
+        finally:
+            os.chdir(cwd)
+
+    for layout, (size, rate, latency) in results.items():
+        logger.debug(
+            "Store | {} | {:.1f} MB on disk | {:,.0f} trades/s | {}h range {:.1f} ms".format(
+                layout, size / 1e6, rate, hours, latency * 1e3
+            )
+        )
+
+
+def benchScrollBack(endpoints, dates, workers):
+    # Cold reads of every stored day, as when the chart jumps back over them
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        os.chdir(work_dir)
+        try:
+            service = offlineService(endpoints)
+            os.mkdir("data")
+            with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+                for date in dates:
+                    service.downloadData(date.strftime("%Y%m%d"), temp_dir)
+
+            for n in workers:
+                service = DataService(endpoints=endpoints, capture=False, workers=n)
+                start = perf_counter()
+                keys = service.loadRange(None, "XBTUSD", dates[0], dates[-1], -1, "1min")
+                elapsed = perf_counter() - start
+                service.close()
+
+                logger.debug(
+                    "Scroll back | {} workers | {} days in {:.2f}s | {:.2f} days/s".format(
+                        n, len(keys), elapsed, len(keys) / elapsed
+                    )
+                )
+        finally:
+            os.chdir(cwd)
+
+
+def benchPaint(sizes, repeat=5):
+    pg.mkQApp()
+    image = QtGui.QImage(1600, 400, QtGui.QImage.Format_ARGB32)
+    rng = np.random.default_rng(0)
+
+    for n in sizes:
+        t = np.arange(n) * 60.0
+        buy = rng.exponential(100, n) * (rng.random(n) > 0.1)
+        sell = rng.exponential(100, n) * (rng.random(n) > 0.1)
+        item = barGraphItem()
+        item.setData(np.column_stack([t, buy, sell]))
+
+        painter = QtGui.QPainter(image)
+        painter.scale(1600 / t[-1], 400 / (buy + sell).max())
+        start = perf_counter()
+        for _ in range(repeat):
+            # Each frame after new data rebuilds the rectangles
+            item.path = None
+            item.paint(painter)
+        elapsed = (perf_counter() - start) / repeat
+        painter.end()
+
+        logger.debug("Paint | volume {} bars | {:.2f} ms".format(n, elapsed * 1e3))
+
+
+def benchProfile(days=365, tradesPerDay=100000, repeat=20):
+    rng = np.random.default_rng(0)
+    bucket = profileBucket(10000)
+
+    profiles = []
+    start = pd.Timestamp("2020-01-01", tz="UTC")
+    price = 10000.0
+    for n in range(days):
+        index = start + pd.Timedelta(days=n) + pd.to_timedelta(
+            np.sort(rng.integers(0, 86400 * 10 ** 9, tradesPerDay)), "ns"
+        )
+        prices = price + rng.standard_normal(tradesPerDay).cumsum() * 0.5
+        price = prices[-1]
+        df = pd.DataFrame(
+            {
+                "side": rng.choice(["Buy", "Sell"], tradesPerDay),
+                "size": rng.integers(1, 1000, tradesPerDay).astype("f8"),
+                "price": prices,
+            },
+            index=index,
+        )
+        profile = DayProfile(bucket)
+        profile.add(df)
+        profiles.append(profile)
+
+    # A year-wide view whose edges fall mid-day
+    startTs = start.timestamp() + 43200
+    endTs = startTs + (days - 1) * 86400
+    elapsed = perf_counter()
+    for _ in range(repeat):
+        mergeProfiles([p.window(startTs, endTs) for p in profiles], bucket, 24)
+    elapsed = (perf_counter() - elapsed) / repeat
+
+    logger.debug(
+        "Paint | visible range profile {} days | {:.2f} ms".format(days, elapsed * 1e3)
+    )
+
+
+def benchAlerts(rules=(10, 100, 500), batch=200, trades=50000):
+    rng = np.random.default_rng(0)
+    index = pd.Timestamp("2020-01-01", tz="UTC") + pd.to_timedelta(
+        np.cumsum(rng.exponential(0.05, trades)), "s"
+    )
+    df = pd.DataFrame(
+        {
+            "side": rng.choice(["Buy", "Sell"], trades),
+            "size": rng.integers(1, 5000, trades).astype("f8"),
+            "price": 10000 + rng.standard_normal(trades).cumsum() * 0.5,
+        },
+        index=index,
+    )
+
+    for n in rules:
+        # An even mix of levels around the price, moves and volume spikes over
+        # a handful of window lengths
+        table = []
+        for i in range(n):
+            kind = i % 4
+            if kind == ABOVE:
+                table.append((i, kind, 10000 + i, 0, 60))
+            elif kind == BELOW:
+                table.append((i, kind, 10000 - i, 0, 60))
+            elif kind == MOVE:
+                move = 0.001 * (1 + i % 5) * (1 if i % 8 == 2 else -1)
+                table.append((i, kind, move, 30 * (1 + i % 4), 60))
+            else:
+                table.append((i, kind, 1e5 * (1 + i % 7), 10 * (1 + i % 3), 60))
+
+        engine = AlertEngine()
+        engine.setRules(makeRules(table))
+        engine.reset("XBTUSD")
+        latencies = []
+        fired = 0
+        for i in range(0, trades, batch):
+            start = perf_counter()
+            fired += len(engine.evaluate(df.iloc[i : i + batch]))
+            latencies.append(perf_counter() - start)
+
+        latencies = np.array(latencies) * 1e3
+        logger.debug(
+            "Alerts | {} rules, {} trade batches | p50 {:.2f} ms p99 {:.2f} ms | {} fired".format(
+                n,
+                batch,
+                np.percentile(latencies, 50),
+                np.percentile(latencies, 99),
+                fired,
+            )
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline ingest benchmarks")
+    parser.add_argument("--days", type=int, default=5)
+    parser.add_argument("--trades-per-day", type=int, default=200000)
+    parser.add_argument("--polls", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=None)
+    parser.add_argument("--idle", type=float, default=10.0)
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1]
+    )
+    parser.add_argument(
+        "--paint", action="store_true", help="only run the paint benchmarks"
+    )
+    parser.add_argument(
+        "--alerts", action="store_true", help="only run the alert engine benchmark"
+    )
+    args = parser.parse_args()
+
+    if args.alerts:
+        benchAlerts()
+        raise SystemExit
+
+    if args.paint:
+        benchPaint([1000, 10000, 100000])
+        benchProfile()
+        raise SystemExit
+
+    fixtures = tempfile.mkdtemp()
+    try:
+        start = datetime.date.today() - datetime.timedelta(args.days)
+        generateFixtures(fixtures, start, args.days, args.trades_per_day)
+
+        standIn = ExchangeStandIn(
+            fixtures, Faults(args.latency, 0.0, args.failure_rate, args.rate_limit)
+        )
+        url = standIn.start()
+        endpoints = Endpoints(url, url, backoff=0.1)
+
+        dates = [start + datetime.timedelta(n) for n in range(args.days)]
+        benchBackfill(endpoints, dates)
+        benchPolling(endpoints, "XBTUSD", args.polls)
+        benchScrollBack(endpoints, dates, args.workers)
+        benchCompaction(endpoints, dates)
+        if args.idle:
+            benchIdle(endpoints, "XBTUSD", args.idle)
+        standIn.stop()
+    finally:
+        shutil.rmtree(fixtures)
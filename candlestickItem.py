@@ -5,6 +5,7 @@ import numpy as np
 import pyqtgraph as pg
 from pyqtgraph import QtCore, QtGui
 
+from rangeQuery import SparseTable, appendStart
 from utils import Worker, logger
 
 
@@ -21,12 +22,21 @@ class CandlestickItem(pg.GraphicsObject):
         self.data = None
         self.ds = 1
         self.path = None
+        self.formingPath = None
+        self.barWidth = None
         self.limit = 500
         self.plotting = False
 
         self.autoRangeEnabled = True
         self._boundingRect = None
         self._boundsCache = [None, None]
+        self.lows = SparseTable(np.minimum, np.inf)
+        self.highs = SparseTable(np.maximum, -np.inf)
+
+        self.redPen = pg.mkPen("r")
+        self.redBrush = pg.mkBrush("r")
+        self.greenPen = pg.mkPen("g")
+        self.greenBrush = pg.mkBrush("g")
 
         # Data init
         self.anchor, data = self.db.getOHLC()
@@ -55,14 +65,29 @@ class CandlestickItem(pg.GraphicsObject):
 
         self.setData(data)
 
-    def setData(self, data):
+    def setData(self, data, ds=None):
+        old = self.data
+        start = appendStart(old, data) if ds == self.ds else 0
+        if data is not None:
+            self.lows.update(data[:, 3], start)
+            self.highs.update(data[:, 2], start)
         self.data = data
 
         self.invalidateBounds()
         self.prepareGeometryChange()
         self.informViewBoundsChanged()
 
-        self.path = None
+        # A live refresh usually only moves the forming bar, closed bars keep
+        # their geometry and only newly closed ones are added to it
+        if start and self.path is not None:
+            # Copies detach from the paths the GUI thread may be drawing
+            path = [QtGui.QPainterPath(self.path[0]), QtGui.QPainterPath(self.path[1])]
+            self.addBars(path, data[start:-1, :5])
+            self.path = path
+        else:
+            self.path = None
+        self.formingPath = None
+
         self.update()
         self.onUpdate.emit()
 
@@ -80,9 +105,8 @@ class CandlestickItem(pg.GraphicsObject):
         start, stop = xRange
         self.anchor, data = self.db.getOHLC(start, stop, refresh)
 
-        try:
-            step = data[1][0] - data[0][0]
-        except IndexError:
+        step = self.getStep(data)
+        if step is None:
             ds = 1
         else:
             ds = int((stop - start) / (step * self.limit)) + 1
@@ -99,7 +123,7 @@ class CandlestickItem(pg.GraphicsObject):
             offset = int(anchor % ds)
             if offset:
                 chunk = chunk[ds - offset : -offset]
-            visible = np.zeros((len(chunk) // ds, 5))
+            visible = np.zeros((len(chunk) // ds, data.shape[1]))
 
             # Reshape timestamp
             visible[:, 0] = chunk[: (len(chunk) // ds) * ds : ds, 0]
@@ -130,47 +154,88 @@ class CandlestickItem(pg.GraphicsObject):
             else:
                 visible[:, 4] = chunk[: (len(chunk) // ds) * ds : ds, 4]
 
+            # Reshape volume
+            volume = chunk[: (len(chunk) // ds) * ds, 5].reshape(len(chunk) // ds, ds)
+            visible[:, 5] = np.nansum(volume, axis=1)
+
+            # Buy, sell and trades add up, the ratios are weighted by volume
+            if data.shape[1] > 12:
+                rows = chunk[: (len(chunk) // ds) * ds].reshape(
+                    len(chunk) // ds, ds, -1
+                )
+                visible[:, 6:9] = np.nansum(rows[:, :, 6:9], axis=1)
+                total = visible[:, 5]
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    notional = np.nansum(rows[:, :, 9] * rows[:, :, 5], axis=1)
+                    visible[:, 9] = notional / total
+                    visible[:, 10] = total / visible[:, 8]
+                    visible[:, 12] = (visible[:, 6] - visible[:, 7]) / total
+                maxSize = np.nan_to_num(rows[:, :, 11], nan=-np.inf).max(axis=1)
+                visible[:, 11] = np.where(np.isinf(maxSize), np.nan, maxSize)
+
+        self.setData(visible, ds)  # update the plot
         self.ds = ds
-        self.setData(visible)  # update the plot
         self.resetTransform()
         self.plotting = False
 
+        if refresh:
+            self.db.liveRendered()
+
     def paint(self, p, *args):
-        redBars, greenBars = self.getPath()
+        (redBars, greenBars), (redForming, greenForming) = self.getPath()
 
-        p.setPen(pg.mkPen("g"))
-        p.setBrush(pg.mkBrush("g"))
+        p.setPen(self.greenPen)
+        p.setBrush(self.greenBrush)
         p.drawPath(greenBars)
+        p.drawPath(greenForming)
 
-        p.setPen(pg.mkPen("r"))
-        p.setBrush(pg.mkBrush("r"))
+        p.setPen(self.redPen)
+        p.setBrush(self.redBrush)
         p.drawPath(redBars)
+        p.drawPath(redForming)
 
     def getPath(self):
-        if self.path is None:
-            if self.data is None or len(self.data) < 2:
-                self.path = [QtGui.QPainterPath(), QtGui.QPainterPath()]
-            else:
-                redBars = QtGui.QPainterPath()
-                greenBars = QtGui.QPainterPath()
-
-                self.step = self.data[1][0] - self.data[0][0]
-                w = self.step / 3.0
-                for data in self.data:
-                    if not np.isnan(data).any():
-                        t, o, h, l, c = data
-                        if o > c:
-                            redBars.moveTo(QtCore.QPointF(t, l))
-                            redBars.lineTo(QtCore.QPointF(t, h))
-                            redBars.addRect(QtCore.QRectF(t - w, o, w * 2, c - o))
-                        else:
-                            greenBars.moveTo(QtCore.QPointF(t, l))
-                            greenBars.lineTo(QtCore.QPointF(t, h))
-                            greenBars.addRect(QtCore.QRectF(t - w, o, w * 2, c - o))
-
-                self.path = [redBars, greenBars]
-
-        return self.path
+        # setData runs on a worker and may clear the paths while this builds
+        # them, so the paint works on the ones it read
+        data = self.data
+        path = self.path
+        if path is None:
+            path = [QtGui.QPainterPath(), QtGui.QPainterPath()]
+            if data is not None and len(data) >= 2:
+                self.step = self.getStep(data) or 1.0
+                self.barWidth = self.step / 3.0
+                self.addBars(path, data[:-1, :5])
+            self.path = path
+
+        formingPath = self.formingPath
+        if formingPath is None:
+            formingPath = [QtGui.QPainterPath(), QtGui.QPainterPath()]
+            if data is not None and len(data) >= 2:
+                self.addBars(formingPath, data[-1:, :5])
+            self.formingPath = formingPath
+
+        return path, formingPath
+
+    def addBars(self, path, rows):
+        redBars, greenBars = path
+        w = self.barWidth
+        for data in rows:
+            if not np.isnan(data).any():
+                t, o, h, l, c = data
+                bars = redBars if o > c else greenBars
+                bars.moveTo(QtCore.QPointF(t, l))
+                bars.lineTo(QtCore.QPointF(t, h))
+                bars.addRect(QtCore.QRectF(t - w, o, w * 2, c - o))
+
+    def getStep(self, data):
+        if data is None or len(data) < 2:
+            return None
+        # Tick, volume, dollar and range bars are spaced unevenly, the typical
+        # gap keeps their bodies readable; time bars give the interval exactly
+        step = np.median(np.diff(data[:, 0]))
+        if step <= 0:
+            step = (data[-1][0] - data[0][0]) / (len(data) - 1)
+        return step if step > 0 else None
 
     def invalidateBounds(self):
         self._boundingRect = None
@@ -195,34 +260,30 @@ class CandlestickItem(pg.GraphicsObject):
         if cache is not None and cache[0] == (frac, orthoRange):
             return cache[1]
 
-        if self.data is None:
+        data = self.data
+        if data is None or len(data) == 0:
             return (None, None)
 
-        x = self.data[:, 0]
-        y = self.data[:, 1:]
-
+        x = data[:, 0]
         if ax == 0:
-            d = x
-            d2 = y
-        elif ax == 1:
-            d = y
-            d2 = x
-
-        if orthoRange is not None:
-            mask = (d2 >= orthoRange[0]) * (d2 <= orthoRange[1])
-            d = d[mask]
-
-        if len(d) == 0:
-            return (None, None)
-
-        b = (np.nanmin(d), np.nanmax(d))
-
-        if any(np.isinf(b)):
-            mask = np.isfinite(d)
-            d = d[mask]
-            if len(d) == 0:
+            if orthoRange is None:
+                b = (x[0], x[-1])
+            else:
+                y = data[:, 2:4]
+                mask = ((y >= orthoRange[0]) & (y <= orthoRange[1])).any(axis=1)
+                if not mask.any():
+                    return (None, None)
+                b = (x[mask].min(), x[mask].max())
+        else:
+            # x is sorted, so the visible bars are a slice and its low/high come
+            # from the sparse tables in constant time
+            i, j = 0, len(x)
+            if orthoRange is not None:
+                i = x.searchsorted(orthoRange[0])
+                j = x.searchsorted(orthoRange[1], side="right")
+            b = (self.lows.query(i, j), self.highs.query(i, j))
+            if np.isinf(b[0]) or np.isinf(b[1]):
                 return (None, None)
-            b = (d.min(), d.max())
 
         self._boundsCache[ax] = [(frac, orthoRange), b]
         return b
@@ -1,76 +1,145 @@
+import bisect
 import datetime
-import glob
 import gzip
 import logging
 import multiprocessing
 import os
 import shutil
 import tempfile
-from math import ceil, floor
+import threading
+import weakref
 from multiprocessing import Process, Queue
-from time import sleep, time
+from queue import Empty, Full
+from time import time
 
-import bitmex
 import numpy as np
 import pandas as pd
-import requests
-from bitmex_websocket import BitMEXWebsocket
-import ciso8601
-from dateutil.tz import tzlocal
-
+from pandas.tseries.frequencies import to_offset
+
+import sharedDay
+import store
+from aggregator import (
+    BarBuilder,
+    DayProfile,
+    PriceHistogram,
+    SizeIndex,
+    isTimeInterval,
+    makeBars,
+    mergeProfiles,
+    profileBucket,
+)
+from alerts import AlertEngine
+from dayCache import DayCache
+from endpoints import Endpoints
+from journal import TradeJournal, foldDay
+from timeline import Timeline
 from utils import logger
 
 
-class Database(object):
-    def __init__(self, index, interval):
+class LiveFeed(object):
+    def __init__(self, info, queue, process):
         super().__init__()
-        self.symbols = ["XBTUSD", "ETHUSD"]
+        self.info = info
+        self.queue = queue
+        self.process = process
+        self.refs = 0
 
         self.df = pd.DataFrame()
-        self.liveDf = pd.DataFrame()
-        self.ohlc = pd.DataFrame()
-        self.liveOhlc = pd.DataFrame()
-
-        self.index = index
-        self.interval = interval
+        # Rows trimmed off the front at the watermark, so positions counted
+        # from the feed's start stay valid after a trim
+        self.dropped = 0
+        self.bars = {}
+        # Batches the receiver took off the queue that live() has not appended
+        self.pending = []
+        self.ready = threading.Event()
+        self.receiver = None
+
+        self.profile = None
+        self.profileSeen = 0
+        self.sizes = None
+        self.sizesSeen = 0
+
+
+class DataService(object):
+    def __init__(
+        self,
+        symbols=None,
+        replay=None,
+        endpoints=None,
+        cacheBytes=512 * 2 ** 20,
+        capture=True,
+        workers=None,
+    ):
+        super().__init__()
+        self.symbols = symbols or ["XBTUSD", "ETHUSD"]
+        self.replay = replay
+        self.endpoints = endpoints or Endpoints()
+
+        # Historical days resident in the GUI process, shared by every chart and
+        # evicted least recently viewed
+        self.cache = DayCache(cacheBytes)
+        self.days = []
+        self.required = set()
+        self.prefetching = set()
+        self.pinned = {}
+        self.prefetch = 10
+        self.dumpCheck = 3600
+        self.lock = threading.RLock()
+        # One caller drains the reader queue at a time, the rest wait on this
+        self.arrived = threading.Condition(self.lock)
+        self.receiving = False
+        # Notified whenever a feed's receiver takes a batch off its queue
+        self.traded = threading.Condition(self.lock)
+
+        self.feeds = {}
+        self.buckets = {}
+
+        # Alert rules run in the feed processes, triggers come back on one
+        # queue a thread hands to the listeners
+        self.alertRules = {}
+        self.alertMetrics = {}
+        self.alertListeners = []
+        self.alertQ = Queue()
+        self.alertThread = threading.Thread(target=self.receiveAlerts, daemon=True)
+        self.alertThread.start()
 
         self.ohlcQ = Queue(30)
-        self.liveOhlcQ = Queue(3)
-
-        self.ohlcInfo = Queue(1)
-        self.liveInfo = Queue(1)
+        self.ohlcInfo = Queue()
+
+        # Days are decoded by a pool of processes the reader hands jobs to
+        self.workers = workers or os.cpu_count() or 1
+        self.jobQ = Queue()
+        self.doneQ = Queue()
+        self.decoders = []
+        self.spillDir = sharedDay.spillDir()
+        self.removeSpill = weakref.finalize(
+            self, shutil.rmtree, self.spillDir, ignore_errors=True
+        )
 
         if not os.path.exists("data"):
             os.mkdir("data")
 
         self.updateHistoricalData()
-        self.updateLiveData()
 
-    def getDate(self):
-        return self.liveOhlc.index[-1]
+        # Every symbol is captured from the start and held by the service, so a
+        # symbol switch only changes which frame a chart reads
+        if capture:
+            with self.lock:
+                for symbol in self.symbols:
+                    self.startFeed(symbol).refs += 1
 
     def downloadData(self, date, temp_dir):
-        url = "https://s3-eu-west-1.amazonaws.com/public.bitmex.com/data/trade/{}.csv.gz".format(
-            date
-        )
-
-        #################################################################################
-        # fileName = url.split("/")[-1]
-
-        # with requests.get(url, stream=True) as r:
-        #     if r.ok:
-        #         with open(os.path.join("data", fileName), "wb") as f:
-        #             shutil.copyfileobj(r.raw, f)
-        #################################################################################
-
-        file_name_gz = url.split("/")[-1]
+        file_name_gz = date + ".csv.gz"
         file_name = file_name_gz[:-3]
 
-        with requests.head(url) as r:
+        if not self.endpoints.hasTradeFile(date):
+            return
+
+        with self.endpoints.getTradeFile(date) as r:
             if not r.ok:
+                logger.debug("Download failed {} --- {}".format(date, r.status_code))
                 return
 
-        with requests.get(url, stream=True) as r:
             with open(os.path.join(temp_dir, file_name_gz), "wb") as f:
                 shutil.copyfileobj(r.raw, f)
 
@@ -84,14 +153,26 @@ class Database(object):
 
         parser = lambda dt: dt.replace("D", "T")[:-6] + "000+00:00"
         df.timestamp = df.timestamp.apply(parser)
-        df.to_csv("data/" + file_name, index=False)
+        store.writeDay(datetime.datetime.strptime(date, "%Y%m%d").date(), df)
+        return True
 
     def updateHistoricalData(self):
-        self.ohlcInfo.put([self.symbols[self.index], self.interval])
-        Process(
+        for _ in range(self.workers):
+            decoder = Process(
+                target=self.decodeDayProcess,
+                args=(self.jobQ, self.doneQ),
+                daemon=True,
+            )
+            decoder.start()
+            self.decoders.append(decoder)
+
+        self.reader = Process(
             target=self._update, args=(self.ohlcInfo, self.ohlcQ), daemon=True,
-        ).start()
-        self.df, self.ohlc = self.ohlcQ.get()
+        )
+        self.reader.start()
+        # The reader reports ready once the history download is done
+        self.ohlcQ.get()
+        self.days = store.listDays()
 
     def _update(self, ohlc_info_q, ohlc_q):
         self.updateHistoricalDataProcess()
@@ -129,34 +210,121 @@ class Database(object):
         #         ohlc_q.put([csv, ohlc])
         #################################################################################
 
+        # Required days are never dropped, prefetch is replaced by each request
+        required = []
+        prefetch = []
+        interval = None
+        command = []
+        # Jobs out with the decoders in the order they were handed out, and the
+        # ones that came back before an earlier job did
+        pending = []
+        done = {}
+        ohlcQ.put(None)
+        # Closed months are compacted after the GUI is told the reader is ready,
+        # a month at a time while there is nothing to read
+        compacting = True
+
         while True:
             try:
-                symbol, interval = ohlcInfo.get_nowait()
+                # Block only when there is nothing left to read, None stops. An
+                # idle reader looks for newly published dumps every so often.
+                if required or prefetch or pending:
+                    command = ohlcInfo.get_nowait()
+                elif compacting:
+                    command = ohlcInfo.get(timeout=1.0)
+                else:
+                    command = ohlcInfo.get(timeout=self.dumpCheck)
+                while command is not None:
+                    newRequired, prefetch, interval = command
+                    required += [k for k in newRequired if k not in required]
+                    command = ohlcInfo.get_nowait()
             except Exception:
-                pass
-            else:
-                if symbol != None or interval != None:
-                    files = sorted(glob.glob("data/*"), reverse=True)
-                    logger.debug("--- Start {} {} ---".format(symbol, interval))
-                    while not ohlcQ.empty():
-                        ohlcQ.get()
-
-            if not ohlcQ.full():
-                file = files.pop(0)
-                csv = pd.read_csv(
-                    file,
-                    index_col=0,
-                    parse_dates=True,
-                    date_parser=ciso8601.parse_datetime,
-                ).query("symbol == '{}'".format(symbol))
-                ohlc = csv.price.resample(interval).ohlc()
-                ohlcQ.put([csv, ohlc])
+                if compacting and not (required or prefetch or pending):
+                    compacting = self.compactStep()
+                elif not (required or prefetch or pending):
+                    # A failed update is retried at the next check, the reader
+                    # must stay up for the requests the GUI blocks on
+                    try:
+                        stored = self.updateHistoricalDataProcess()
+                    except Exception as e:
+                        logger.debug("Read data | Update failed --- {}".format(e))
+                        stored = 0
+                    if stored:
+                        # A None symbol tells the GUI the store moved on
+                        ohlcQ.put([None, None, None, None])
+                        compacting = True
+
+            if command is None:
+                break
+
+            # Days on screen go out before prefetch, each free decoder gets one
+            while len(pending) < self.workers and (required or prefetch):
+                key = required.pop(0) if required else prefetch.pop(0)
+                self.jobQ.put([key, interval])
+                pending.append(key)
+
+            if not pending:
+                continue
+
+            key, handle, bars = self.doneQ.get()
+            done[key] = [handle, bars]
+
+            # Blocks while the GUI is behind, so at most the queue's worth of
+            # days is read ahead
+            while pending and pending[0] in done:
+                key = pending.pop(0)
+                handle, bars = done.pop(key)
+                ohlcQ.put([key[0], key[1], handle, bars])
                 logger.debug(
-                    "Read data | Queue: {} --- {}".format(
-                        ohlcQ.qsize(), ciso8601.parse_datetime(file[5:-4]).date()
+                    "Read data | Queue: {} Pending: {} --- {} {}".format(
+                        ohlcQ.qsize(),
+                        len(required) + len(prefetch) + len(pending),
+                        key[0],
+                        key[1],
                     )
                 )
 
+        ohlcQ.cancel_join_thread()
+        logger.debug("Stop reading data")
+
+    def compactStep(self):
+        # Compacts the oldest closed month, True while more are left
+        try:
+            months = store.closedMonths()
+            if months:
+                store.compactMonth(months[0])
+            return len(months) > 1
+        except Exception as e:
+            logger.debug("Read data | Compaction failed --- {}".format(e))
+            return False
+
+    def decodeDayProcess(self, jobQ, doneQ):
+        while True:
+            job = jobQ.get()
+            if job is None:
+                break
+
+            # The day's bars for the chart's interval are built here as well
+            (symbol, date), interval = job
+            try:
+                df = store.readDay(date, symbol)
+                if df is None:
+                    doneQ.put([(symbol, date), None, None])
+                    continue
+
+                bars = None if interval is None else {interval: makeBars(df, interval)}
+                handle = sharedDay.shareDay(df, self.spillDir)
+            except Exception as e:
+                # The reader waits for a reply per job, an unreadable day is
+                # answered as missing instead of leaving it blocked
+                logger.debug("Decode day | {} {} failed --- {}".format(symbol, date, e))
+                doneQ.put([(symbol, date), None, None])
+                continue
+
+            doneQ.put([(symbol, date), handle, bars])
+
+        doneQ.cancel_join_thread()
+
     def updateHistoricalDataProcess(self):
         logger.debug("Start updating history")
 
@@ -176,136 +344,652 @@ class Database(object):
         #     self.downloadData(date.strftime("%Y%m%d"))
         #################################################################################
 
-        file_name = os.listdir("data")
+        # The manifest lists every stored day, so gaps are found without
+        # opening a file and a day a crash left half written is fetched again
+        days = store.listDays()
 
-        if file_name:
-            start_dt = ciso8601.parse_datetime(file_name[-1][:-4])
+        if days:
+            start_dt = datetime.datetime.combine(days[0], datetime.time())
         else:
             start_dt = datetime.datetime(2020, 11, 1)
 
         end_dt = datetime.datetime.now()
 
+        have = set(days)
+        dates = [
+            start_dt + datetime.timedelta(n)
+            for n in range(int((end_dt.date() - start_dt.date()).days))
+        ]
+        missing = [date for date in dates if date.date() not in have]
+        logger.debug(
+            "History | {} days stored, {} missing".format(len(have), len(missing))
+        )
+
+        stored = 0
         with tempfile.TemporaryDirectory(dir=os.getcwd()) as temp_dir:
-            for n in range(1, int((end_dt.date() - start_dt.date()).days)):
-                date = start_dt + datetime.timedelta(n)
+            for date in missing:
                 logger.debug("Downloading {}".format(date.date()))
-                self.downloadData(date.strftime("%Y%m%d"), temp_dir)
+                if self.downloadData(date.strftime("%Y%m%d"), temp_dir):
+                    foldDay(date)
+                    stored += 1
 
         logger.debug("Done updating history")
+        return stored
 
-    def updateLiveData(self):
-        self.liveInfo.put([self.symbols[self.index], self.interval])
-        Process(
-            target=self.updateLiveDataProcess,
-            args=(self.liveInfo, self.liveOhlcQ),
+    def startFeed(self, symbol):
+        if self.replay is None:
+            target = self.updateLiveDataProcess
+        else:
+            target = self.replay.replayDataProcess
+
+        # Unbounded, the process only sends new trades and none may be dropped
+        info = Queue(1)
+        queue = Queue()
+        info.put([symbol, self.alertRules.get(symbol)])
+        process = Process(
+            target=target,
+            args=(info, queue),
+            kwargs={"alert_q": self.alertQ},
             daemon=True,
-        ).start()
-        self.liveDf, self.liveOhlc = self.liveOhlcQ.get()
+        )
+        process.start()
 
-    def updateLiveDataProcess(self, live_info_q, live_ohlc_q):
-        client = bitmex.bitmex(test=False)
+        feed = LiveFeed(info, queue, process)
+        # Batches are taken off the queue as they arrive, so consumers waiting
+        # for trades are woken instead of polling
+        feed.receiver = threading.Thread(
+            target=self.receiveLive, args=(feed,), daemon=True
+        )
+        feed.receiver.start()
+        self.feeds[symbol] = feed
+        return feed
 
+    def receiveLive(self, feed):
         while True:
             try:
-                symbol, interval = live_info_q.get_nowait()
+                batch = feed.queue.get()
+            except Exception:
+                break
+            if batch is None:
+                break
+
+            with self.lock:
+                if feed.ready.is_set():
+                    feed.pending.append(batch)
+                else:
+                    feed.df = batch
+                    feed.ready.set()
+                self.traded.notify_all()
+
+    def stopReceiver(self, feed, timeout=1.0):
+        # The feed process is gone, the sentinel comes from this side
+        feed.queue.put(None)
+        feed.receiver.join(timeout)
+        with self.lock:
+            self.traded.notify_all()
+
+    def subscribe(self, symbol, timeout=30.0):
+        with self.lock:
+            feed = self.feeds.get(symbol)
+            if feed is None:
+                feed = self.startFeed(symbol)
+            feed.refs += 1
+
+        # Wait for the first update without holding up other symbols, a feed
+        # that died or never answers is reported instead of waited on forever
+        deadline = time() + timeout
+        while not feed.ready.wait(0.25):
+            if not feed.process.is_alive() or time() >= deadline:
+                self.unsubscribe(symbol)
+                raise RuntimeError(
+                    "Live feed for {} did not start{}".format(
+                        symbol, "" if feed.process.is_alive() else ", it exited"
+                    )
+                )
+        return feed
+
+    def unsubscribe(self, symbol):
+        with self.lock:
+            # A closed service has released every feed already
+            feed = self.feeds.get(symbol)
+            if feed is None:
+                return
+            feed.refs -= 1
+            if feed.refs:
+                return
+            self.feeds.pop(symbol)
+        self.stop(feed.process, feed.info)
+        self.stopReceiver(feed)
+
+    def stop(self, process, info, timeout=1.0):
+        # None asks the process to finish its step and return, a process stuck
+        # in a request is terminated after the timeout
+        if info is not None:
+            try:
+                info.put(None, timeout=timeout)
             except Exception:
                 pass
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+
+    def close(self):
+        with self.lock:
+            feeds = list(self.feeds.values())
+            self.feeds.clear()
+        for feed in feeds:
+            self.stop(feed.process, feed.info)
+            self.stopReceiver(feed)
+
+        # A reader blocked on a full queue needs room to see the command
+        self.ohlcInfo.put(None)
+        self.drain()
+        self.stop(self.reader, None, 5.0)
+
+        for decoder in self.decoders:
+            self.jobQ.put(None)
+        for decoder in self.decoders:
+            self.stop(decoder, None)
+        # Days decoded but never received are left in the spill directory
+        self.removeSpill()
+
+        self.alertQ.put(None)
+        self.alertThread.join(1.0)
+
+    def setAlerts(self, symbol, rules):
+        # rules is an alerts.RULE array, it replaces the symbol's rules. False
+        # when a running feed could not be handed them
+        with self.lock:
+            self.alertRules[symbol] = rules
+            feed = self.feeds.get(symbol)
+            if feed is None:
+                return True
+
+            # The feed reads commands between polls, so one still waiting is
+            # replaced rather than queued behind; the GUI never blocks on it.
+            # A feed in self.feeds is not being stopped, the only other
+            # command it can hold is its start.
+            for _ in range(3):
+                try:
+                    feed.info.put_nowait([None, rules])
+                    return True
+                except Full:
+                    pass
+                try:
+                    pending = feed.info.get(timeout=0.05)
+                except Empty:
+                    continue
+                # Its slot is free now and nothing else puts while the lock is
+                # held
+                feed.info.put_nowait([pending[0], rules])
+                return True
+
+        logger.debug("Alerts | {} --- rules not delivered".format(symbol))
+        return False
+
+    def onAlerts(self, fn):
+        self.alertListeners.append(fn)
+
+    def receiveAlerts(self):
+        while True:
+            message = self.alertQ.get()
+            if message is None:
+                break
+            symbol, events, metrics = message
+            self.alertMetrics[symbol] = metrics
+            for fn in list(self.alertListeners):
+                fn(symbol, events, metrics)
+
+    def live(self, symbol):
+        # Feeds nobody looks at keep queueing, switching to one appends all of
+        # it here at once
+        with self.lock:
+            feed = self.feeds[symbol]
+            parts, feed.pending = feed.pending, []
+            if parts:
+                feed.df = pd.concat([feed.df] + parts)
+                if self.replay is not None:
+                    for part in parts:
+                        self.replay.stats.received(part)
+
+            # Trades a newly stored day covers are folded into history
+            watermark = self.watermark()
+            if watermark is not None and len(feed.df) and feed.df.index[0] < watermark:
+                i = feed.df.index.searchsorted(watermark)
+                feed.df = feed.df.iloc[i:]
+                feed.dropped += i
+                feed.bars = {}
+                feed.profile = None
+                feed.sizes = None
+
+            return feed.df
+
+    def liveSince(self, symbol, cursor):
+        # Trades after the cursor an earlier call returned, and the cursor for
+        # the next call; 0 asks for the whole frame
+        with self.lock:
+            df = self.live(symbol)
+            feed = self.feeds[symbol]
+            end = feed.dropped + len(df)
+            if cursor > end:
+                # A restarted feed counts from 0 again
+                cursor = 0
+            return df.iloc[max(cursor - feed.dropped, 0) :], end
+
+    def waitLive(self, symbol, cursor, timeout=None):
+        # liveSince that waits until trades after the cursor arrive, the feed's
+        # receiver wakes it as a batch comes in
+        deadline = None if timeout is None else time() + timeout
+        with self.lock:
+            while True:
+                if symbol not in self.feeds:
+                    # Stopped, nothing more will arrive
+                    return pd.DataFrame(), cursor
+                df, end = self.liveSince(symbol, cursor)
+                remaining = None if deadline is None else deadline - time()
+                if len(df) or (remaining is not None and remaining <= 0):
+                    return df, end
+                self.traded.wait(remaining)
+
+    def liveBars(self, symbol, interval):
+        feed = self.feeds[symbol]
+        builder = feed.bars.get(interval)
+        if builder is None:
+            builder = BarBuilder(interval)
+            feed.bars[interval] = builder
+
+        # Each update only re-aggregates the forming bar
+        with self.lock:
+            return builder.update(feed.df)
+
+    def profileBucket(self, symbol, price):
+        # Fixed on first use so every day of a symbol shares one price grid
+        with self.lock:
+            return self.buckets.setdefault(symbol, profileBucket(price))
+
+    def liveProfile(self, symbol, bucket):
+        return self.extendLive(symbol, "profile", lambda: DayProfile(bucket))
+
+    def liveSizes(self, symbol):
+        return self.extendLive(symbol, "sizes", SizeIndex)
+
+    def extendLive(self, symbol, name, make):
+        # The feed's profile or size index is extended on a copy outside the
+        # lock and swapped in, a large first build does not hold up the drain
+        feed = self.feeds[symbol]
+        with self.lock:
+            df = feed.df
+            dropped = feed.dropped
+            old = getattr(feed, name)
+            seen = getattr(feed, name + "Seen")
+
+        if old is None or len(df) < seen:
+            index = make()
+            seen = 0
+        elif len(df) == seen:
+            return old
+        else:
+            index = old.copy()
+        index.add(df.iloc[seen:])
+
+        with self.lock:
+            # A trim or another caller may have replaced it meanwhile
+            if feed.dropped == dropped and getattr(feed, name) is old:
+                setattr(feed, name, index)
+                setattr(feed, name + "Seen", len(df))
+        return index
+
+    def updateLiveDataProcess(
+        self, live_info_q, live_ohlc_q, count=1000, alert_q=None
+    ):
+        journal = None
+        alerts = AlertEngine()
+
+        while True:
+            if journal is None:
+                pause = None
+            elif catchUp is None:
+                pause = max(2, self.endpoints.wait())
             else:
-                if symbol != None:
-                    i = 0
-                    df = pd.DataFrame()
+                pause = self.endpoints.wait()
+
+            try:
+                # Polls wait on the command channel, so a new symbol or a stop
+                # is picked up at once and an idle feed sleeps in the kernel
+                command = live_info_q.get(timeout=pause)
+            except Exception:
+                command = []
+
+            if command is None:
+                break
+            if command:
+                name, rules = (command + [None])[:2]
+                if rules is not None:
+                    alerts.setRules(rules)
+                if name != None:
+                    symbol = name
+                    alerts.reset(symbol)
+                    if journal is not None:
+                        journal.close()
+                    journal = TradeJournal(symbol)
 
                     last_dt = datetime.datetime.now(datetime.timezone.utc).replace(
                         hour=0, minute=0, second=0, microsecond=0
                     )
-                    url = "https://s3-eu-west-1.amazonaws.com/public.bitmex.com/data/trade/{}.csv.gz".format(
+                    if not self.endpoints.hasTradeFile(
                         (last_dt - datetime.timedelta(1)).strftime("%Y%m%d")
+                    ):
+                        last_dt = last_dt - datetime.timedelta(1)
+
+                    journal.fold(last_dt.date())
+                    df = journal.recover(last_dt)
+                    edge = set()
+                    if len(df):
+                        last_dt = df.index[-1].to_pydatetime()
+                        edge = set(df.trdMatchID[df.index == df.index[-1]])
+
+                    # Pages are fetched back to back until one comes back short,
+                    # and published in bulk rather than per page
+                    parts = [df]
+                    catchUp = time()
+                    caught = 0
+                    published = 0.0
+
+            try:
+                # start skips the trades already held at last_dt, so a burst of
+                # more than a page within one timestamp cannot stall the feed
+                result = self.endpoints.getTrades(
+                    symbol, last_dt, count=count, start=len(edge)
+                )
+            except Exception as e:
+                logger.debug("Updating | {} --- {}".format(symbol, e))
+                continue
+
+            if result:
+                temp_df = pd.DataFrame.from_records(
+                    result,
+                    index="timestamp",
+                    columns=[
+                        "timestamp",
+                        "symbol",
+                        "side",
+                        "size",
+                        "price",
+                        "trdMatchID",
+                    ],
+                )
+                temp_df.index = pd.to_datetime(temp_df.index, utc=True)
+                journal.append(temp_df)
+
+                # Only the edge timestamp can repeat, the rest of the frame is
+                # never searched again
+                new = ~(
+                    (temp_df.index == last_dt) & temp_df.trdMatchID.isin(edge)
+                )
+                temp_df = temp_df[new]
+
+                if len(temp_df):
+                    parts.append(temp_df)
+                    last = temp_df.index[-1]
+                    if last != last_dt:
+                        edge = set()
+                    edge.update(temp_df.trdMatchID[temp_df.index == last])
+                    last_dt = last.to_pydatetime()
+
+            # Trades recovered or caught up on only prime the rules, an alert for
+            # a move that happened before the feed started would be stale
+            priming = catchUp is not None
+            if catchUp is not None:
+                caught += len(result)
+                if len(result) == count and time() - published < 1.0:
+                    continue
+
+                elapsed = time() - catchUp
+                behind = datetime.datetime.now(datetime.timezone.utc) - last_dt
+                logger.debug(
+                    "Catch-up | {} --- {:,} trades {:,.0f}/s {} behind".format(
+                        symbol,
+                        caught,
+                        caught / max(elapsed, 1e-9),
+                        str(behind).split(".")[0],
                     )
-                    with requests.head(url) as r:
-                        if not r.ok:
-                            last_dt = last_dt - datetime.timedelta(1)
-
-                    file_name = "temp_" + symbol + ".csv"
-                    if os.path.exists(file_name):
-                        try:
-                            temp_df = pd.read_csv(
-                                file_name, index_col=0, parse_dates=True
-                            )
-                        except Exception:
-                            pass
-                        else:
-                            temp_dt = temp_df.index[-1].to_pydatetime()
-                            if temp_dt > last_dt:
-                                last_dt = temp_dt
-                                df = temp_df
-
-            sleep(2)
-            result = client.Trade.Trade_get(
-                symbol=symbol, startTime=last_dt, count=1000
-            ).result()[0]
-
-            temp_df = pd.DataFrame.from_records(
-                result,
-                index="timestamp",
-                columns=["timestamp", "symbol", "side", "size", "price", "trdMatchID"],
-            )
-            temp_df.index = pd.to_datetime(temp_df.index, utc=True)
+                )
+                if len(result) < count:
+                    logger.debug(
+                        "Catch-up | {} --- done in {:.1f}s".format(symbol, elapsed)
+                    )
+                    catchUp = None
+                published = time()
+            elif not parts:
+                continue
 
-            df = pd.concat([df, temp_df])
-            df = df[~df.trdMatchID.duplicated(keep="first")]
+            # Only trades the GUI has not seen cross the queue, it appends them
+            df = pd.concat(parts)
+            parts = []
+            if not len(df):
+                continue
 
-            if live_ohlc_q.full():
-                live_ohlc_q.get()
+            alerts.check(df, alert_q, quiet=priming)
+            live_ohlc_q.put(df.drop("trdMatchID", axis=1))
 
-            live_ohlc_q.put(
-                [df.drop("trdMatchID", axis=1), df.price.resample(interval).ohlc()]
+            logger.debug(
+                "Updating | {} --- {:.19}".format(symbol, str(last_dt.astimezone()))
             )
 
-            last_dt = temp_df.index[-1].to_pydatetime()
+        # Frames nobody will read must not hold up the exit
+        live_ohlc_q.cancel_join_thread()
+        if journal is not None:
+            journal.close()
+        logger.debug("Updating | Stopped")
 
-            logger.debug(
-                "Updating | {} {} --- {:.19}".format(
-                    symbol, interval, str(last_dt.astimezone())
+    def watermark(self):
+        # Stored days own everything before the midnight after the newest one,
+        # the live feeds everything from it
+        if not self.days:
+            return None
+        return pd.Timestamp(self.days[-1] + datetime.timedelta(1), tz="UTC")
+
+    def getAnchor(self):
+        # First stored midnight, so bar alignment survives eviction
+        if self.days:
+            return datetime.datetime.combine(
+                self.days[0], datetime.time(), tzinfo=datetime.timezone.utc
+            ).timestamp()
+        return None
+
+    def loadRange(self, view, symbol, startDate, endDate, direction, interval=None):
+        with self.lock:
+            self.drain()
+
+            i0 = bisect.bisect_left(self.days, startDate)
+            i1 = bisect.bisect_right(self.days, endDate)
+            needed = [(symbol, d) for d in self.days[i0:i1]]
+
+            missing = [k for k in needed if k not in self.cache]
+            if direction < 0:
+                missing.reverse()
+                ahead = self.days[max(0, i0 - self.prefetch) : i0][::-1]
+            elif direction > 0:
+                ahead = self.days[i1 : i1 + self.prefetch]
+            else:
+                half = self.prefetch // 2
+                ahead = (
+                    self.days[max(0, i0 - half) : i0][::-1] + self.days[i1 : i1 + half]
                 )
+            ahead = [(symbol, d) for d in ahead]
+
+            newRequired = [k for k in missing if k not in self.required]
+            prefetch = [
+                k for k in ahead if k not in self.cache and k not in self.required
+            ]
+            if newRequired or not set(prefetch) <= self.prefetching:
+                self.ohlcInfo.put([newRequired, prefetch, interval])
+                self.required.update(newRequired)
+                self.prefetching = set(prefetch)
+
+            while any(k not in self.cache and k in self.required for k in missing):
+                if self.receiving:
+                    self.arrived.wait()
+                    continue
+
+                # Block on the reader outside the lock so cached queries still run
+                self.receiving = True
+                self.lock.release()
+                try:
+                    result = self.ohlcQ.get()
+                finally:
+                    self.lock.acquire()
+                    self.receiving = False
+                self.receive(result)
+                self.arrived.notify_all()
+
+            # Days on screen in any chart are never evicted
+            if view is not None:
+                self.pinned[id(view)] = set(needed)
+            self.cache.touch(needed)
+            self.cache.evict(set(needed).union(*self.pinned.values()))
+            return [k for k in needed if k in self.cache]
+
+    def release(self, view):
+        with self.lock:
+            self.pinned.pop(id(view), None)
+
+    def receive(self, result):
+        symbol, date, handle, bars = result
+        if symbol is None:
+            self.days = store.listDays()
+            logger.debug("Cache | Watermark {}".format(self.watermark()))
+            return
+
+        key = (symbol, date)
+        self.required.discard(key)
+        self.prefetching.discard(key)
+
+        if handle is None:
+            if date in self.days:
+                self.days.remove(date)
+            return
+
+        self.cache.put(key, sharedDay.openDay(handle, symbol), bars)
+        logger.debug(
+            "Cache | {} days {:.0f} MB --- {} {}".format(
+                len(self.cache), self.cache.nbytes / 2 ** 20, symbol, date
             )
+        )
 
-            i += 1
-            if i % 5 == 0:
-                df.to_csv(file_name)
+    def drain(self):
+        while True:
+            try:
+                result = self.ohlcQ.get_nowait()
+            except Exception:
+                break
+            self.receive(result)
+
+    def trades(self, keys):
+        with self.lock:
+            dfs = [self.cache.trades(k) for k in keys if k in self.cache]
+        return pd.concat(dfs) if dfs else pd.DataFrame()
+
+    def bars(self, keys, interval):
+        with self.lock:
+            dfs = [self.cache.bars(k, interval) for k in keys if k in self.cache]
+        return pd.concat(dfs) if dfs else pd.DataFrame()
+
+    def profiles(self, keys, bucket):
+        return self.derived(keys, bucket, lambda: DayProfile(bucket))
+
+    def sizeIndexes(self, keys):
+        return self.derived(keys, "sizes", SizeIndex)
+
+    def derived(self, keys, name, make):
+        # Missing day indexes are built outside the lock and attached after, a
+        # large first build does not hold up loadRange or the live drain
+        with self.lock:
+            entries = [
+                (k, self.cache.trades(k), self.cache.derived(k, name))
+                for k in keys
+                if k in self.cache
+            ]
+
+        indexes = []
+        for key, df, index in entries:
+            if index is None:
+                index = make()
+                index.add(df)
+                with self.lock:
+                    index = self.cache.attach(key, name, index)
+            indexes.append(index)
+        return indexes
 
-    def getVolume(self, startTs, endTs):
-        if not len(self.ohlc):
-            return None
 
-        timeDelta = self.ohlc.index[1] - self.ohlc.index[0]
-        startDt = datetime.datetime.fromtimestamp(
-            int(startTs), tz=datetime.timezone.utc
-        )
-        endDt = (
-            datetime.datetime.fromtimestamp(int(endTs), tz=datetime.timezone.utc)
-            + timeDelta
-        )
+class Database(object):
+    def __init__(self, index, interval, service=None, replay=None, endpoints=None):
+        super().__init__()
+        self.service = service or DataService(replay=replay, endpoints=endpoints)
+        self.symbols = self.service.symbols
+        self.replay = self.service.replay
 
-        df = self.df[(self.df.index >= startDt) & (self.df.index <= endDt)]
-        liveDf = self.liveDf[
-            (self.liveDf.index >= startDt) & (self.liveDf.index <= endDt)
-        ]
+        self.df = pd.DataFrame()
+        self.liveDf = pd.DataFrame()
+        self.ohlc = pd.DataFrame()
+        self.liveOhlc = pd.DataFrame()
+        self.timeline = Timeline(self.toSeconds)
+        self.history = None
 
-        data = pd.concat([df, liveDf])
+        self.index = index
+        self.interval = interval
+        self.viewRange = None
+        self.keys = []
 
-        buy = data.query("side == 'Buy'")["size"].resample(self.interval).sum()
-        sell = data.query("side == 'Sell'")["size"].resample(self.interval).sum()
-        volume = pd.concat([buy, sell], axis=1, keys=["buy", "sell"])
+        self.liveSymbol = self.symbols[self.index]
+        self.service.subscribe(self.liveSymbol)
+        self.fetchLive()
+        self.loadLatest()
 
-        volume.index = volume.index.astype("int64") // 1e09
-        return volume.reset_index().to_numpy()
+    def getDate(self):
+        return self.liveOhlc.index[-1]
+
+    def close(self):
+        self.service.release(self)
+        self.service.unsubscribe(self.liveSymbol)
+
+    def fetchLive(self):
+        symbol = self.symbols[self.index]
+        self.liveDf = self.service.live(symbol)
+        self.liveOhlc = self.service.liveBars(symbol, self.interval)
+        self.timeline.setLive(self.liveOhlc)
+
+    def loadLatest(self):
+        days = self.service.days
+        if days:
+            self.loadRange(days[-1], days[-1], -1)
+
+    def loadRange(self, startDate, endDate, direction):
+        self.keys = self.service.loadRange(
+            self, self.symbols[self.index], startDate, endDate, direction, self.interval
+        )
+
+        # History is only rebuilt when the loaded days or the watermark move
+        watermark = self.service.watermark()
+        history = (tuple(self.keys), watermark)
+        if history != self.history:
+            self.history = history
+            self.df = self.service.trades(self.keys)
+            self.ohlc = self.service.bars(self.keys, self.interval)
+            self.timeline.setHistory(self.ohlc, watermark)
+            self.timeline.setLive(self.liveOhlc)
+
+    def getVolume(self, startTs, endTs):
+        # Buy and sell volume are columns of the bars, on the same rows
+        data = self.timeline.between(int(startTs), int(endTs))
+        if not len(data):
+            return None
+        return data[:, [0, 6, 7]]
 
     def getOHLC(self, startTs=None, endTs=None, fetchLive=False):
         if fetchLive:
-            try:
-                self.liveDf, self.liveOhlc = self.liveOhlcQ.get_nowait()
-            except Exception:
-                pass
+            self.fetchLive()
 
         if startTs is not None:
             startDt = datetime.datetime.fromtimestamp(
@@ -315,26 +999,40 @@ class Database(object):
                 int(endTs), tz=datetime.timezone.utc
             )
 
-            while self.ohlc.index[0] > startDt:
-                df, ohlc_df = self.ohlcQ.get()
-                self.df = pd.concat([df, self.df])
-                self.ohlc = pd.concat([ohlc_df, self.ohlc])
-                logger.debug("OHLC | Remaining queue: {}".format(self.ohlcQ.qsize()))
+            if self.viewRange is None:
+                direction = 0
+            elif startDt < self.viewRange[0]:
+                direction = -1
+            elif endDt > self.viewRange[1]:
+                direction = 1
+            else:
+                direction = 0
+            self.viewRange = (startDt, endDt)
+            self.loadRange(startDt.date(), endDt.date(), direction)
 
-            ohlcIdx = self.ohlc.index
-            mask = (ohlcIdx >= startDt) & (ohlcIdx <= endDt)
-            ohlc = self.ohlc[mask]
+            data = self.timeline.between(int(startTs), int(endTs))
+        else:
+            data = self.timeline.between()
 
-            liveIdx = self.liveOhlc.index
-            liveMask = (liveIdx >= startDt) & (liveIdx <= endDt)
-            liveOhlc = self.liveOhlc[liveMask]
+        # Time, OHLC and volume, then the rest of BAR_COLUMNS for the readout
+        return self.getAnchor(), data
 
-            data = pd.concat([ohlc, liveOhlc])
-        else:
-            data = pd.concat([self.ohlc, self.liveOhlc])
+    def toSeconds(self, index):
+        # Trade-driven bars can open within the same second
+        ns = index.values.astype("datetime64[ns]").astype("int64")
+        if isTimeInterval(self.interval):
+            return ns // 1e09
+        return ns / 1e09
 
-        data.index = data.index.astype("int64") // 1e09
-        return self.ohlc.index[0].timestamp(), data.reset_index().to_numpy()
+    def getAnchor(self):
+        anchor = self.service.getAnchor()
+        if anchor is None:
+            return self.liveOhlc.index[0].timestamp()
+        return anchor
+
+    def liveRendered(self):
+        if self.replay is not None:
+            self.replay.stats.rendered()
 
     def setIndex(self, index):
         if index != self.index:
@@ -347,78 +1045,120 @@ class Database(object):
         self.invalidateData()
 
     def invalidateData(self):
-        self.ohlcInfo.put([self.symbols[self.index], self.interval])
-        self.liveInfo.put([self.symbols[self.index], self.interval])
+        if self.replay is not None:
+            self.replay.stats.reset()
+
+        symbol = self.symbols[self.index]
+        if symbol != self.liveSymbol:
+            self.service.subscribe(symbol)
+            self.service.unsubscribe(self.liveSymbol)
+            self.liveSymbol = symbol
 
         self.df = pd.DataFrame()
         self.ohlc = pd.DataFrame()
-        self.liveDf = pd.DataFrame()
-        self.liveOhlc = pd.DataFrame()
-
-        while True:
-            live_df, live_ohlc_df = self.liveOhlcQ.get()
-            freq = live_ohlc_df.index.freq
-            if (
-                all(live_df["symbol"] == self.symbols[self.index])
-                and self.interval == str(freq.n) + freq.name
-            ):
-                self.liveDf = pd.concat([live_df, self.liveDf])
-                self.liveOhlc = pd.concat([live_ohlc_df, self.liveOhlc])
-                break
-
-        while True:
-            df, ohlc_df = self.ohlcQ.get()
-            freq = ohlc_df.index.freq
-            if (
-                all(df["symbol"] == self.symbols[self.index])
-                and self.interval == str(freq.n) + freq.name
-            ):
-                self.df = pd.concat([df, self.df])
-                self.ohlc = pd.concat([ohlc_df, self.ohlc])
-                break
+        self.timeline.clear()
+        self.history = None
+        self.viewRange = None
+        self.fetchLive()
+        self.loadLatest()
+
+    def barEnd(self, dt):
+        # Close of the bar open at dt: one interval on for time bars, the next
+        # bar's open for trade-driven ones and None while that bar still forms
+        if isTimeInterval(self.interval):
+            return pd.Timestamp(dt) + to_offset(self.interval)
+        starts = [f.index for f in (self.ohlc, self.liveOhlc) if len(f)]
+        if not starts:
+            return None
+        starts = starts[0].append(starts[1:]).unique().sort_values()
+        # Times are picked to the second, bars opening within it are picked too
+        i = starts.searchsorted(pd.Timestamp(dt) + pd.Timedelta(seconds=1))
+        return starts[i] if i < len(starts) else None
 
     def volumeOnPrice(self, startDt, endDt, num):
-        timeDelta = self.ohlc.index[1] - self.ohlc.index[0]
+        # Trades from the first selected bar's open up to the last one's close,
+        # end is None when the last bar still forms
+        symbol = self.symbols[self.index]
         startDt = startDt.astimezone(datetime.timezone.utc)
-        endDt = (endDt + timeDelta).astimezone(datetime.timezone.utc)
-
-        live_df, _ = self.liveOhlcQ.get()
-        live_df = live_df[((live_df.index >= startDt) & (live_df.index <= endDt))]
+        end = self.barEnd(endDt.astimezone(datetime.timezone.utc))
+        last = datetime.datetime.now(datetime.timezone.utc) if end is None else end
+        keys = self.service.loadRange(None, symbol, startDt.date(), last.date(), 0)
+
+        all_live_df, cursor = self.service.liveSince(symbol, 0)
+        df = pd.concat([self.service.trades(keys), all_live_df])
+        df = df[df.index >= startDt]
+        if end is not None:
+            df = df[df.index < end]
+
+        # A range reaching past the newest trade keeps following the feed; seen
+        # is the feed cursor after the live rows it already holds
+        seen = None
+        if len(all_live_df) and (end is None or end > all_live_df.index[-1]):
+            seen = cursor
+
+        return PriceHistogram.fromTrades(df, num), seen, end
+
+    def visibleProfile(self, startTs, endTs, rows):
+        symbol = self.liveSymbol
+        if not len(self.liveDf):
+            return None
+        bucket = self.service.profileBucket(symbol, self.liveDf.price.iloc[-1])
+
+        # Per-day histograms are built once and cached with the day, a pan only
+        # sums them, whole days by their totals and the edges by time slot
+        profiles = self.service.profiles(self.keys, bucket)
+        profiles.append(self.service.liveProfile(symbol, bucket))
+        return mergeProfiles(
+            [p.window(startTs, endTs) for p in profiles], bucket, rows
+        )
 
-        df = self.df[((self.df.index >= startDt) & (self.df.index <= endDt))]
-        df = pd.concat([df, live_df])
+    def largeTrades(self, startTs, endTs, minSize):
+        # Only trades of at least minSize are looked at, each day and the live
+        # feed keep their trades ordered by size
+        indexes = self.service.sizeIndexes(self.keys)
+        if len(self.liveDf):
+            indexes.append(self.service.liveSizes(self.liveSymbol))
 
-        price_min = df.price.min()
-        price_max = df.price.max()
+        parts = [index.query(minSize, startTs, endTs) for index in indexes]
+        if not parts:
+            return None
 
-        buy = df[df["side"] == "Buy"]
-        sell = df[df["side"] == "Sell"]
+        time, price, size, buy = [np.concatenate(c) for c in zip(*parts)]
+        order = np.argsort(-size, kind="stable")
+        return time[order], price[order], size[order], buy[order]
 
-        bins, step = np.linspace(price_min, price_max, num + 1, retstep=True)
+    def tradesBetween(self, startTs, endTs):
+        # Both frames are time sorted, so a bar's trades are two binary searches
+        startDt = pd.Timestamp(startTs, unit="s", tz="UTC")
+        endDt = pd.Timestamp(endTs, unit="s", tz="UTC")
 
-        buyBins = pd.cut(buy["price"], bins, include_lowest=True)
-        sellBins = pd.cut(sell["price"], bins, include_lowest=True)
+        frames = []
+        for df in (self.df, self.liveDf):
+            if len(df):
+                i = df.index.searchsorted(startDt)
+                j = df.index.searchsorted(endDt)
+                frames.append(df.iloc[i:j])
 
-        buy = buy["size"].groupby(buyBins).agg("sum")
-        sell = sell["size"].groupby(sellBins).agg("sum")
+        if not frames:
+            return pd.DataFrame(columns=["symbol", "side", "size", "price"])
+        return pd.concat(frames)
 
-        return (
-            pd.concat([buy, sell], axis=1, keys=["buy", "sell"]),
-            (price_min, price_max),
-            step,
-        )
+    def liveTrades(self, seen):
+        # seen is a feed cursor, it survives the feed trimming at the watermark
+        return self.service.liveSince(self.liveSymbol, seen)
 
 
 if __name__ == "__main__":
-    db = Database(0, "1H")
+    db = Database(0, "1h")
     # db.updateHistoricalDataProcess()
     # start = datetime.datetime(2020, 11, 27, tzinfo=datetime.timezone.utc)
     # end = datetime.datetime(2020, 12, 3, tzinfo=datetime.timezone.utc)
     # db.getData(start, end)
     # db.setIndex(1)
 
-    while True:
-        pass
-    #     sleep(5)
-    #     print(db.df.info(memory_usage="deep"))
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        db.close()
+        db.service.close()
 
@@ -0,0 +1,84 @@
+from collections import OrderedDict
+
+from aggregator import makeBars
+from utils import logger
+
+
+class DayCache(object):
+    def __init__(self, maxBytes):
+        super().__init__()
+        self.maxBytes = maxBytes
+        # (symbol, date) -> [trades, {interval: bars, bucket: profile,
+        # "sizes": size index}, nbytes]
+        self.days = OrderedDict()
+        self.nbytes = 0
+
+    def __contains__(self, key):
+        return key in self.days
+
+    def __len__(self):
+        return len(self.days)
+
+    def clear(self):
+        self.days.clear()
+        self.nbytes = 0
+
+    def put(self, key, df, bars=None):
+        if key in self.days:
+            self.nbytes -= self.days.pop(key)[2]
+
+        # Bars the decoder already built come along with the day
+        bars = bars or {}
+        nbytes = int(df.memory_usage(deep=True).sum())
+        nbytes += sum(int(ohlc.memory_usage().sum()) for ohlc in bars.values())
+        self.days[key] = [df, bars, nbytes]
+        self.nbytes += nbytes
+
+    def trades(self, key):
+        return self.days[key][0]
+
+    def bars(self, key, interval):
+        entry = self.days[key]
+        ohlc = entry[1].get(interval)
+        if ohlc is None:
+            ohlc = makeBars(entry[0], interval)
+            nbytes = int(ohlc.memory_usage().sum())
+            entry[1][interval] = ohlc
+            entry[2] += nbytes
+            self.nbytes += nbytes
+
+        return ohlc
+
+    def derived(self, key, name):
+        # A profile (by bucket) or the size index ("sizes") built for the day
+        return self.days[key][1].get(name)
+
+    def attach(self, key, name, value):
+        # Built outside the service lock; the first to attach wins and a day
+        # evicted meanwhile keeps nothing
+        entry = self.days.get(key)
+        if entry is None:
+            return value
+        if name in entry[1]:
+            return entry[1][name]
+
+        entry[1][name] = value
+        entry[2] += value.nbytes
+        self.nbytes += value.nbytes
+        return value
+
+    def touch(self, keys):
+        # Most recently viewed days move to the back of the eviction order
+        for key in keys:
+            if key in self.days:
+                self.days.move_to_end(key)
+
+    def evict(self, pinned):
+        for key in list(self.days):
+            if self.nbytes <= self.maxBytes:
+                break
+            if key in pinned:
+                continue
+
+            self.nbytes -= self.days.pop(key)[2]
+            logger.debug("Cache | Evicted {} {}".format(*key))
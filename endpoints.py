@@ -0,0 +1,102 @@
+import os
+from time import sleep, time
+
+import requests
+
+from utils import logger
+
+
+class Endpoints(object):
+    def __init__(
+        self, s3Url=None, restUrl=None, retries=3, backoff=1.0, timeout=30, rateLimit=30
+    ):
+        super().__init__()
+        self.s3Url = (
+            s3Url
+            or os.environ.get("FTV_S3_URL")
+            or "https://s3-eu-west-1.amazonaws.com/public.bitmex.com"
+        ).rstrip("/")
+        self.restUrl = (
+            restUrl or os.environ.get("FTV_REST_URL") or "https://www.bitmex.com"
+        ).rstrip("/")
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        # REST requests per minute, replaced by the exchange's own headers once
+        # a response carries them
+        self.rateLimit = rateLimit
+        self.remaining = None
+        self.reset = None
+        self.reserve = 5
+        self.lastRequest = 0.0
+
+    def tradeFileUrl(self, date):
+        return "{}/data/trade/{}.csv.gz".format(self.s3Url, date)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.retries + 1):
+            try:
+                r = requests.request(method, url, **kwargs)
+            except requests.ConnectionError as e:
+                if attempt == self.retries:
+                    raise
+                logger.debug("Endpoint | {} {} --- {}".format(method, url, e))
+                sleep(self.backoff * 2 ** attempt)
+                continue
+
+            if r.status_code == 429 or r.status_code >= 500:
+                if attempt == self.retries:
+                    return r
+                wait = float(r.headers.get("Retry-After", self.backoff * 2 ** attempt))
+                logger.debug(
+                    "Endpoint | {} {} --- {} retry in {}s".format(
+                        method, url, r.status_code, wait
+                    )
+                )
+                r.close()
+                sleep(wait)
+                continue
+
+            return r
+
+    def hasTradeFile(self, date):
+        with self.request("HEAD", self.tradeFileUrl(date)) as r:
+            return r.ok
+
+    def getTradeFile(self, date):
+        return self.request("GET", self.tradeFileUrl(date), stream=True)
+
+    def wait(self):
+        # Burst while the exchange reports budget to spare, then slow below the
+        # steady rate as the reserve drains so it refills instead of running
+        # into 429s
+        interval = 60.0 / self.rateLimit
+        if self.remaining is not None:
+            if self.remaining > self.reserve:
+                return 0.0
+            if not self.remaining and self.reset is not None:
+                return max(0.0, self.reset - time())
+            interval *= self.reserve - self.remaining + 1
+        return max(0.0, self.lastRequest + interval - time())
+
+    def getTrades(self, symbol, startTime, count=1000, start=0):
+        params = {
+            "symbol": symbol,
+            "startTime": startTime.isoformat(),
+            "count": count,
+            "start": start,
+        }
+        self.lastRequest = time()
+        with self.request(
+            "GET", self.restUrl + "/api/v1/trade", params=params
+        ) as r:
+            if "X-RateLimit-Limit" in r.headers:
+                self.rateLimit = int(r.headers["X-RateLimit-Limit"])
+            if "X-RateLimit-Remaining" in r.headers:
+                self.remaining = int(r.headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset" in r.headers:
+                self.reset = float(r.headers["X-RateLimit-Reset"])
+            r.raise_for_status()
+            return r.json()
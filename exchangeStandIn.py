@@ -0,0 +1,269 @@
+import argparse
+import datetime
+import os
+import random
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import sleep, time
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from utils import logger
+
+# Column layout of the public BitMEX daily trade dumps
+DUMP_COLUMNS = [
+    "timestamp",
+    "symbol",
+    "side",
+    "size",
+    "price",
+    "tickDirection",
+    "trdMatchID",
+    "grossValue",
+    "homeNotional",
+    "foreignNotional",
+]
+
+
+def generateFixtures(directory, start, days, tradesPerDay, symbols=None, seed=0):
+    symbols = symbols or {"XBTUSD": 10000.0, "ETHUSD": 400.0}
+    rng = np.random.default_rng(seed)
+
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+
+    for n in range(days):
+        date = start + datetime.timedelta(n)
+        day = pd.Timestamp(date)
+        dfs = []
+        for symbol, price in symbols.items():
+            ts = day + pd.to_timedelta(
+                np.sort(rng.uniform(0, 86400, tradesPerDay)), unit="s"
+            )
+            walk = price * np.exp(np.cumsum(rng.normal(0, 2e-5, tradesPerDay)))
+            symbols[symbol] = walk[-1]
+            dfs.append(
+                pd.DataFrame(
+                    {
+                        "timestamp": ts.strftime("%Y-%m-%dD%H:%M:%S.%f000"),
+                        "symbol": symbol,
+                        "side": np.where(rng.random(tradesPerDay) < 0.5, "Buy", "Sell"),
+                        "size": rng.integers(1, 5000, tradesPerDay),
+                        "price": np.round(walk * 2) / 2,
+                        "tickDirection": "ZeroPlusTick",
+                        "trdMatchID": [
+                            str(uuid.UUID(int=int(i)))
+                            for i in rng.integers(0, 2 ** 63, tradesPerDay)
+                        ],
+                        "grossValue": 0,
+                        "homeNotional": 0.0,
+                        "foreignNotional": 0.0,
+                    }
+                )
+            )
+
+        df = pd.concat(dfs).sort_values("timestamp")
+        file = os.path.join(directory, date.strftime("%Y%m%d") + ".csv.gz")
+        df[DUMP_COLUMNS].to_csv(file, index=False, compression="gzip")
+        logger.debug("Fixture | {} --- {} trades".format(file, len(df)))
+
+
+class Faults(object):
+    def __init__(self, latency=0.0, jitter=0.0, failureRate=0.0, rateLimit=None):
+        super().__init__()
+        self.latency = latency
+        self.jitter = jitter
+        self.failureRate = failureRate
+        # Requests allowed per rolling minute, like the exchange's REST limit
+        self.rateLimit = rateLimit
+
+        self.lock = threading.Lock()
+        self.requests = []
+
+    def delay(self):
+        if self.latency or self.jitter:
+            sleep(self.latency + random.uniform(0, self.jitter))
+
+    def fail(self):
+        return random.random() < self.failureRate
+
+    def throttle(self):
+        if self.rateLimit is None:
+            return None, None
+
+        now = time()
+        with self.lock:
+            self.requests = [t for t in self.requests if now - t < 60]
+            if len(self.requests) >= self.rateLimit:
+                return 0, 60 - (now - self.requests[0])
+            self.requests.append(now)
+            return self.rateLimit - len(self.requests), None
+
+    def resetAt(self):
+        # When the oldest request leaves the window and frees a slot
+        with self.lock:
+            return self.requests[0] + 60 if self.requests else time()
+
+
+class ExchangeStandIn(object):
+    def __init__(self, fixtures, faults=None, shift=True):
+        super().__init__()
+        self.fixtures = fixtures
+        self.faults = faults or Faults()
+        self.trades = self.loadTrades(shift)
+        self.server = None
+
+    def loadTrades(self, shift):
+        files = sorted(f for f in os.listdir(self.fixtures) if f.endswith(".csv.gz"))
+        if not files:
+            return pd.DataFrame(columns=DUMP_COLUMNS[1:])
+
+        df = pd.read_csv(os.path.join(self.fixtures, files[-1]))
+        df.index = pd.to_datetime(
+            df.pop("timestamp").str.replace("D", "T"), utc=True
+        ).rename("timestamp")
+
+        # Serve the newest fixture day as today so polling sees a moving edge
+        if shift:
+            today = pd.Timestamp.now(tz="UTC").floor("D")
+            df.index = df.index + (today - df.index[0].floor("D"))
+
+        return df.sort_index()
+
+    def tradeFile(self, name):
+        path = os.path.join(self.fixtures, os.path.basename(name))
+        if name.endswith(".csv.gz") and os.path.exists(path):
+            return path
+        return None
+
+    def getTrades(self, query):
+        symbol = query.get("symbol", [None])[0]
+        count = min(int(query.get("count", ["100"])[0]), 1000)
+        start = int(query.get("start", ["0"])[0])
+
+        # Only trades up to "now" exist, exactly as on the real feed
+        df = self.trades.loc[: pd.Timestamp.now(tz="UTC")]
+        if "startTime" in query:
+            df = df.loc[pd.to_datetime(query["startTime"][0], utc=True) :]
+        if symbol is not None:
+            df = df[df.symbol == symbol]
+
+        return df.iloc[start : start + count].reset_index()
+
+    def handler(self):
+        standIn = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_HEAD(self):
+                self.dispatch(body=False)
+
+            def do_GET(self):
+                self.dispatch(body=True)
+
+            def dispatch(self, body):
+                faults = standIn.faults
+                faults.delay()
+
+                remaining, retryAfter = faults.throttle()
+                if retryAfter is not None:
+                    self.send_response(429)
+                    self.send_header("Retry-After", "{:.0f}".format(retryAfter + 1))
+                    self.end_headers()
+                    return
+
+                if faults.fail():
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+
+                url = urlparse(self.path)
+                if url.path.startswith("/data/trade/"):
+                    path = standIn.tradeFile(url.path)
+                    if path is None:
+                        self.send_response(404)
+                        self.end_headers()
+                        return
+
+                    self.send_response(200)
+                    self.send_header("Content-Length", str(os.path.getsize(path)))
+                    self.end_headers()
+                    if body:
+                        with open(path, "rb") as f:
+                            self.wfile.write(f.read())
+
+                elif url.path == "/api/v1/trade":
+                    trades = standIn.getTrades(parse_qs(url.query))
+                    data = trades.to_json(orient="records", date_format="iso").encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(data)))
+                    if remaining is not None:
+                        self.send_header("X-RateLimit-Limit", str(faults.rateLimit))
+                        self.send_header("X-RateLimit-Remaining", str(remaining))
+                        self.send_header(
+                            "X-RateLimit-Reset", "{:.0f}".format(faults.resetAt() + 0.5)
+                        )
+                    self.end_headers()
+                    if body:
+                        self.wfile.write(data)
+
+                else:
+                    self.send_response(404)
+                    self.end_headers()
+
+            def log_message(self, format, *args):
+                logger.debug("StandIn | " + format % args)
+
+        return Handler
+
+    def start(self, host="127.0.0.1", port=0):
+        self.server = ThreadingHTTPServer((host, port), self.handler())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+        url = "http://{}:{}".format(*self.server.server_address)
+        logger.debug("StandIn | Serving {} on {}".format(self.fixtures, url))
+        return url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local BitMEX stand-in server")
+    parser.add_argument("fixtures", help="directory of YYYYMMDD.csv.gz trade dumps")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=int, default=None)
+    parser.add_argument("--no-shift", action="store_true")
+    parser.add_argument(
+        "--generate",
+        type=int,
+        metavar="DAYS",
+        help="write synthetic fixtures ending yesterday before serving",
+    )
+    parser.add_argument("--trades-per-day", type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.generate:
+        start = datetime.date.today() - datetime.timedelta(args.generate)
+        generateFixtures(args.fixtures, start, args.generate, args.trades_per_day)
+
+    standIn = ExchangeStandIn(
+        args.fixtures,
+        Faults(args.latency, args.jitter, args.failure_rate, args.rate_limit),
+        shift=not args.no_shift,
+    )
+    url = standIn.start(args.host, args.port)
+    print("FTV_S3_URL={0} FTV_REST_URL={0}".format(url))
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        standIn.stop()
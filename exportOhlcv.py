@@ -0,0 +1,114 @@
+import argparse
+import datetime
+import importlib.util
+import os
+from multiprocessing import Pool
+from time import perf_counter
+
+import numpy as np
+import pandas as pd
+
+import store
+from aggregator import flowBars, mergeBars
+from utils import logger
+
+
+def aggregateDay(job):
+    date, symbols, intervals, origin = job
+    df = store.readDay(date)
+    if df is None:
+        return date, {}
+
+    bars = {}
+    for symbol in symbols:
+        trades = df[df.symbol == symbol]
+        for interval in intervals:
+            bars[(symbol, interval)] = flowBars(trades, interval, origin)
+
+    return date, bars
+
+
+def writeBars(bars, path, fmt):
+    if fmt == "parquet":
+        bars.to_parquet(path + ".parquet")
+    else:
+        out = np.empty(
+            len(bars), dtype=[("timestamp", "<i8")] + [(c, "<f8") for c in bars.columns]
+        )
+        out["timestamp"] = bars.index.values.astype("datetime64[ns]").astype("i8")
+        for c in bars.columns:
+            out[c] = bars[c].to_numpy(dtype="f8")
+        np.save(path + ".npy", out)
+
+
+def hasParquetEngine():
+    return any(importlib.util.find_spec(m) for m in ("pyarrow", "fastparquet"))
+
+
+def export(symbols, intervals, start, end, out, fmt="npy", workers=None):
+    # Checked before any day is decoded, not when the first file is written
+    if fmt == "parquet" and not hasParquetEngine():
+        raise RuntimeError("Parquet export needs pyarrow or fastparquet installed")
+
+    days = [d for d in store.listDays() if start <= d <= end]
+    # Every day is binned from the export's first midnight, not its own, so
+    # intervals that do not divide a day line up across days
+    origin = pd.Timestamp(start, tz="UTC")
+    jobs = [(d, symbols, intervals, origin) for d in days]
+
+    parts = {(s, i): [] for s in symbols for i in intervals}
+    t = perf_counter()
+
+    # imap keeps results in day order while the pool decodes ahead
+    with Pool(workers) as pool:
+        for date, bars in pool.imap(aggregateDay, jobs):
+            for key, df in bars.items():
+                parts[key].append(df)
+            logger.debug("Export | {}".format(date))
+
+    elapsed = perf_counter() - t
+    logger.debug(
+        "Export | {} days in {:.2f}s | {:.2f} days/s".format(
+            len(days), elapsed, len(days) / elapsed if elapsed else 0
+        )
+    )
+
+    if not os.path.exists(out):
+        os.makedirs(out)
+
+    for (symbol, interval), dfs in parts.items():
+        if not dfs:
+            continue
+        path = os.path.join(
+            out,
+            "{}_{}_{}_{}".format(
+                symbol, interval, start.strftime("%Y%m%d"), end.strftime("%Y%m%d")
+            ),
+        )
+        writeBars(mergeBars(dfs, interval, origin), path, fmt)
+
+
+if __name__ == "__main__":
+    parseDate = lambda s: datetime.datetime.strptime(s, "%Y%m%d").date()
+
+    parser = argparse.ArgumentParser(
+        description="Export OHLCV with buy/sell volume from the data/ store"
+    )
+    parser.add_argument("--symbols", nargs="+", default=["XBTUSD"])
+    parser.add_argument("--intervals", nargs="+", default=["1min"])
+    parser.add_argument("--start", type=parseDate, required=True, help="YYYYMMDD")
+    parser.add_argument("--end", type=parseDate, required=True, help="YYYYMMDD")
+    parser.add_argument("--out", default="export")
+    parser.add_argument("--format", choices=["parquet", "npy"], default="npy")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    export(
+        args.symbols,
+        args.intervals,
+        args.start,
+        args.end,
+        args.out,
+        args.format,
+        args.workers,
+    )
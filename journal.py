@@ -0,0 +1,238 @@
+import datetime
+import glob
+import os
+import uuid
+from time import time
+
+import numpy as np
+import pandas as pd
+
+from utils import logger
+
+JOURNAL_DIR = "journal"
+MAGIC = b"FTVJRN01"
+
+# Fixed-size records so a torn write is always a partial trailing record
+RECORD = np.dtype(
+    [
+        ("seq", "<u8"),
+        ("ts", "<i8"),
+        ("side", "i1"),
+        ("size", "<f8"),
+        ("price", "<f8"),
+        ("trdMatchID", "S16"),
+    ]
+)
+
+
+def matchIdToBytes(trdMatchID):
+    try:
+        return uuid.UUID(trdMatchID).bytes
+    except (ValueError, AttributeError, TypeError):
+        return str(trdMatchID).encode()[:16]
+
+
+def bytesToMatchId(raw):
+    raw = raw.ljust(16, b"\0")
+    return str(uuid.UUID(bytes=raw))
+
+
+class TradeJournal(object):
+    def __init__(self, symbol, fsyncEvery=5000, fsyncInterval=5.0):
+        super().__init__()
+        self.symbol = symbol
+        self.fsyncEvery = fsyncEvery
+        self.fsyncInterval = fsyncInterval
+
+        self.seq = 0
+        self.lastTs = None
+        self.lastIds = set()
+        self.file = None
+        self.fileDay = None
+        self.unsynced = 0
+        self.lastSync = time()
+
+        if not os.path.exists(JOURNAL_DIR):
+            os.mkdir(JOURNAL_DIR)
+
+    def path(self, day):
+        return os.path.join(
+            JOURNAL_DIR, "{}_{}.bin".format(self.symbol, day.strftime("%Y%m%d"))
+        )
+
+    def days(self):
+        files = sorted(glob.glob(os.path.join(JOURNAL_DIR, self.symbol + "_*.bin")))
+        return [datetime.datetime.strptime(f[-12:-4], "%Y%m%d").date() for f in files]
+
+    def checkHeader(self, path):
+        # A foreign or damaged file would decode as garbage trades, so it is
+        # moved aside and the day starts a fresh journal
+        with open(path, "rb") as f:
+            head = f.read(len(MAGIC))
+        if head == MAGIC:
+            return True
+
+        if MAGIC.startswith(head):
+            # Crashed while writing the header, no trade was journaled yet
+            os.remove(path)
+            logger.debug("Journal | {} torn header, removed".format(path))
+        else:
+            os.replace(path, path + ".bad")
+            logger.debug("Journal | {} bad header, moved to {}.bad".format(path, path))
+        return False
+
+    def records(self, day):
+        path = self.path(day)
+        if not self.checkHeader(path):
+            return np.zeros(0, dtype=RECORD)
+
+        size = os.path.getsize(path)
+        count = (size - len(MAGIC)) // RECORD.itemsize
+        end = len(MAGIC) + count * RECORD.itemsize
+
+        if size != end:
+            # Crashed mid-append: drop the partial tail record
+            logger.debug(
+                "Journal | {} torn tail, truncating {} bytes".format(path, size - end)
+            )
+            with open(path, "r+b") as f:
+                f.truncate(end)
+
+        if count <= 0:
+            return np.zeros(0, dtype=RECORD)
+        return np.memmap(path, dtype=RECORD, mode="r", offset=len(MAGIC), shape=count)
+
+    def recover(self, since):
+        since_ns = pd.Timestamp(since).value
+        parts = []
+
+        for day in self.days():
+            if day < since.date():
+                continue
+
+            rec = self.records(day)
+            # Records are appended in trade order, so the tail is one seek away
+            start = np.searchsorted(rec["ts"], since_ns, side="left")
+            parts.append(np.array(rec[start:]))
+
+            if len(rec):
+                self.seq = max(self.seq, int(rec["seq"][-1]))
+                self.remember(rec)
+
+        if not parts:
+            return pd.DataFrame()
+
+        rec = np.concatenate(parts)
+        df = pd.DataFrame(
+            {
+                "symbol": self.symbol,
+                "side": np.where(rec["side"] > 0, "Buy", "Sell"),
+                "size": rec["size"],
+                "price": rec["price"],
+                "trdMatchID": [bytesToMatchId(r) for r in rec["trdMatchID"]],
+            },
+            index=pd.to_datetime(rec["ts"], utc=True).rename("timestamp"),
+        )
+
+        logger.debug(
+            "Journal | Recovered {} {} trades since {}".format(
+                len(df), self.symbol, since
+            )
+        )
+        return df
+
+    def append(self, df):
+        if not len(df):
+            return 0
+
+        ids = np.array([matchIdToBytes(i) for i in df.trdMatchID], dtype="S16")
+        ts = df.index.values.astype("datetime64[ns]").astype("i8")
+
+        # Polls restart at the last seen timestamp, so duplicates can only sit at
+        # or after it and only the ids at that exact timestamp need remembering
+        new = np.ones(len(df), dtype=bool)
+        if self.lastTs is not None:
+            new = ts > self.lastTs
+            edge = np.flatnonzero(ts == self.lastTs)
+            new[edge] = [i not in self.lastIds for i in ids[edge].tolist()]
+        if not new.any():
+            return 0
+
+        df = df[new]
+        ids = ids[new]
+
+        rec = np.zeros(len(df), dtype=RECORD)
+        rec["seq"] = np.arange(self.seq + 1, self.seq + 1 + len(df))
+        rec["ts"] = ts[new]
+        rec["side"] = np.where(df.side.to_numpy() == "Buy", 1, -1)
+        rec["size"] = df["size"].to_numpy()
+        rec["price"] = df.price.to_numpy()
+        rec["trdMatchID"] = ids
+
+        days = df.index.floor("D")
+        for day in days.unique():
+            self.write(day.date(), rec[days == day])
+
+        self.seq += len(rec)
+        self.remember(rec)
+        return len(rec)
+
+    def remember(self, rec):
+        last = rec["ts"][-1]
+        ids = set(rec["trdMatchID"][rec["ts"] == last].tolist())
+        if last == self.lastTs:
+            self.lastIds.update(ids)
+        else:
+            self.lastTs = last
+            self.lastIds = ids
+
+    def write(self, day, rec):
+        if day != self.fileDay:
+            self.close()
+            path = self.path(day)
+            if os.path.exists(path):
+                self.checkHeader(path)
+            self.file = open(path, "ab")
+            if self.file.tell() == 0:
+                self.file.write(MAGIC)
+            self.fileDay = day
+
+        self.file.write(rec.tobytes())
+        self.file.flush()
+
+        self.unsynced += len(rec)
+        if (
+            self.unsynced >= self.fsyncEvery
+            or time() - self.lastSync >= self.fsyncInterval
+        ):
+            self.sync()
+
+    def sync(self):
+        if self.file is not None and self.unsynced:
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.lastSync = time()
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+        self.file = None
+        self.fileDay = None
+
+    def fold(self, before):
+        # Days the official dump covers are owned by the daily store from now on
+        for day in self.days():
+            if day < before:
+                if day == self.fileDay:
+                    self.close()
+                os.remove(self.path(day))
+                logger.debug("Journal | Folded {} {}".format(self.symbol, day))
+
+
+def foldDay(date):
+    for path in glob.glob(
+        os.path.join(JOURNAL_DIR, "*_{}.bin".format(date.strftime("%Y%m%d")))
+    ):
+        os.remove(path)
+        logger.debug("Journal | Folded {}".format(os.path.basename(path)))
@@ -1,3 +1,5 @@
+import argparse
+import datetime
 import logging
 import sys
 import time
@@ -6,24 +8,55 @@ import numpy as np
 import pyqtgraph.console
 from PyQt5 import QtCore, QtWidgets
 
-from database import Database
+from alertPanel import AlertPanel
+from database import Database, DataService
+from replay import Replay
+from tradeTape import TradeTape
 from uiMain import Ui_MainWindow
-from utils import logger
+from utils import logger, toInterval
 from visualizer import Visualizer
 from volumeProfile import VolumeProfile
+from workspace import Workspace
 
 
 class ApplicationWindow(QtWidgets.QMainWindow):
-    def __init__(self):
+    def __init__(self, replay=None):
         super().__init__()
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
 
         # Init
-        self.db = Database(0, "5T")
+        self.service = DataService(replay=replay)
+        self.db = Database(0, "5min", self.service)
         self.visualizer = Visualizer(self)
-        self.ui.verticalLayout.addWidget(self.visualizer.dockArea)
+
+        intervals = [
+            self.ui.cbInterval.itemText(i)
+            for i in range(self.ui.cbInterval.count())
+            if self.ui.cbInterval.itemText(i) != "-----"
+        ]
+        self.workspace = Workspace(self, self.service, intervals)
+        self.workspace.addMain(self.visualizer.dockArea)
+        self.ui.verticalLayout.addWidget(self.workspace.dockArea)
         self.volumeProfile = VolumeProfile(self)
+
+        # Trade tape, follows the feed until a bar is clicked
+        self.tradeTape = TradeTape(self, self.visualizer)
+        self.tapeDock = QtWidgets.QDockWidget("Trades", self)
+        self.tapeDock.setObjectName("tapeDock")
+        self.tapeDock.setWidget(self.tradeTape)
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.tapeDock)
+        self.visualizer.candlestickWidget.scene().sigMouseClicked.connect(
+            self.tradeTape.selectBar
+        )
+
+        # Alerts, evaluated in the feed processes as trades arrive
+        self.alertPanel = AlertPanel(self, self.service)
+        self.alertDock = QtWidgets.QDockWidget("Alerts", self)
+        self.alertDock.setObjectName("alertDock")
+        self.alertDock.setWidget(self.alertPanel)
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.alertDock)
+
         self.console = pyqtgraph.console.ConsoleWidget(
             namespace={"vs": self.visualizer}
         )
@@ -31,16 +64,29 @@ class ApplicationWindow(QtWidgets.QMainWindow):
         # Auto update
         self.timer = QtCore.QTimer(self)
         self.timer.timeout.connect(self.visualizer.candlestick.refresh)
+        self.timer.timeout.connect(self.workspace.refresh)
+        self.timer.timeout.connect(self.visualizer.volumeProfile.refresh)
+        self.timer.timeout.connect(self.visualizer.refreshVPVR)
+        self.timer.timeout.connect(self.visualizer.refreshWhales)
+        self.timer.timeout.connect(self.tradeTape.refresh)
         self.timer.start(2000)
 
         # Tool menu
+        self.ui.actionNewChart.triggered.connect(self.actionNewChart)
         self.ui.actionVolumeProfile.triggered.connect(self.actionVolumeProfile)
         self.ui.actionConsole.triggered.connect(self.console.show)
+        self.ui.menuTools.addAction(self.tapeDock.toggleViewAction())
+        self.ui.menuTools.addAction(self.alertDock.toggleViewAction())
 
         # Indicator menu
         self.ui.actionVolume.toggled.connect(
             lambda checked: self.visualizer.toggleVolume(checked)
         )
+        self.ui.actionVPVR.toggled.connect(
+            lambda checked: self.visualizer.toggleVPVR(checked)
+        )
+        self.whaleSize = 100000
+        self.ui.actionWhales.toggled.connect(self.actionWhales)
 
         # Toolbar
         self.previousIndex = 7
@@ -48,11 +94,36 @@ class ApplicationWindow(QtWidgets.QMainWindow):
         self.ui.cbInterval.activated.connect(self.cbIntervalSelect)
         self.ui.cbSymbol.currentIndexChanged.connect(self.cbSymbolSelect)
 
+    def closeEvent(self, event):
+        # Stop the reader and live processes instead of leaving them to die
+        # with the interpreter
+        self.timer.stop()
+        self.service.close()
+        super().closeEvent(event)
+
+    @QtCore.pyqtSlot()
+    def actionNewChart(self):
+        self.workspace.addChart(
+            self.ui.cbSymbol.currentIndex(), self.ui.cbInterval.currentText()
+        )
+
     @QtCore.pyqtSlot()
     def actionVolumeProfile(self):
         self.volumeProfile.updateDate()
         self.volumeProfile.show()
 
+    @QtCore.pyqtSlot(bool)
+    def actionWhales(self, checked):
+        if checked:
+            size, ok = QtWidgets.QInputDialog.getDouble(
+                self, "Large trades", "Minimum size", self.whaleSize, 1, 1e12, 0
+            )
+            if not ok:
+                self.ui.actionWhales.setChecked(False)
+                return
+            self.whaleSize = size
+        self.visualizer.toggleWhales(checked, self.whaleSize)
+
     @QtCore.pyqtSlot(int)
     def cbSymbolSelect(self, i):
         self.visualizer.setIndex(i)
@@ -66,26 +137,36 @@ class ApplicationWindow(QtWidgets.QMainWindow):
             self.ui.cbInterval.setCurrentIndex(self.previousIndex)
         elif i != self.previousIndex:
             self.previousIndex = i
-            if text[-1] == "s":
-                interval = text.replace("s", "S")
-            elif text[-1] == "m":
-                interval = text.replace("m", "T")
-            elif text[-1] == "h":
-                interval = text.replace("h", "H")
-            else:
-                interval = text
-
-            self.visualizer.setInterval(interval)
+            self.visualizer.setInterval(toInterval(text))
 
         self.ui.centralwidget.setFocus()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--replay",
+        choices=["1", "10", "100", "max"],
+        help="drive the live pipeline from stored trades at this speed",
+    )
+    parser.add_argument(
+        "--replay-date",
+        type=lambda s: datetime.datetime.strptime(s, "%Y%m%d").date(),
+        help="first stored day to replay (YYYYMMDD), defaults to the newest",
+    )
+    parser.add_argument("--replay-days", type=int, default=1)
+    args, qt_args = parser.parse_known_args()
+
+    replay = None
+    if args.replay is not None:
+        speed = None if args.replay == "max" else float(args.replay)
+        replay = Replay(speed, args.replay_date, args.replay_days)
+
     qapp = QtWidgets.QApplication.instance()
     if not qapp:
-        qapp = QtWidgets.QApplication(sys.argv)
+        qapp = QtWidgets.QApplication(sys.argv[:1] + qt_args)
 
-    app = ApplicationWindow()
+    app = ApplicationWindow(replay)
     # app.showMaximized()
     app.show()
     app.activateWindow()
@@ -0,0 +1,191 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+import pandas as pd
+
+try:
+    import lz4.frame as lz4
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b"FTVMON01"
+HOUR = 3600 * 10 ** 9
+SIDES = ["Buy", "Sell"]
+
+LZ4, ZSTD, ZLIB = 1, 2, 3
+CODEC_NAMES = {LZ4: "lz4", ZSTD: "zstd", ZLIB: "zlib"}
+
+# One entry per symbol and hour, so a read decodes only the blocks it touches
+INDEX = np.dtype(
+    [
+        ("symbol", "<u2"),
+        ("hour", "<i8"),
+        ("offset", "<u8"),
+        ("length", "<u4"),
+        ("rows", "<u4"),
+    ]
+)
+TRAILER = struct.Struct("<Q")
+
+
+def bestCodec():
+    # The fast codecs are optional, zlib at its fastest level always works
+    if lz4 is not None:
+        return LZ4
+    if zstandard is not None:
+        return ZSTD
+    return ZLIB
+
+
+def compress(codec, raw):
+    if codec == LZ4:
+        return lz4.compress(raw)
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=1).compress(raw)
+    return zlib.compress(raw, 1)
+
+
+def decompress(codec, raw):
+    if codec == LZ4:
+        if lz4 is None:
+            raise RuntimeError("Month file is LZ4 compressed, lz4 is not installed")
+        return lz4.decompress(raw)
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError(
+                "Month file is zstd compressed, zstandard is not installed"
+            )
+        return zstandard.ZstdDecompressor().decompress(raw)
+    return zlib.decompress(raw)
+
+
+def encodeBlock(ts, size, price, buy):
+    # Time as deltas from the block's first trade, which compress to almost
+    # nothing; the columns follow each other
+    delta = np.diff(ts, prepend=ts[0])
+    delta[0] = ts[0]
+    return b"".join(
+        [
+            delta.astype("<i8").tobytes(),
+            size.astype("<f8").tobytes(),
+            price.astype("<f8").tobytes(),
+            np.where(buy, 0, 1).astype("i1").tobytes(),
+        ]
+    )
+
+
+def decodeBlock(raw, rows):
+    ts = np.cumsum(np.frombuffer(raw, "<i8", rows, 0))
+    size = np.frombuffer(raw, "<f8", rows, 8 * rows)
+    price = np.frombuffer(raw, "<f8", rows, 16 * rows)
+    side = np.frombuffer(raw, "i1", rows, 24 * rows)
+    return ts, size, price, side
+
+
+def writeMonth(path, df, codec=None):
+    codec = bestCodec() if codec is None else codec
+    symbols = sorted(df.symbol.unique())
+
+    ts = df.index.values.astype("datetime64[ns]").astype("i8")
+    hours = ts // HOUR
+    entries = []
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        for code, symbol in enumerate(symbols):
+            mask = (df.symbol == symbol).to_numpy()
+            sts = ts[mask]
+            shours = hours[mask]
+            size = df["size"].to_numpy(dtype="f8")[mask]
+            price = df.price.to_numpy(dtype="f8")[mask]
+            buy = (df.side == "Buy").to_numpy()[mask]
+
+            starts = np.flatnonzero(np.diff(shours, prepend=-1))
+            ends = np.append(starts[1:], len(sts))
+            for i, j in zip(starts, ends):
+                raw = encodeBlock(sts[i:j], size[i:j], price[i:j], buy[i:j])
+                block = compress(codec, raw)
+                entries.append((code, shours[i] * HOUR, f.tell(), len(block), j - i))
+                f.write(block)
+
+        # Footer: codec, symbols, index, then where the footer starts
+        footer = f.tell()
+        names = ",".join(symbols).encode()
+        f.write(struct.pack("<BH", codec, len(names)))
+        f.write(names)
+        index = np.array(entries, dtype=INDEX)
+        f.write(struct.pack("<I", len(index)))
+        f.write(index.tobytes())
+        f.write(TRAILER.pack(footer))
+        f.write(MAGIC)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class MonthFile(object):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+        with open(path, "rb") as f:
+            f.seek(-TRAILER.size - len(MAGIC), 2)
+            tail = f.read()
+            if tail[TRAILER.size :] != MAGIC:
+                raise ValueError("{} is not a complete month file".format(path))
+            (footer,) = TRAILER.unpack(tail[: TRAILER.size])
+
+            f.seek(footer)
+            self.codec, n = struct.unpack("<BH", f.read(3))
+            self.symbols = f.read(n).decode().split(",")
+            (n,) = struct.unpack("<I", f.read(4))
+            self.index = np.frombuffer(f.read(n * INDEX.itemsize), INDEX)
+
+    def days(self):
+        hours = self.index["hour"].astype("datetime64[ns]")
+        return sorted(set(pd.DatetimeIndex(hours).date))
+
+    def read(self, startNs, endNs, symbol=None):
+        # Blocks whose hour overlaps [startNs, endNs), trimmed to the range
+        index = self.index
+        mask = (index["hour"] + HOUR > startNs) & (index["hour"] < endNs)
+        if symbol is not None:
+            code = self.symbols.index(symbol) if symbol in self.symbols else -1
+            mask &= index["symbol"] == code
+        entries = index[mask]
+
+        parts = []
+        with open(self.path, "rb") as f:
+            for entry in entries:
+                f.seek(int(entry["offset"]))
+                raw = decompress(self.codec, f.read(int(entry["length"])))
+                ts, size, price, side = decodeBlock(raw, int(entry["rows"]))
+                code = np.full(len(ts), entry["symbol"], dtype="i2")
+                parts.append((code, ts, size, price, side))
+
+        if parts:
+            columns = [np.concatenate(c) for c in zip(*parts)]
+        else:
+            columns = [np.empty(0, dtype=t) for t in ("i2", "i8", "f8", "f8", "i1")]
+        if symbol is None and len(self.symbols) > 1:
+            order = np.argsort(columns[1], kind="stable")
+            columns = [c[order] for c in columns]
+
+        code, ts, size, price, side = columns
+        keep = (ts >= startNs) & (ts < endNs)
+        index = pd.DatetimeIndex(ts[keep].view("M8[ns]"), name="timestamp")
+        return pd.DataFrame(
+            {
+                "symbol": np.array(self.symbols, dtype=object)[code[keep]],
+                "side": np.array(SIDES, dtype=object)[side[keep]],
+                "size": size[keep],
+                "price": price[keep],
+            },
+            index=index.tz_localize("UTC"),
+        )
@@ -0,0 +1,62 @@
+import numpy as np
+
+
+def appendStart(old, data):
+    # First row that can differ when data is old with its last bar updated and
+    # new bars appended, 0 when the two are unrelated
+    if old is None or data is None or len(old) < 2 or len(data) < len(old):
+        return 0
+
+    i = len(old) - 2
+    if old[0][0] == data[0][0] and np.array_equal(old[i], data[i], equal_nan=True):
+        return i + 1
+    return 0
+
+
+class SparseTable(object):
+    def __init__(self, func, fill):
+        super().__init__()
+        # func is np.minimum or np.maximum, fill its identity (inf or -inf) so
+        # NaN bars drop out of the query like nanmin/nanmax
+        self.func = func
+        self.fill = fill
+        self.levels = []
+
+    def __len__(self):
+        return len(self.levels[0]) if self.levels else 0
+
+    def update(self, values, start=0):
+        values = np.where(np.isnan(values), self.fill, values)
+        old = self.levels if start > 0 else []
+
+        # levels[k][i] covers values[i : i + 2 ** k]; entries that end before
+        # start are unchanged and copied over
+        levels = [values]
+        k = 1
+        while 1 << k <= len(values):
+            half = 1 << (k - 1)
+            prev = levels[-1]
+            n = len(values) - (1 << k) + 1
+            level = np.empty(n)
+
+            lo = 0
+            if k < len(old):
+                lo = min(max(0, start - (1 << k) + 1), n, len(old[k]))
+                level[:lo] = old[k][:lo]
+            self.func(prev[lo:n], prev[lo + half : n + half], out=level[lo:])
+
+            levels.append(level)
+            k += 1
+
+        self.levels = levels
+
+    def query(self, i, j):
+        # func over values[i:j] in two lookups
+        levels = self.levels
+        j = min(j, len(levels[0])) if levels else 0
+        if j <= i:
+            return self.fill
+
+        k = int(j - i).bit_length() - 1
+        level = levels[k]
+        return self.func(level[i], level[j - (1 << k)])
@@ -0,0 +1,183 @@
+import datetime
+from time import time
+
+import numpy as np
+import pandas as pd
+
+import store
+from alerts import AlertEngine
+from utils import logger
+
+
+class Replay(object):
+    def __init__(self, speed=None, date=None, days=1, period=0.25, batch=1000):
+        super().__init__()
+        # speed=None sends batches as fast as they are read
+        self.speed = speed
+        self.date = date
+        self.days = days
+        self.period = period
+        self.batch = batch
+
+        self.stats = ReplayStats(speed)
+
+    def readTrades(self, symbol):
+        if self.date is None:
+            days = store.listDays()
+            if not days:
+                return pd.DataFrame()
+            start = days[-1] - datetime.timedelta(self.days - 1)
+        else:
+            start = self.date
+
+        dfs = []
+        for n in range(self.days):
+            date = start + datetime.timedelta(n)
+            df = store.readDay(date, symbol)
+            if df is None:
+                logger.debug("Replay | Missing {}".format(date))
+                continue
+            dfs.append(df)
+
+        if not dfs:
+            return pd.DataFrame()
+
+        # Shift the replayed days so they land where today's live data would
+        trades = pd.concat(dfs)
+        today = datetime.datetime.now(datetime.timezone.utc).replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        first_day = trades.index[0].replace(hour=0, minute=0, second=0, microsecond=0)
+        trades.index = trades.index + (today - first_day)
+        return trades
+
+    def replayDataProcess(self, live_info_q, live_ohlc_q, alert_q=None):
+        trades = pd.DataFrame()
+        pos = 0
+        alerts = AlertEngine()
+
+        while True:
+            # Waiting on the command channel paces the replay, and a finished
+            # replay blocks until the next symbol or a stop
+            if pos >= len(trades):
+                pause = None
+            elif self.speed is None:
+                pause = 0
+            else:
+                pause = self.period
+
+            try:
+                command = live_info_q.get(timeout=pause)
+            except Exception:
+                command = []
+
+            if command is None:
+                break
+            if command:
+                name, rules = (command + [None])[:2]
+                if rules is not None:
+                    alerts.setRules(rules)
+                if name != None:
+                    symbol = name
+                    alerts.reset(symbol)
+                    trades = self.readTrades(symbol)
+                    pos = 0
+                    if len(trades):
+                        replay_start = trades.index[0]
+                        wall_start = time()
+                    logger.debug(
+                        "Replay | {} x{} --- {} trades".format(
+                            symbol, self.speed or "max", len(trades)
+                        )
+                    )
+
+            if pos >= len(trades):
+                continue
+
+            if self.speed is None:
+                end = pos + self.batch
+            else:
+                clock = replay_start + pd.Timedelta(
+                    seconds=(time() - wall_start) * self.speed
+                )
+                end = trades.index.searchsorted(clock, side="right")
+
+            batch = trades.iloc[pos:end]
+            pos = end
+            if not len(batch):
+                continue
+
+            # Replay bookkeeping rides along with the batch so the GUI side can
+            # measure latency without changing the queue's contract. Bars are
+            # counted as one-minute bars so the rate is the same for every chart.
+            bars = int((batch.index[-1] - replay_start).total_seconds() // 60) + 1
+            alerts.check(batch, alert_q)
+            batch.attrs = {"sentAt": time(), "bars": bars}
+            live_ohlc_q.put(batch)
+
+            if pos >= len(trades):
+                logger.debug("Replay | Done {}".format(symbol))
+
+        live_ohlc_q.cancel_join_thread()
+        logger.debug("Replay | Stopped")
+
+
+class ReplayStats(object):
+    def __init__(self, speed, window=200, reportEvery=10):
+        super().__init__()
+        self.speed = speed
+        self.window = window
+        self.reportEvery = reportEvery
+
+        self.latencies = []
+        self.pending = None
+        self.lastReport = None
+        self.batches = 0
+        self.dropped = 0
+
+    def reset(self):
+        self.latencies = []
+        self.pending = None
+        self.lastReport = None
+        self.batches = 0
+        self.dropped = 0
+
+    def received(self, df):
+        info = df.attrs
+        if "sentAt" in info:
+            self.pending = info
+            self.batches += 1
+
+    def rendered(self):
+        if self.pending is None:
+            return
+
+        # Batches merged into one render were never drawn as frames of their own
+        now = time()
+        self.dropped += self.batches - 1
+        self.batches = 0
+        self.latencies.append(now - self.pending["sentAt"])
+        self.latencies = self.latencies[-self.window :]
+
+        if self.lastReport is None:
+            self.lastReport = (now, self.pending["bars"])
+        elif now - self.lastReport[0] >= self.reportEvery:
+            self.report(now)
+
+        self.pending = None
+
+    def report(self, now):
+        elapsed = now - self.lastReport[0]
+        bars = self.pending["bars"] - self.lastReport[1]
+        latency = np.array(self.latencies) * 1000
+
+        logger.debug(
+            "Replay x{} | latency p50 {:.1f} ms p99 {:.1f} ms | {:.1f} 1m bars/s | dropped {}".format(
+                self.speed or "max",
+                np.percentile(latency, 50),
+                np.percentile(latency, 99),
+                bars / elapsed,
+                self.dropped,
+            )
+        )
+        self.lastReport = (now, self.pending["bars"])
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import uuid
+
+import numpy as np
+import pandas as pd
+
+SIDES = ["Buy", "Sell"]
+
+
+def spillDir():
+    # tmpfs where there is one, a day passed between processes stays in memory
+    root = "/dev/shm" if os.path.isdir("/dev/shm") else None
+    return tempfile.mkdtemp(prefix="days-", dir=root)
+
+
+def shareDay(df, directory):
+    # Columns are written back to back, only the path and the row count go
+    # through the queue
+    n = len(df)
+    if not n:
+        return None, 0
+
+    path = os.path.join(directory, uuid.uuid4().hex)
+    with open(path, "wb") as f:
+        df.index.values.astype("datetime64[ns]").astype("i8").tofile(f)
+        df["size"].to_numpy(dtype="f8").tofile(f)
+        df.price.to_numpy(dtype="f8").tofile(f)
+        np.where(df.side.to_numpy() == "Buy", 0, 1).astype("i1").tofile(f)
+    return path, n
+
+
+def openDay(handle, symbol):
+    path, n = handle
+    if not n:
+        return pd.DataFrame(
+            {
+                "symbol": pd.Categorical([], categories=[symbol]),
+                "side": pd.Categorical([], categories=SIDES),
+                "size": np.empty(0),
+                "price": np.empty(0),
+            },
+            index=pd.DatetimeIndex([], tz="UTC", name="timestamp"),
+        )
+
+    # The frame's columns are views of the mapping, which outlives the file;
+    # writes through it stay private
+    buf = np.memmap(path, mode="c")
+    os.remove(path)
+
+    time = buf[: 8 * n].view("M8[ns]")
+    size = buf[8 * n : 16 * n].view("f8")
+    price = buf[16 * n : 24 * n].view("f8")
+    side = buf[24 * n : 25 * n].view("i1")
+
+    index = pd.DatetimeIndex(time, copy=False, name="timestamp").tz_localize("UTC")
+    return pd.DataFrame(
+        {
+            "symbol": pd.Categorical.from_codes(
+                np.zeros(n, dtype="i1"), [symbol], validate=False
+            ),
+            "side": pd.Categorical.from_codes(side, SIDES, validate=False),
+            "size": size,
+            "price": price,
+        },
+        index=index,
+        copy=False,
+    )
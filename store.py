@@ -0,0 +1,254 @@
+import datetime
+import json
+import os
+import zlib
+
+import ciso8601
+import pandas as pd
+
+from monthFile import MonthFile, writeMonth
+from utils import logger
+
+DATA_DIR = "data"
+DAY = 86400 * 10 ** 9
+
+
+def dayPath(date):
+    return os.path.join(DATA_DIR, date.strftime("%Y%m%d") + ".csv")
+
+
+def monthPath(date):
+    return os.path.join(DATA_DIR, date.strftime("%Y%m") + ".month")
+
+
+def manifestPath():
+    return os.path.join(DATA_DIR, "manifest.json")
+
+
+def checksum(path):
+    crc = 0
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b""):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def fileEntry(path):
+    return {"bytes": os.path.getsize(path), "crc32": checksum(path)}
+
+
+def dayEntry(file_name, symbols, first, last):
+    counts = symbols.value_counts()
+    return {
+        "file": file_name,
+        "symbols": {symbol: int(n) for symbol, n in counts.items()},
+        "trades": int(counts.sum()),
+        "first": first,
+        "last": last,
+    }
+
+
+def loadManifest():
+    try:
+        with open(manifestPath()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return rebuildManifest()
+
+
+def saveManifest(manifest):
+    # Written aside and renamed over, a crash leaves the old manifest whole
+    path = manifestPath()
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def rebuildManifest():
+    # Stores from before the manifest are described once by reading every file
+    manifest = {"days": {}, "files": {}}
+    for file_name in sorted(os.listdir(DATA_DIR)):
+        path = os.path.join(DATA_DIR, file_name)
+        if file_name.endswith(".csv"):
+            days = [ciso8601.parse_datetime(file_name[:-4]).date()]
+        elif file_name.endswith(".month"):
+            days = MonthFile(path).days()
+        else:
+            continue
+
+        try:
+            frames = [readDay(date) for date in days]
+        except Exception as e:
+            logger.debug("Store | Skipped unreadable {} --- {}".format(file_name, e))
+            continue
+
+        for date, df in zip(days, frames):
+            first = df.index[0].isoformat() if len(df) else None
+            last = df.index[-1].isoformat() if len(df) else None
+            manifest["days"][date.strftime("%Y%m%d")] = dayEntry(
+                file_name, df.symbol, first, last
+            )
+        manifest["files"][file_name] = fileEntry(path)
+
+    saveManifest(manifest)
+    logger.debug("Store | Rebuilt manifest, {} days".format(len(manifest["days"])))
+    return manifest
+
+
+def listDays():
+    # Only days the manifest records are stored, a file left half written by a
+    # crash is not one of them
+    days = loadManifest()["days"]
+    return sorted(datetime.datetime.strptime(d, "%Y%m%d").date() for d in days)
+
+
+def writeDay(date, df):
+    # df is the filtered dump with its timestamp column
+    data = df.to_csv(index=False).encode()
+    path = dayPath(date)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+    file_name = os.path.basename(path)
+    manifest = loadManifest()
+    manifest["files"][file_name] = {"bytes": len(data), "crc32": zlib.crc32(data)}
+    manifest["days"][date.strftime("%Y%m%d")] = dayEntry(
+        file_name,
+        df.symbol,
+        df.timestamp.min() if len(df) else None,
+        df.timestamp.max() if len(df) else None,
+    )
+    saveManifest(manifest)
+
+
+def dropFiles(file_names):
+    # Days in bad files are forgotten, so the next update downloads them again
+    manifest = loadManifest()
+    for file_name in file_names:
+        manifest["files"].pop(file_name, None)
+        for date, entry in list(manifest["days"].items()):
+            if entry["file"] == file_name:
+                manifest["days"].pop(date)
+    saveManifest(manifest)
+
+    for file_name in file_names:
+        path = os.path.join(DATA_DIR, file_name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def hasDay(date):
+    return os.path.exists(dayPath(date))
+
+
+def readDay(date, symbol=None):
+    try:
+        df = pd.read_csv(dayPath(date), index_col=0, dtype={"timestamp": str})
+    except FileNotFoundError:
+        # Compacted away, possibly while this read was starting
+        return readMonthDay(date, symbol)
+    df.index = pd.to_datetime(df.index, format="ISO8601", utc=True).as_unit("ns")
+
+    if symbol is None:
+        return df
+    return df.query("symbol == '{}'".format(symbol))
+
+
+def readMonthDay(date, symbol=None):
+    path = monthPath(date)
+    if not os.path.exists(path):
+        return None
+
+    month = MonthFile(path)
+    if date not in month.days():
+        return None
+    start = pd.Timestamp(date).value
+    return month.read(start, start + DAY, symbol)
+
+
+def readRange(start, end, symbol=None):
+    # Trades in [start, end); a month file only decodes the hours in range
+    startNs = pd.Timestamp(start).value
+    endNs = pd.Timestamp(end).value
+    startTs = pd.Timestamp(startNs, tz="UTC")
+    endTs = pd.Timestamp(endNs, tz="UTC")
+
+    parts = []
+    months = set()
+    date = startTs.date()
+    while date <= (endTs - pd.Timedelta(1)).date():
+        if hasDay(date):
+            df = readDay(date, symbol)
+            i = df.index.searchsorted(startTs)
+            j = df.index.searchsorted(endTs)
+            parts.append(df.iloc[i:j])
+        else:
+            path = monthPath(date)
+            if path not in months and os.path.exists(path):
+                months.add(path)
+                parts.append(MonthFile(path).read(startNs, endNs, symbol))
+        date += datetime.timedelta(1)
+
+    if not parts:
+        return None
+    return pd.concat(parts)
+
+
+def compactMonth(month, codec=None):
+    manifest = loadManifest()
+    days = [
+        datetime.datetime.strptime(d, "%Y%m%d").date()
+        for d, entry in sorted(manifest["days"].items())
+        if d.startswith(month.strftime("%Y%m")) and entry["file"].endswith(".csv")
+    ]
+    if not days:
+        return 0
+
+    # Days stored late are merged with what the month already holds; a month
+    # file a crash left behind may hold some of these days already
+    path = monthPath(month)
+    frames = []
+    if os.path.exists(path):
+        df = MonthFile(path).read(0, 2 ** 63 - 1)
+        frames.append(df[~df.index.floor("D").isin(pd.DatetimeIndex(days, tz="UTC"))])
+    frames += [readDay(d) for d in days]
+
+    # Readers see either the days or the whole month, never a partial file
+    writeMonth(path + ".tmp", pd.concat(frames), codec)
+    os.replace(path + ".tmp", path)
+
+    file_name = os.path.basename(path)
+    manifest["files"][file_name] = fileEntry(path)
+    for d in days:
+        manifest["days"][d.strftime("%Y%m%d")]["file"] = file_name
+        manifest["files"].pop(os.path.basename(dayPath(d)), None)
+    saveManifest(manifest)
+
+    for d in days:
+        os.remove(dayPath(d))
+
+    logger.debug("Store | Compacted {} days into {}".format(len(days), path))
+    return len(days)
+
+
+def closedMonths():
+    # Months with day files left; a month is closed once the next has started,
+    # its days no longer change
+    current = datetime.datetime.now(datetime.timezone.utc).date().replace(day=1)
+    months = sorted(
+        {
+            datetime.datetime.strptime(d[:6], "%Y%m").date()
+            for d, entry in loadManifest()["days"].items()
+            if entry["file"].endswith(".csv")
+        }
+    )
+    return [month for month in months if month < current]
+
+
+def compact():
+    return sum(compactMonth(month) for month in closedMonths())
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from alerts import ABOVE, BELOW, MOVE, VOLUME, AlertEngine, makeRules, parseRule
+
+
+def test_parse_rule():
+    assert parseRule("above 65k") == (ABOVE, 65000.0, 0.0, 60.0)
+    assert parseRule("move -2% 5m") == (MOVE, -0.02, 300.0, 60.0)
+    assert parseRule("volume 5M 60s") == (VOLUME, 5e6, 60.0, 60.0)
+
+
+@pytest.mark.parametrize(
+    "text", ["", "   ", "above", "move 1%", "volume", "bogus 1", "move 0% 60s"]
+)
+def test_parse_rule_rejects_bad_input(text):
+    with pytest.raises(ValueError):
+        parseRule(text)
+
+
+def batch(prices, start="2020-01-01"):
+    index = pd.Timestamp(start, tz="UTC") + pd.to_timedelta(
+        np.arange(len(prices)), "s"
+    )
+    return pd.DataFrame(
+        {"side": "Buy", "size": 1.0, "price": np.array(prices, dtype="f8")},
+        index=index,
+    )
+
+
+def engine(rules):
+    engine = AlertEngine()
+    engine.setRules(makeRules(rules))
+    engine.reset("XBTUSD")
+    return engine
+
+
+@pytest.mark.parametrize(
+    "last, prices, kind, crossing",
+    [
+        (101, [99, 101], BELOW, 99),
+        (99, [101, 99], ABOVE, 101),
+        (101, [102, 99, 101], BELOW, 99),
+        (99, [98, 100.5, 97], ABOVE, 100.5),
+        # Crossed back before the batch ends, the batch starts on the far side
+        (101, [99, 101], ABOVE, 101),
+        (99, [101, 99], BELOW, 99),
+    ],
+)
+def test_crossing_inside_batch(last, prices, kind, crossing):
+    alerts = engine([(0, kind, 100.0, 0.0, 60.0)])
+    alerts.evaluate(batch([last]))
+    events = alerts.evaluate(batch(prices, "2020-01-01 00:01"))
+    assert [(e[0], e[3]) for e in events] == [(0, crossing)]
+
+
+def test_crossings_match_trade_by_trade_scan():
+    rng = np.random.default_rng(0)
+    prices = 100 + rng.standard_normal(2000).cumsum()
+    levels = np.linspace(prices.min(), prices.max(), 50)
+    rules = [(i, ABOVE, level, 0.0, 0.0) for i, level in enumerate(levels)]
+    rules += [(50 + i, BELOW, level, 0.0, 0.0) for i, level in enumerate(levels)]
+    alerts = engine(rules)
+
+    df = batch(prices)
+    found = set()
+    for start in range(0, len(df), 97):
+        found.update((e[0], e[2]) for e in alerts.evaluate(df.iloc[start : start + 97]))
+
+    # Every step across a level fires, cooldowns are off
+    seconds = df.index.values.astype("datetime64[ns]").astype("i8") / 1e9
+    expected = set()
+    for start in range(0, len(df), 97):
+        chunk = prices[start : start + 97]
+        before = np.concatenate([[prices[max(start - 1, 0)]], chunk[:-1]])
+        for i, level in enumerate(levels):
+            up = np.flatnonzero((before < level) & (chunk >= level))
+            down = np.flatnonzero((before > level) & (chunk <= level))
+            if len(up):
+                expected.add((i, seconds[start + up[0]]))
+            if len(down):
+                expected.add((50 + i, seconds[start + down[0]]))
+    assert found == expected
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+
+import pandas as pd
+
+from asyncClient import AsyncDataClient
+
+
+class FakeService(object):
+    def __init__(self):
+        super().__init__()
+        self.symbols = ["XBTUSD"]
+        self.feeds = {"XBTUSD": object()}
+        self.threads = set()
+        self.closed = False
+        self.unsubscribed = False
+        self.arrived = threading.Event()
+        self.df = pd.DataFrame(
+            {"price": [1.0, 2.0]},
+            index=pd.date_range("2020-01-01", periods=2, freq="1h", tz="UTC"),
+        )
+
+    def called(self):
+        self.threads.add(threading.current_thread())
+
+    def loadRange(self, *args):
+        self.called()
+        return []
+
+    def trades(self, keys):
+        self.called()
+        return self.df.iloc[:0]
+
+    def bars(self, keys, interval):
+        self.called()
+        return self.df.iloc[:0]
+
+    def live(self, symbol):
+        self.called()
+        return self.df
+
+    def waitLive(self, symbol, cursor, timeout=None):
+        self.called()
+        self.arrived.wait(timeout)
+        self.arrived.clear()
+        return self.df.iloc[cursor:], len(self.df)
+
+    def liveBars(self, symbol, interval):
+        self.called()
+        return self.df
+
+    def subscribe(self, symbol):
+        self.called()
+
+    def unsubscribe(self, symbol):
+        self.called()
+        self.unsubscribed = True
+
+    def close(self):
+        self.called()
+        self.closed = True
+
+
+def test_blocking_calls_leave_the_loop_and_owned_service_closes():
+    service = FakeService()
+
+    async def main():
+        client = AsyncDataClient(service, period=0.01, owned=True)
+        startDt, endDt = service.df.index[0], service.df.index[-1]
+        assert len(await client.trades("XBTUSD", startDt, endDt)) == 2
+        assert len(await client.ohlc("XBTUSD", "1H", startDt, endDt)) == 2
+
+        bars = client.bars("XBTUSD", "1H")
+        assert len(await bars.__anext__()) == 2
+        await bars.aclose()
+        await client.close()
+        return threading.current_thread()
+
+    loopThread = asyncio.run(main())
+    assert service.threads and loopThread not in service.threads
+    assert service.unsubscribed and service.closed
+
+
+def test_close_leaves_a_shared_service_open():
+    service = FakeService()
+
+    async def main():
+        async with AsyncDataClient(service):
+            pass
+
+    asyncio.run(main())
+    assert not service.closed
+
+
+def test_bars_are_pushed_when_trades_arrive():
+    service = FakeService()
+
+    async def main():
+        client = AsyncDataClient(service, period=1.0)
+        bars = client.bars("XBTUSD", "1h")
+        assert len(await bars.__anext__()) == 2
+
+        # Nothing new yet, the stream waits instead of yielding the same bars
+        pending = asyncio.ensure_future(bars.__anext__())
+        await asyncio.sleep(0.1)
+        assert not pending.done()
+
+        service.df = pd.concat([service.df, service.df.shift(2, freq="1h")])
+        service.arrived.set()
+        assert len(await asyncio.wait_for(pending, 0.5)) == 4
+        await bars.aclose()
+        await client.close()
+
+    asyncio.run(main())
@@ -0,0 +1,321 @@
+import datetime
+import queue
+import threading
+from multiprocessing import Queue
+from time import sleep, time
+
+import pandas as pd
+import pytest
+
+import store
+from database import Database, DataService, LiveFeed
+
+
+def readerService():
+    # Only what readDataProcess touches, no processes are started
+    service = DataService.__new__(DataService)
+    service.workers = 1
+    service.dumpCheck = 0.01
+    service.jobQ = Queue()
+    service.doneQ = Queue()
+    service.compactStep = lambda: False
+    return service
+
+
+def waitFor(condition, timeout=5.0):
+    deadline = time() + timeout
+    while not condition():
+        assert time() < deadline
+        sleep(0.01)
+
+
+def test_reader_survives_failed_update():
+    service = readerService()
+    calls = []
+
+    def update():
+        calls.append(1)
+        raise OSError("download failed")
+
+    service.updateHistoricalDataProcess = update
+    info = Queue()
+    ohlcQ = Queue()
+    reader = threading.Thread(target=service.readDataProcess, args=(info, ohlcQ))
+    reader.start()
+    try:
+        assert ohlcQ.get(timeout=5) is None
+        waitFor(lambda: len(calls) >= 2)
+
+        key = ("XBTUSD", datetime.date(2020, 1, 1))
+        info.put([[key], [], "1H"])
+        assert service.jobQ.get(timeout=5) == [key, "1H"]
+        service.doneQ.put([key, "handle", None])
+        assert ohlcQ.get(timeout=5) == ["XBTUSD", key[1], "handle", None]
+    finally:
+        info.put(None)
+        reader.join(5)
+    assert not reader.is_alive()
+
+
+def test_reader_is_ready_before_compacting():
+    service = readerService()
+    service.updateHistoricalDataProcess = lambda: 0
+    months = [datetime.date(2020, 1, 1), datetime.date(2020, 2, 1)]
+    compacted = []
+
+    def compactStep():
+        compacted.append(months.pop(0))
+        return bool(months)
+
+    service.compactStep = compactStep
+    info = Queue()
+    ohlcQ = Queue()
+    reader = threading.Thread(target=service.readDataProcess, args=(info, ohlcQ))
+    reader.start()
+    try:
+        assert ohlcQ.get(timeout=5) is None
+        assert not compacted
+
+        # A request that arrives first is served before any month is compacted
+        key = ("XBTUSD", datetime.date(2020, 3, 1))
+        info.put([[key], [], "1H"])
+        assert service.jobQ.get(timeout=5) == [key, "1H"]
+        service.doneQ.put([key, "handle", None])
+        assert ohlcQ.get(timeout=5)[0] == "XBTUSD"
+        waitFor(lambda: len(compacted) == 2)
+    finally:
+        info.put(None)
+        reader.join(5)
+    assert not reader.is_alive()
+
+
+def test_decoder_answers_bad_day_as_missing(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "DATA_DIR", str(tmp_path))
+    bad = datetime.date(2020, 1, 1)
+    with open(store.dayPath(bad), "wb") as f:
+        f.write(b"\x00\xff not a day")
+
+    service = DataService.__new__(DataService)
+    service.spillDir = str(tmp_path)
+    jobQ = queue.Queue()
+    doneQ = Queue()
+    missing = datetime.date(2020, 1, 2)
+    jobQ.put([("XBTUSD", bad), "1h"])
+    jobQ.put([("XBTUSD", missing), "1h"])
+    jobQ.put(None)
+
+    decoder = threading.Thread(target=service.decodeDayProcess, args=(jobQ, doneQ))
+    decoder.start()
+    decoder.join(5)
+    assert not decoder.is_alive()
+    assert doneQ.get(timeout=5) == [("XBTUSD", bad), None, None]
+    assert doneQ.get(timeout=5) == [("XBTUSD", missing), None, None]
+
+
+def trades(start, n):
+    index = pd.date_range(start, periods=n, freq="1h", tz="UTC")
+    return pd.DataFrame(
+        {"symbol": "XBTUSD", "side": "Buy", "size": 1.0, "price": range(n)},
+        index=index,
+    )
+
+
+def test_live_cursor_survives_watermark_trim():
+    service = DataService.__new__(DataService)
+    service.lock = threading.RLock()
+    service.replay = None
+    service.days = []
+    feed = LiveFeed(None, queue.Queue(), None)
+    feed.df = trades("2020-01-01 12:00", 24)
+    service.feeds = {"XBTUSD": feed}
+
+    df, cursor = service.liveSince("XBTUSD", 0)
+    assert len(df) == 24 and cursor == 24
+
+    # The first day is stored, its 12 trades leave the live frame while two
+    # new ones arrive; only the new ones are after the cursor
+    feed.pending.append(trades("2020-01-02 12:00", 2))
+    service.days = [datetime.date(2020, 1, 1)]
+    df, cursor = service.liveSince("XBTUSD", cursor)
+    assert list(df.index) == list(trades("2020-01-02 12:00", 2).index)
+    assert cursor == 26
+    assert len(feed.df) == 14
+
+    df, cursor = service.liveSince("XBTUSD", cursor)
+    assert not len(df) and cursor == 26
+
+
+def test_live_sizes_extend_a_copy():
+    service = DataService.__new__(DataService)
+    service.lock = threading.RLock()
+    service.replay = None
+    service.days = []
+    feed = LiveFeed(None, queue.Queue(), None)
+    feed.df = trades("2020-01-01 12:00", 24)
+    service.feeds = {"XBTUSD": feed}
+
+    first = service.liveSizes("XBTUSD")
+    assert len(first) == 24 and feed.sizes is first
+    assert service.liveSizes("XBTUSD") is first
+
+    # New trades extend a copy, callers still holding the old index keep it
+    feed.pending.append(trades("2020-01-02 12:00", 2))
+    service.live("XBTUSD")
+    second = service.liveSizes("XBTUSD")
+    assert len(first) == 24 and len(second) == 26
+    assert feed.sizes is second and feed.sizesSeen == 26
+
+
+def alertService():
+    service = DataService.__new__(DataService)
+    service.lock = threading.RLock()
+    service.alertRules = {}
+    service.feeds = {"XBTUSD": LiveFeed(Queue(1), queue.Queue(), None)}
+    return service
+
+
+def test_alert_rules_replace_a_waiting_update():
+    service = alertService()
+    info = service.feeds["XBTUSD"].info
+
+    t = time()
+    assert service.setAlerts("XBTUSD", "first")
+    assert service.setAlerts("XBTUSD", "second")
+    assert time() - t < 0.5
+    assert info.get(timeout=1) == [None, "second"]
+    assert service.alertRules["XBTUSD"] == "second"
+
+
+def test_alert_rules_keep_a_waiting_start():
+    service = alertService()
+    info = service.feeds["XBTUSD"].info
+    info.put(["XBTUSD", None])
+
+    assert service.setAlerts("XBTUSD", "rules")
+    assert info.get(timeout=1) == ["XBTUSD", "rules"]
+
+
+def test_alert_rules_wait_for_a_feed():
+    service = alertService()
+    assert service.setAlerts("ETHUSD", "rules")
+    assert service.alertRules["ETHUSD"] == "rules"
+
+
+class ProfileService(object):
+    def __init__(self, history, live):
+        self.history = history
+        self.live = live
+
+    def loadRange(self, db, symbol, startDate, endDate, direction, interval=None):
+        return []
+
+    def trades(self, keys):
+        return self.history
+
+    def liveSince(self, symbol, cursor):
+        return self.live.iloc[cursor:], len(self.live)
+
+
+def profileDatabase(interval, history, live, bars):
+    db = Database.__new__(Database)
+    db.symbols = ["XBTUSD"]
+    db.index = 0
+    db.interval = interval
+    db.service = ProfileService(history, live)
+    db.ohlc = pd.DataFrame({"open": 1.0}, index=bars)
+    db.liveOhlc = pd.DataFrame()
+    return db
+
+
+def utc(text):
+    return pd.Timestamp(text, tz="UTC").to_pydatetime()
+
+
+def test_profile_of_one_time_bar_spans_the_interval():
+    history = trades("2020-01-01 00:00", 3).set_index(
+        pd.date_range("2020-01-01 00:00", periods=3, freq="20min", tz="UTC")
+    )
+    bars = pd.date_range("2020-01-01", periods=1, freq="1h", tz="UTC")
+    db = profileDatabase("1h", history, history.iloc[:0], bars)
+
+    hist, seen, end = db.volumeOnPrice(utc("2020-01-01"), utc("2020-01-01"), 3)
+    assert end == pd.Timestamp("2020-01-01 01:00", tz="UTC")
+    assert hist.toFrame().to_numpy().sum() == 3
+    assert seen is None
+
+
+def test_profile_of_trade_bars_ends_at_the_next_bar():
+    history = trades("2020-01-01 00:00:00.300", 6)
+    bars = history.index[[0, 2, 4]]
+    db = profileDatabase("tick:2", history, history.iloc[:0], bars)
+
+    # Picked to the second, the bar opening within it is the last one
+    hist, seen, end = db.volumeOnPrice(utc("2020-01-01"), bars[1].floor("s"), 6)
+    assert end == bars[2]
+    assert hist.toFrame().to_numpy().sum() == 4
+
+    # The forming bar has no end yet and follows the feed
+    live = trades("2020-01-01 06:00", 2)
+    db = profileDatabase("tick:2", history, live, bars)
+    hist, seen, end = db.volumeOnPrice(utc("2020-01-01"), bars[2].floor("s"), 6)
+    assert end is None and seen == 2
+    assert hist.toFrame().to_numpy().sum() == 8
+
+
+class DeadProcess(object):
+    def is_alive(self):
+        return False
+
+
+def feedService():
+    service = DataService.__new__(DataService)
+    service.lock = threading.RLock()
+    service.traded = threading.Condition(service.lock)
+    service.replay = None
+    service.days = []
+    service.feeds = {}
+    return service
+
+
+def test_receiver_wakes_waiting_consumers():
+    service = feedService()
+    feed = LiveFeed(None, Queue(), None)
+    service.feeds["XBTUSD"] = feed
+    feed.receiver = threading.Thread(target=service.receiveLive, args=(feed,))
+    feed.receiver.start()
+    try:
+        feed.queue.put(trades("2020-01-01 12:00", 3))
+        assert feed.ready.wait(5)
+        df, cursor = service.waitLive("XBTUSD", 0, 5)
+        assert len(df) == 3 and cursor == 3
+
+        result = []
+        waiter = threading.Thread(
+            target=lambda: result.append(service.waitLive("XBTUSD", cursor, 10))
+        )
+        waiter.start()
+        sleep(0.1)
+        assert not result
+
+        t = time()
+        feed.queue.put(trades("2020-01-01 15:00", 2))
+        waiter.join(5)
+        assert time() - t < 1
+        df, cursor = result[0]
+        assert len(df) == 2 and cursor == 5
+    finally:
+        service.stopReceiver(feed)
+    assert not feed.receiver.is_alive()
+
+
+def test_subscribe_reports_a_feed_that_died():
+    service = feedService()
+    feed = LiveFeed(None, Queue(), DeadProcess())
+    feed.refs = 1
+    service.feeds["XBTUSD"] = feed
+
+    t = time()
+    with pytest.raises(RuntimeError, match="XBTUSD"):
+        service.subscribe("XBTUSD", timeout=30)
+    assert time() - t < 5
+    assert feed.refs == 1
@@ -0,0 +1,82 @@
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import exportOhlcv
+import store
+from aggregator import flowBars, mergeBars
+
+
+def makeTrades(start, days, perDay=20000, seed=0):
+    rng = np.random.default_rng(seed)
+    n = days * perDay
+    index = pd.Timestamp(start, tz="UTC") + pd.to_timedelta(
+        np.sort(rng.integers(0, days * 86400 * 10 ** 9, n)), "ns"
+    )
+    return pd.DataFrame(
+        {
+            "symbol": "XBTUSD",
+            "side": rng.choice(["Buy", "Sell"], n),
+            "size": rng.integers(1, 1000, n).astype("f8"),
+            "price": 10000 + rng.standard_normal(n).cumsum(),
+        },
+        index=index.rename("timestamp"),
+    )
+
+
+@pytest.mark.parametrize("interval", ["50min", "7min", "1h"])
+def test_export_matches_single_resample(monkeypatch, interval):
+    start = datetime.date(2020, 1, 1)
+    trades = makeTrades(start, 3)
+    days = {d: df for d, df in trades.groupby(trades.index.date)}
+    monkeypatch.setattr(exportOhlcv.store, "readDay", lambda date: days.get(date))
+
+    origin = pd.Timestamp(start, tz="UTC")
+    parts = [
+        exportOhlcv.aggregateDay((d, ["XBTUSD"], [interval], origin))[1][
+            ("XBTUSD", interval)
+        ]
+        for d in sorted(days)
+    ]
+    merged = mergeBars(parts, interval, origin)
+
+    expected = flowBars(trades, interval, origin)
+    pd.testing.assert_frame_equal(merged, expected, check_freq=False)
+
+    ohlc = trades.price.resample(interval).ohlc()
+    np.testing.assert_allclose(merged[["open", "high", "low", "close"]], ohlc)
+    np.testing.assert_allclose(merged.volume, trades["size"].resample(interval).sum())
+
+
+def test_export_reads_the_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "DATA_DIR", str(tmp_path))
+    start = datetime.date(2020, 1, 1)
+    trades = makeTrades(start, 2, perDay=2000)
+    for d, df in trades.groupby(trades.index.date):
+        day = df.reset_index()
+        day["timestamp"] = day.timestamp.map(pd.Timestamp.isoformat)
+        store.writeDay(d, day)
+
+    out = str(tmp_path / "export")
+    end = start + datetime.timedelta(1)
+    exportOhlcv.export(["XBTUSD"], ["1h"], start, end, out, "npy", workers=1)
+
+    bars = np.load(os.path.join(out, "XBTUSD_1h_20200101_20200102.npy"))
+    expected = flowBars(trades, "1h", pd.Timestamp(start, tz="UTC"))
+    assert len(bars) == 48
+    np.testing.assert_array_equal(
+        bars["timestamp"], expected.index.values.astype("datetime64[ns]").astype("i8")
+    )
+    np.testing.assert_allclose(bars["close"], expected.close)
+    np.testing.assert_allclose(bars["volume"], expected.volume)
+
+
+def test_parquet_without_engine_fails_up_front(tmp_path, monkeypatch):
+    monkeypatch.setattr(exportOhlcv, "hasParquetEngine", lambda: False)
+    monkeypatch.setattr(store, "listDays", lambda: pytest.fail("decoded days"))
+    start = datetime.date(2020, 1, 1)
+    with pytest.raises(RuntimeError, match="pyarrow"):
+        exportOhlcv.export(["XBTUSD"], ["1h"], start, start, str(tmp_path), "parquet")
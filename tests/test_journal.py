@@ -0,0 +1,73 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import journal
+from journal import MAGIC, RECORD, TradeJournal
+
+
+@pytest.fixture
+def tradeJournal(tmp_path, monkeypatch):
+    monkeypatch.setattr(journal, "JOURNAL_DIR", str(tmp_path))
+    return TradeJournal("XBTUSD")
+
+
+def trades(start, count):
+    index = pd.date_range(start, periods=count, freq="s", tz="UTC")
+    return pd.DataFrame(
+        {
+            "side": ["Buy", "Sell"] * (count // 2) + ["Buy"] * (count % 2),
+            "size": np.arange(1, count + 1, dtype="f8"),
+            "price": np.full(count, 100.0),
+            "trdMatchID": [
+                "00000000-0000-0000-0000-{:012d}".format(i) for i in range(count)
+            ],
+        },
+        index=index.rename("timestamp"),
+    )
+
+
+def test_recover_round_trip(tradeJournal):
+    tradeJournal.append(trades("2026-10-19 10:00", 5))
+    tradeJournal.close()
+
+    df = TradeJournal("XBTUSD").recover(pd.Timestamp("2026-10-19", tz="UTC"))
+    assert len(df) == 5
+    assert df["size"].tolist() == [1.0, 2.0, 3.0, 4.0, 5.0]
+
+
+def test_foreign_file_is_moved_aside(tradeJournal):
+    path = tradeJournal.path(pd.Timestamp("2026-10-19").date())
+    with open(path, "wb") as f:
+        f.write(b"NOTAJRNL" + np.zeros(3, dtype=RECORD).tobytes())
+
+    df = tradeJournal.recover(pd.Timestamp("2026-10-19", tz="UTC"))
+    assert df.empty
+    assert not os.path.exists(path)
+    assert os.path.exists(path + ".bad")
+
+
+def test_append_does_not_extend_foreign_file(tradeJournal):
+    path = tradeJournal.path(pd.Timestamp("2026-10-19").date())
+    with open(path, "wb") as f:
+        f.write(b"garbage!")
+
+    tradeJournal.append(trades("2026-10-19 10:00", 3))
+    tradeJournal.close()
+
+    with open(path, "rb") as f:
+        assert f.read(len(MAGIC)) == MAGIC
+    df = TradeJournal("XBTUSD").recover(pd.Timestamp("2026-10-19", tz="UTC"))
+    assert len(df) == 3
+
+
+def test_torn_header_starts_over(tradeJournal):
+    path = tradeJournal.path(pd.Timestamp("2026-10-19").date())
+    with open(path, "wb") as f:
+        f.write(MAGIC[:3])
+
+    assert tradeJournal.recover(pd.Timestamp("2026-10-19", tz="UTC")).empty
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + ".bad")
@@ -0,0 +1,28 @@
+import pandas as pd
+
+from replay import ReplayStats
+
+
+def batch(sentAt, bars):
+    df = pd.DataFrame({"price": [1.0]})
+    df.attrs = {"sentAt": sentAt, "bars": bars}
+    return df
+
+
+def test_merged_batches_count_as_dropped():
+    stats = ReplayStats(None)
+    stats.received(batch(0.0, 1))
+    stats.rendered()
+    assert stats.dropped == 0
+
+    # Three batches arrived between two renders, only the last was drawn
+    for bars in (2, 3, 4):
+        stats.received(batch(0.0, bars))
+    stats.rendered()
+    assert stats.dropped == 2
+
+    stats.rendered()
+    assert stats.dropped == 2
+
+    stats.reset()
+    assert stats.dropped == 0
@@ -0,0 +1,43 @@
+import datetime
+
+import pandas as pd
+import pytest
+
+import store
+
+DAY = datetime.date(2026, 10, 16)
+CSV = """timestamp,symbol,side,size,price
+2026-10-16T00:00:01.420000+00:00,ETHUSD,Sell,2811,400.0
+2026-10-16T00:00:06.859000+00:00,XBTUSD,Buy,2390,10000.0
+2026-10-16T00:00:09.331000+00:00,XBTUSD,Sell,380,10000.5
+"""
+
+
+@pytest.fixture
+def dataDir(tmp_path, monkeypatch):
+    monkeypatch.setattr(store, "DATA_DIR", str(tmp_path))
+    with open(store.dayPath(DAY), "w") as f:
+        f.write(CSV)
+    return tmp_path
+
+
+def test_read_day_parses_timestamps(dataDir):
+    df = store.readDay(DAY)
+    assert len(df) == 3
+    assert df.index.name == "timestamp"
+    assert str(df.index.tz) == "UTC"
+    # Nanoseconds like month reads, so the two concatenate and compare exactly
+    assert df.index.unit == "ns"
+    assert df.index[0] == pd.Timestamp("2026-10-16 00:00:01.42", tz="UTC")
+    assert df.index.is_monotonic_increasing
+
+
+def test_read_day_filters_symbol(dataDir):
+    df = store.readDay(DAY, "XBTUSD")
+    assert df.price.tolist() == [10000.0, 10000.5]
+
+
+def test_rebuilt_manifest_reads_csv_days(dataDir):
+    manifest = store.rebuildManifest()
+    assert manifest["days"]["20261016"]["symbols"] == {"ETHUSD": 1, "XBTUSD": 2}
+    assert store.listDays() == [DAY]
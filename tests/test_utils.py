@@ -0,0 +1,42 @@
+import pytest
+from pandas.tseries.frequencies import to_offset
+
+from utils import toInterval
+from visualizer import Visualizer
+
+
+@pytest.mark.parametrize(
+    "text, interval",
+    [
+        ("5s", "5s"),
+        ("1m", "1min"),
+        ("45m", "45min"),
+        ("4h", "4h"),
+        ("1D", "1D"),
+        ("1W", "1W"),
+        ("1M", "1MS"),
+    ],
+)
+def test_toolbar_labels_are_pandas_aliases(text, interval):
+    assert toInterval(text) == interval
+    to_offset(interval)
+
+
+def test_trade_labels():
+    assert toInterval("2.5k ticks") == "tick:2500"
+    assert toInterval("1M volume") == "volume:1e+06"
+
+
+@pytest.mark.parametrize(
+    "interval, fmt",
+    [
+        ("5s", "%d %b '%y  %H:%M:%S"),
+        ("1min", "%d %b '%y  %H:%M"),
+        ("4h", "%d %b '%y  %H:%M"),
+        ("1D", "%d %b '%y"),
+        ("1MS", "%d %b '%y"),
+        ("tick:1000", "%d %b '%y  %H:%M:%S"),
+    ],
+)
+def test_date_format_follows_interval(interval, fmt):
+    assert Visualizer.getDateFormat(None, interval) == fmt
@@ -0,0 +1,78 @@
+import numpy as np
+
+
+class Timeline(object):
+    def __init__(self, toSeconds):
+        super().__init__()
+        # History rows before the watermark and live rows from it share one
+        # buffer, seconds in column 0, so a query is a slice instead of a concat
+        self.toSeconds = toSeconds
+        self.watermark = None
+        self.buffer = np.empty((0, 0))
+        self.split = 0
+        self.n = 0
+
+        self.liveFirst = None
+        self.liveRows = 0
+
+    def rows(self, frame):
+        rows = np.empty((len(frame), len(frame.columns) + 1))
+        rows[:, 0] = self.toSeconds(frame.index)
+        rows[:, 1:] = frame.to_numpy(dtype="f8")
+        return rows
+
+    def clear(self):
+        self.watermark = None
+        self.buffer = np.empty((0, 0))
+        self.split = 0
+        self.n = 0
+        self.liveFirst = None
+        self.liveRows = 0
+
+    def setHistory(self, frame, watermark):
+        if watermark is not None:
+            frame = frame.iloc[: frame.index.searchsorted(watermark)]
+
+        # A new buffer, slices handed out earlier keep the rows they were given
+        self.watermark = watermark
+        self.buffer = self.rows(frame)
+        self.split = self.n = len(self.buffer)
+        self.liveFirst = None
+        self.liveRows = 0
+
+    def setLive(self, frame):
+        if self.watermark is not None:
+            frame = frame.iloc[frame.index.searchsorted(self.watermark) :]
+
+        if not len(frame):
+            self.n = self.split
+            self.liveFirst = None
+            self.liveRows = 0
+            return
+
+        # Closed live bars never change, only the forming bar and the ones
+        # after it are written
+        start = 0
+        if frame.index[0] == self.liveFirst:
+            start = min(max(self.liveRows - 1, 0), len(frame))
+        end = self.split + len(frame)
+
+        columns = len(frame.columns) + 1
+        if end > len(self.buffer) or self.buffer.shape[1] != columns:
+            buffer = np.empty((max(end, 2 * len(self.buffer)), columns))
+            if self.split + start:
+                buffer[: self.split + start] = self.buffer[: self.split + start]
+            self.buffer = buffer
+        self.buffer[self.split + start : end] = self.rows(frame.iloc[start:])
+
+        self.n = end
+        self.liveFirst = frame.index[0]
+        self.liveRows = len(frame)
+
+    def between(self, startTs=None, endTs=None):
+        data = self.buffer[: self.n]
+        if startTs is None:
+            return data
+
+        t = data[:, 0]
+        return data[t.searchsorted(startTs) : t.searchsorted(endTs, side="right")]
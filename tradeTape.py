@@ -0,0 +1,194 @@
+import datetime
+
+import numpy as np
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+from utils import logger
+
+
+class TradeBuffer(object):
+    def __init__(self, capacity=1024):
+        super().__init__()
+        self.n = 0
+        self.time = np.empty(capacity)
+        self.buy = np.empty(capacity, dtype=bool)
+        self.size = np.empty(capacity)
+        self.price = np.empty(capacity)
+
+    def __len__(self):
+        return self.n
+
+    def append(self, df):
+        k = len(df)
+        if not k:
+            return
+        if self.n + k > len(self.time):
+            # Doubling keeps live appends amortised to the batch size
+            capacity = max(2 * len(self.time), self.n + k)
+            for name in ("time", "buy", "size", "price"):
+                array = getattr(self, name)
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[: self.n] = array[: self.n]
+                setattr(self, name, grown)
+
+        end = self.n + k
+        self.time[self.n : end] = (
+            df.index.values.astype("datetime64[ns]").astype("int64") / 1e9
+        )
+        self.buy[self.n : end] = (df.side == "Buy").to_numpy()
+        self.size[self.n : end] = df["size"].to_numpy(dtype="f8")
+        self.price[self.n : end] = df.price.to_numpy(dtype="f8")
+        self.n = end
+
+
+class TradeTableModel(QtCore.QAbstractTableModel):
+    headers = ["Time", "Side", "Size", "Price"]
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.trades = TradeBuffer()
+        self.buyBrush = QtGui.QBrush(QtGui.QColor(0, 200, 0))
+        self.sellBrush = QtGui.QBrush(QtGui.QColor(230, 0, 0))
+        self.alignRight = int(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.trades)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else 4
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        # Newest trade on top; cells are formatted only when the view asks
+        i = len(self.trades) - 1 - index.row()
+        column = index.column()
+        trades = self.trades
+
+        if role == QtCore.Qt.DisplayRole:
+            if column == 0:
+                dt = datetime.datetime.fromtimestamp(trades.time[i])
+                return dt.strftime("%H:%M:%S.%f")[:-3]
+            elif column == 1:
+                return "Buy" if trades.buy[i] else "Sell"
+            elif column == 2:
+                return "{:,.0f}".format(trades.size[i])
+            else:
+                return "{:,.2f}".format(trades.price[i])
+        elif role == QtCore.Qt.ForegroundRole and column:
+            return self.buyBrush if trades.buy[i] else self.sellBrush
+        elif role == QtCore.Qt.TextAlignmentRole and column >= 2:
+            return self.alignRight
+
+        return None
+
+    def setTrades(self, df):
+        self.beginResetModel()
+        self.trades = TradeBuffer(max(1024, len(df)))
+        self.trades.append(df)
+        self.endResetModel()
+
+    def appendTrades(self, df):
+        if not len(df):
+            return
+
+        # New rows go in at the top without a model reset, so the view keeps
+        # its scroll position and selection
+        self.beginInsertRows(QtCore.QModelIndex(), 0, len(df) - 1)
+        self.trades.append(df)
+        self.endInsertRows()
+
+
+class TradeTape(QtWidgets.QWidget):
+    def __init__(self, parent, visualizer):
+        super().__init__(parent)
+        self.visualizer = visualizer
+        self.db = visualizer.db
+        self.live = True
+        self.symbol = None
+        self.seen = 0
+
+        self.model = TradeTableModel(self)
+        self.view = QtWidgets.QTableView(self)
+        self.view.setModel(self.model)
+        self.view.verticalHeader().hide()
+        self.view.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        self.view.verticalHeader().setDefaultSectionSize(18)
+        # Sizing to contents would measure rows, the widest time is known
+        header = self.view.horizontalHeader()
+        header.setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
+        header.setSectionResizeMode(0, QtWidgets.QHeaderView.Fixed)
+        header.resizeSection(
+            0, self.view.fontMetrics().horizontalAdvance("00:00:00.000") + 12
+        )
+        self.view.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+
+        self.label = QtWidgets.QLabel("Live", self)
+        self.btnLive = QtWidgets.QPushButton("Live", self)
+        self.btnLive.clicked.connect(self.btnLiveClicked)
+
+        top = QtWidgets.QHBoxLayout()
+        top.addWidget(self.label)
+        top.addStretch()
+        top.addWidget(self.btnLive)
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(top)
+        layout.addWidget(self.view)
+
+        self.showLive()
+
+    def refresh(self):
+        if not self.live:
+            return
+
+        # A symbol switch lands on a worker, the tape follows on the next tick
+        if self.symbol != self.db.liveSymbol:
+            self.showLive()
+            return
+
+        df, seen = self.db.liveTrades(self.seen)
+        if seen < self.seen:
+            self.model.setTrades(df)
+        else:
+            self.model.appendTrades(df)
+        self.seen = seen
+
+    def showLive(self):
+        self.live = True
+        self.symbol = self.db.liveSymbol
+        self.label.setText("Live")
+        df, self.seen = self.db.liveTrades(0)
+        self.model.setTrades(df)
+
+    def selectBar(self, event):
+        # Trades of the bar under the crosshair, up to the next bar's open
+        timestamp = self.visualizer.lastBarTs
+        data = self.visualizer.candlestick.data
+        if timestamp is None or data is None or not len(data):
+            return
+
+        x = data[:, 0]
+        i = x.searchsorted(timestamp, side="right")
+        if i < len(x):
+            end = x[i]
+        else:
+            end = timestamp + (self.visualizer.candlestick.step or 0)
+
+        self.live = False
+        self.model.setTrades(self.db.tradesBetween(timestamp, end))
+        self.label.setText(
+            "{} trades from {}".format(
+                len(self.model.trades),
+                datetime.datetime.fromtimestamp(timestamp).strftime("%d %b %H:%M:%S"),
+            )
+        )
+        logger.debug("Tape | {} trades".format(len(self.model.trades)))
+
+    @QtCore.pyqtSlot()
+    def btnLiveClicked(self):
+        self.showLive()
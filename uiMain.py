@@ -53,6 +53,10 @@ class Ui_MainWindow(object):
         self.cbInterval.addItem("")
         self.cbInterval.addItem("")
         self.cbInterval.addItem("")
+        self.cbInterval.addItem("")
+        self.cbInterval.addItem("")
+        self.cbInterval.addItem("")
+        self.cbInterval.addItem("")
         self.horizontalLayout.addWidget(self.cbInterval)
         spacerItem = QtWidgets.QSpacerItem(
             40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum
@@ -73,14 +77,25 @@ class Ui_MainWindow(object):
         MainWindow.setStatusBar(self.statusbar)
         self.actionVolumeProfile = QtWidgets.QAction(MainWindow)
         self.actionVolumeProfile.setObjectName("actionVolumeProfile")
+        self.actionNewChart = QtWidgets.QAction(MainWindow)
+        self.actionNewChart.setObjectName("actionNewChart")
         self.actionConsole = QtWidgets.QAction(MainWindow)
         self.actionConsole.setObjectName("actionConsole")
         self.actionVolume = QtWidgets.QAction(MainWindow)
         self.actionVolume.setCheckable(True)
         self.actionVolume.setObjectName("actionVolume")
+        self.actionVPVR = QtWidgets.QAction(MainWindow)
+        self.actionVPVR.setCheckable(True)
+        self.actionVPVR.setObjectName("actionVPVR")
+        self.actionWhales = QtWidgets.QAction(MainWindow)
+        self.actionWhales.setCheckable(True)
+        self.actionWhales.setObjectName("actionWhales")
+        self.menuTools.addAction(self.actionNewChart)
         self.menuTools.addAction(self.actionVolumeProfile)
         self.menuTools.addAction(self.actionConsole)
         self.menuIndicator.addAction(self.actionVolume)
+        self.menuIndicator.addAction(self.actionVPVR)
+        self.menuIndicator.addAction(self.actionWhales)
         self.menubar.addAction(self.menuTools.menuAction())
         self.menubar.addAction(self.menuIndicator.menuAction())
 
@@ -113,8 +128,15 @@ class Ui_MainWindow(object):
         self.cbInterval.setItemText(18, _translate("MainWindow", "1W"))
         self.cbInterval.setItemText(19, _translate("MainWindow", "1M"))
         self.cbInterval.setItemText(20, _translate("MainWindow", "-----"))
+        self.cbInterval.setItemText(21, _translate("MainWindow", "1000 ticks"))
+        self.cbInterval.setItemText(22, _translate("MainWindow", "1M volume"))
+        self.cbInterval.setItemText(23, _translate("MainWindow", "100M dollar"))
+        self.cbInterval.setItemText(24, _translate("MainWindow", "25 range"))
         self.menuTools.setTitle(_translate("MainWindow", "Tools"))
         self.menuIndicator.setTitle(_translate("MainWindow", "Indicators"))
         self.actionVolumeProfile.setText(_translate("MainWindow", "Volume profile"))
+        self.actionNewChart.setText(_translate("MainWindow", "New chart"))
         self.actionConsole.setText(_translate("MainWindow", "Console"))
         self.actionVolume.setText(_translate("MainWindow", "Volume"))
+        self.actionVPVR.setText(_translate("MainWindow", "Visible range profile"))
+        self.actionWhales.setText(_translate("MainWindow", "Large trades..."))
@@ -12,6 +12,26 @@ fh.setFormatter(fh_formatter)
 logger.addHandler(fh)
 
 
+def toInterval(text):
+    # Trade-driven labels (1000 ticks, 1M volume, 100M dollar, 25 range) to
+    # kind:threshold
+    if " " in text:
+        amount, kind = text.split()
+        scale = {"k": 1e3, "M": 1e6, "B": 1e9}.get(amount[-1], 1)
+        if scale != 1:
+            amount = amount[:-1]
+        return "{}:{:g}".format(kind.rstrip("s"), float(amount) * scale)
+
+    # Toolbar labels (5s, 1m, 4h, 1D, 1W, 1M) to pandas offset aliases, bars
+    # are labelled by their open so months start at MS
+    if text[-1] == "m":
+        return text[:-1] + "min"
+    elif text[-1] == "M":
+        return text[:-1] + "MS"
+    else:
+        return text
+
+
 class Worker(QtCore.QRunnable):
     def __init__(self, fn, *args, **kwargs):
         super().__init__()
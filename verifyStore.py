@@ -0,0 +1,87 @@
+import argparse
+import datetime
+import os
+from multiprocessing import Pool
+from time import perf_counter
+
+import store
+from utils import logger
+
+
+def checkFile(job):
+    file_name, entry, days, deep = job
+    path = os.path.join(store.DATA_DIR, file_name)
+    if not os.path.exists(path):
+        return file_name, "missing"
+    if os.path.getsize(path) != entry["bytes"]:
+        return file_name, "size {} != {}".format(os.path.getsize(path), entry["bytes"])
+    if store.checksum(path) != entry["crc32"]:
+        return file_name, "checksum"
+
+    # Deep checks decode the file and compare its trades with the manifest
+    if deep:
+        for date, day in days:
+            df = store.readDay(datetime.datetime.strptime(date, "%Y%m%d").date())
+            counts = df.symbol.value_counts()
+            if {s: int(n) for s, n in counts.items()} != day["symbols"]:
+                return file_name, "{} trade counts".format(date)
+
+    return file_name, None
+
+
+def verify(workers=None, deep=False, repair=False):
+    manifest = store.loadManifest()
+    days = {}
+    for date, day in manifest["days"].items():
+        days.setdefault(day["file"], []).append((date, day))
+    jobs = [
+        (file_name, entry, days.get(file_name, []), deep)
+        for file_name, entry in sorted(manifest["files"].items())
+    ]
+
+    t = perf_counter()
+    bad = []
+    with Pool(workers) as pool:
+        for file_name, problem in pool.imap_unordered(checkFile, jobs):
+            if problem is not None:
+                bad.append(file_name)
+                logger.debug("Verify | {} --- {}".format(file_name, problem))
+
+    # Day and month files the manifest does not know were never finished
+    untracked = [
+        f
+        for f in sorted(os.listdir(store.DATA_DIR))
+        if f.endswith((".csv", ".month", ".tmp")) and f not in manifest["files"]
+    ]
+    for file_name in untracked:
+        logger.debug("Verify | {} --- not in manifest".format(file_name))
+
+    logger.debug(
+        "Verify | {} files, {} bad, {} untracked in {:.2f}s".format(
+            len(jobs), len(bad), len(untracked), perf_counter() - t
+        )
+    )
+
+    if repair and (bad or untracked):
+        store.dropFiles(bad + untracked)
+        logger.debug("Verify | Dropped {} files".format(len(bad) + len(untracked)))
+    return bad, untracked
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Check the data/ store against its manifest"
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--deep", action="store_true", help="also decode files and compare counts"
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="forget bad files so the next update downloads their days again",
+    )
+    args = parser.parse_args()
+
+    bad, untracked = verify(args.workers, args.deep, args.repair)
+    raise SystemExit(1 if bad or untracked else 0)
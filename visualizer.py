@@ -6,24 +6,38 @@ import pyqtgraph as pg
 from pyqtgraph import QtCore, QtGui
 from pyqtgraph.dockarea import DockArea
 
+from aggregator import isTimeInterval
 from candlestickItem import CandlestickItem
 from utils import Worker, logger
 from volumeProfileItem import VolumeProfileItem
 from volumeItem import volumeItem
+from vpvrItem import VPVRItem
+from whaleItem import WhaleItem
 
 
 class Visualizer:
-    def __init__(self, parent):
-        self.db = parent.db
+    def __init__(self, parent, db=None):
+        self.db = parent.db if db is None else db
         self.dockArea = DockArea(parent)
         self.mouseIndex = ""
-        self.dateFormat = self.getDateFormat("T")
+        self.dateFormat = self.getDateFormat("1min")
 
         # Text and crosshair
         self.hLines = {}
         self.hTexts = {}
         self.vLines = {}
         self.vText = None
+        self.plotItems = {}
+        self.mouseProxies = {}
+        self.lastPlot = None
+        self.activeLine = None
+        self.lastBarTs = None
+        self.lastBarKey = None
+
+        # Reused on every mouse move
+        self.crossPen = pg.mkPen()
+        self.hiddenPen = pg.mkPen(None)
+        self.textColor = pg.mkColor(200, 200, 200)
 
         # Candlestick init
         self.candlestick = CandlestickItem(self.db)
@@ -35,9 +49,16 @@ class Visualizer:
         )
         self.candlestickWidget.addItem(self.candlestick)
         self.candlestickWidget.addItem(self.volumeProfile)
+        self.vpvr = None
+        self.whales = None
 
         self.addPlot("ohlc", self.candlestickWidget, 2)
 
+        # Hovered bar readout, pinned to the top left of the price pane
+        self.barText = pg.LabelItem(justify="left", color=self.textColor)
+        self.barText.setParentItem(self.candlestickWidget.getPlotItem())
+        self.barText.anchor(itemPos=(0, 0), parentPos=(0, 0), offset=(10, 5))
+
     def setIndex(self, index):
         worker = Worker(self.candlestick.setIndex, index)
         QtCore.QThreadPool.globalInstance().start(worker)
@@ -47,11 +68,14 @@ class Visualizer:
         worker = Worker(self.candlestick.setInterval, interval)
         QtCore.QThreadPool.globalInstance().start(worker)
         self.dateFormat = self.getDateFormat(interval)
+        self.lastBarTs = None
 
     def getDateFormat(self, interval):
-        if interval.find("S") != -1:
+        if not isTimeInterval(interval):
+            dtFormat = "%d %b '%y  %H:%M:%S"
+        elif interval.lstrip("0123456789.") in ("s", "S"):
             dtFormat = "%d %b '%y  %H:%M:%S"
-        elif interval.find("T") != -1 or interval.find("H") != -1:
+        elif interval.lstrip("0123456789.") in ("min", "T", "h", "H"):
             dtFormat = "%d %b '%y  %H:%M"
         else:
             dtFormat = "%d %b '%y"
@@ -59,8 +83,8 @@ class Visualizer:
         return dtFormat
 
     def addPlot(self, name, plotWidget, stretch=1):
-        if len(self.dockArea.docks):
-            p = list(self.dockArea.docks.items())[-1][1].widgets[0].getPlotItem()
+        if self.lastPlot is not None:
+            p = self.lastPlot
             p.getAxis("bottom").setStyle(showValues=False)
             plotWidget.setXLink(p)
             p.removeItem(self.vText)
@@ -73,7 +97,9 @@ class Visualizer:
         plotWidget.showGrid(True, True, 0.25)
         plotWidget.hideButtons()
         # plotWidget.setLimits(maxXRange=345600)
-        plotWidget.scene().sigMouseMoved.connect(self.onMouseMoved)
+        self.mouseProxies[name] = pg.SignalProxy(
+            plotWidget.scene().sigMouseMoved, rateLimit=60, slot=self.onMouseMoved
+        )
         plotWidget.scene().sigMouseHover.connect(self.onMouseHover)
 
         dock = self.dockArea.addDock(
@@ -82,23 +108,26 @@ class Visualizer:
         dock.addWidget(plotWidget)
 
         # Crosshair init
-        hLine = pg.InfiniteLine(angle=0)
+        hLine = pg.InfiniteLine(angle=0, pen=self.hiddenPen)
         plotWidget.addItem(hLine, ignoreBounds=True)
 
-        vLine = pg.InfiniteLine(angle=90)
-        vLine.setPen(pg.mkPen())
+        vLine = pg.InfiniteLine(angle=90, pen=self.crossPen)
         plotWidget.addItem(vLine, ignoreBounds=True)
 
         # Text init
         self.vText = pg.TextItem(fill="k", anchor=(0, 1))
         plotWidget.addItem(self.vText, ignoreBounds=True)
 
-        hText = pg.TextItem(fill="k", anchor=(1, 0.5))
+        hText = pg.TextItem(fill="k", anchor=(1, 0.5), color=self.textColor)
+        hText.hide()
         plotWidget.addItem(hText, ignoreBounds=True)
 
         self.hLines[name] = hLine
         self.hTexts[name] = hText
         self.vLines[name] = vLine
+        self.plotItems[name] = plotWidget.getPlotItem()
+        self.lastPlot = self.plotItems[name]
+        self.lastBarTs = None
 
     def removePlot(self, name):
         self.dockArea.docks.get(name).close()
@@ -107,9 +136,15 @@ class Visualizer:
         self.hLines.pop(name)
         self.hTexts.pop(name)
         self.vLines.pop(name)
+        self.plotItems.pop(name)
+        self.mouseProxies.pop(name).disconnect()
+        if self.activeLine == name:
+            self.activeLine = None
 
         p = list(self.dockArea.docks.items())[-1][1].widgets[0]
         p.getAxis("bottom").setStyle(showValues=True)
+        self.lastPlot = p.getPlotItem()
+        self.lastBarTs = None
 
         self.vText = pg.TextItem(fill=(255, 255, 255, 50), anchor=(0, 1))
         p.addItem(self.vText, ignoreBounds=True)
@@ -123,37 +158,135 @@ class Visualizer:
         else:
             self.removePlot("volume")
 
-    def onMouseMoved(self, pos):
-        try:
-            p = self.dockArea.docks.get(self.mouseIndex).widgets[0].getPlotItem()
-            pLast = list(self.dockArea.docks.items())[-1][1].widgets[0].getPlotItem()
-        except Exception:
+    def toggleVPVR(self, checked):
+        if checked:
+            self.vpvr = VPVRItem(self)
+            self.candlestickWidget.addItem(self.vpvr, ignoreBounds=True)
+            self.vpvr.refresh()
+        elif self.vpvr is not None:
+            self.candlestickWidget.removeItem(self.vpvr)
+            self.vpvr = None
+
+    def refreshVPVR(self):
+        if self.vpvr is not None:
+            self.vpvr.refresh()
+
+    def toggleWhales(self, checked, minSize=None):
+        if self.whales is not None:
+            self.candlestickWidget.removeItem(self.whales)
+            self.whales = None
+        if checked:
+            self.whales = WhaleItem(self, minSize)
+            self.candlestickWidget.addItem(self.whales, ignoreBounds=True)
+            self.whales.refresh()
+
+    def refreshWhales(self):
+        if self.whales is not None:
+            self.whales.refresh()
+
+    def onMouseMoved(self, event):
+        pos = event[0]
+        p = self.plotItems.get(self.mouseIndex)
+        step = self.candlestick.step
+        if p is None or step is None:
             return
 
-        xLim, _ = p.getViewBox().viewRange()
-        _, yLim = pLast.getViewBox().viewRange()
+        vb = p.getViewBox()
+        mousePoint = vb.mapSceneToView(pos)
 
-        mousePoint = p.getViewBox().mapSceneToView(pos)
-        index = int(mousePoint.x())
-        x = round((index - self.candlestick.anchor) / self.candlestick.step)
-        timestamp = self.candlestick.anchor + x * self.candlestick.step
-        dt = datetime.datetime.fromtimestamp(timestamp)
+        # Snap to the bar grid; time bars are regular so the hovered bar is a
+        # direct index, trade-driven bars fall back to a search
+        data = self.candlestick.data
+        if isTimeInterval(self.db.interval):
+            anchor = self.candlestick.anchor
+            timestamp = anchor + round((mousePoint.x() - anchor) / step) * step
+        elif data is None or not len(data):
+            return
+        else:
+            x = data[:, 0]
+            i = min(np.searchsorted(x, mousePoint.x()), len(x) - 1)
+            if i and mousePoint.x() - x[i - 1] < x[i] - mousePoint.x():
+                i -= 1
+            timestamp = x[i]
 
         # Vertical line and text
-        [vLine.setValue(timestamp) for vLine in self.vLines.values()]
+        for vLine in self.vLines.values():
+            vLine.setValue(timestamp)
+        yLim = self.lastPlot.getViewBox().viewRange()[1]
         self.vText.setPos(timestamp, yLim[0])
-        self.vText.setText(dt.strftime(self.dateFormat))
-
-        # Horizontal line and text
-        [hLine.setPen(pg.mkPen(None)) for hLine in self.hLines.values()]
-        [hText.setPos(0, 0) for hText in self.hTexts.values()]
+        if timestamp != self.lastBarTs:
+            self.lastBarTs = timestamp
+            dt = datetime.datetime.fromtimestamp(timestamp)
+            self.vText.setText(dt.strftime(self.dateFormat))
+
+        # Refresh the readout when the bar or the data behind it changes
+        barKey = (timestamp, id(self.candlestick.data))
+        if barKey != self.lastBarKey:
+            self.lastBarKey = barKey
+            self.updateBarText(timestamp, step)
+
+        # Horizontal line and text, only the hovered pane shows them
+        if self.activeLine is not None and self.activeLine != self.mouseIndex:
+            self.hLines[self.activeLine].setPen(self.hiddenPen)
+            self.hTexts[self.activeLine].hide()
+            self.activeLine = None
+
+        hLine = self.hLines[self.mouseIndex]
+        hText = self.hTexts[self.mouseIndex]
         if p.viewRect().contains(mousePoint):
-            self.hLines[self.mouseIndex].setPen(pg.mkPen())
-            self.hLines[self.mouseIndex].setValue(mousePoint.y())
+            if self.activeLine is None:
+                hLine.setPen(self.crossPen)
+                hText.show()
+                self.activeLine = self.mouseIndex
+
+            hLine.setValue(mousePoint.y())
+            hText.setText("{:,.2f}".format(mousePoint.y()))
+            hText.setPos(vb.viewRange()[0][1], mousePoint.y())
+        elif self.activeLine is not None:
+            hLine.setPen(self.hiddenPen)
+            hText.hide()
+            self.activeLine = None
+
+    def updateBarText(self, timestamp, step):
+        data = self.candlestick.data
+        if data is None or not len(data):
+            return
 
-            self.hTexts[self.mouseIndex].setColor(pg.mkColor(200, 200, 200))
-            self.hTexts[self.mouseIndex].setText("{:,.2f}".format(mousePoint.y()))
-            self.hTexts[self.mouseIndex].setPos(xLim[1], mousePoint.y())
+        if isTimeInterval(self.db.interval):
+            i = int(round((timestamp - data[0][0]) / step))
+        else:
+            i = np.searchsorted(data[:, 0], timestamp)
+        if 0 <= i < len(data) and not np.isnan(data[i][1]):
+            _, o, h, l, c, v = data[i][:6]
+            color = "#00ff00" if c >= o else "#ff0000"
+            text = (
+                "O <span style='color: {0}'>{1:,.2f}</span>  "
+                "H <span style='color: {0}'>{2:,.2f}</span>  "
+                "L <span style='color: {0}'>{3:,.2f}</span>  "
+                "C <span style='color: {0}'>{4:,.2f}</span>  "
+                "V <span style='color: {0}'>{5:,.0f}</span>".format(
+                    color, o, h, l, c, v
+                )
+            )
+
+            # Microstructure columns are plotted next to OHLC, downsampled bars
+            # carry them for the whole bar
+            if data.shape[1] > 12 and data[i][8]:
+                trades, vwap, avgSize, maxSize, imbalance = data[i][8:13]
+                text += (
+                    "<br>Trades {:,.0f}  VWAP {:,.2f}  Avg {:,.0f}  Max {:,.0f}  "
+                    "Imb <span style='color: {}'>{:+.1%}</span>".format(
+                        trades,
+                        vwap,
+                        avgSize,
+                        maxSize,
+                        "#00ff00" if imbalance >= 0 else "#ff0000",
+                        imbalance,
+                    )
+                )
+            self.barText.setText(text)
+        else:
+            self.barText.setText("")
 
     def onMouseHover(self, items):
         for name, dock in self.dockArea.docks.items():
@@ -15,6 +15,8 @@ class VolumeProfileItem(pg.GraphicsObject):
         super().__init__()
         self.db = db
         self.data = []
+        # [histogram, feed cursor, end] for profiles that follow the feed
+        self.live = []
         self.picture = QtGui.QPicture()
         self.textItems = []
 
@@ -49,11 +51,19 @@ class VolumeProfileItem(pg.GraphicsObject):
         self.update()
 
     def addText(self, data):
+        self.textItems.append(self.makeText(data))
+
+    def removeText(self, index):
+        for i in self.textItems[index]:
+            if i.scene() is not None:
+                i.scene().removeItem(i)
+
+    def makeText(self, data):
         formatter = lambda x: str(round(x / 1e06, 2)) + "M"
 
         x, y, df, _, _ = data
 
-        total = df.sum(axis=0)
+        total = df.sum(axis=0).to_numpy()
         item = pg.TextItem(
             "Total: " + formatter(total[0]) + " X " + formatter(total[1])
         )
@@ -69,37 +79,65 @@ class VolumeProfileItem(pg.GraphicsObject):
             item.setParentItem(self)
             items.append(item)
 
-        self.textItems.append(items)
+        return items
 
     def addData(self, start, end, num):
         x = [start.toUTC().toSecsSinceEpoch(), end.toUTC().toSecsSinceEpoch()]
         if (start < end) and (x not in [data[0] for data in self.data]):
-            df, y, step = self.db.volumeOnPrice(
+            hist, seen, last = self.db.volumeOnPrice(
                 start.toPyDateTime(), end.toPyDateTime(), num
             )
-            data = [x, y, df, step, 127]
+            data = [x, (hist.low, hist.high), hist.toFrame(), hist.step, 127]
 
             self.data.append(data)
+            self.live.append(None if seen is None else [hist, seen, last])
             self.addText(data)
             self.updateData()
             return True
         else:
             return False
 
+    def refresh(self):
+        changed = False
+        for index, (data, live) in enumerate(zip(self.data, self.live)):
+            if live is None:
+                continue
+
+            # Only the trades that arrived since the last refresh are binned
+            # The same bar end as the first query, a forming bar has none
+            hist, seen, end = live
+            df, live[1] = self.db.liveTrades(seen)
+            if end is not None:
+                df = df[df.index < end]
+            if not len(df):
+                continue
+
+            hist.add(df)
+            data[1] = (hist.low, hist.high)
+            data[2] = hist.toFrame()
+            data[3] = hist.step
+
+            self.removeText(index)
+            self.textItems[index] = self.makeText(data)
+            changed = True
+
+        if changed:
+            self.updateData()
+
     def removeData(self, index):
-        for i in self.textItems[index]:
-            self.scene().removeItem(i)
+        self.removeText(index)
         self.textItems.pop(index)
 
         self.data.pop(index)
+        self.live.pop(index)
         self.updateData()
 
     def removeAll(self):
-        for _ in range(len(self.data)):
-            for i in self.textItems[0]:
-                i.scene().removeItem(i)
-            self.textItems.pop(0)
-            self.data.pop(0)
+        for index in range(len(self.data)):
+            self.removeText(index)
+        self.textItems = []
+        self.data = []
+        self.live = []
 
         self.updateData()
 
@@ -0,0 +1,95 @@
+import numpy as np
+import pyqtgraph as pg
+from pyqtgraph import QtCore
+
+from barGraphItem import RectArray
+from utils import Worker
+
+
+class VPVRItem(pg.GraphicsObject):
+    sigProfile = QtCore.pyqtSignal(object)
+
+    def __init__(self, parent, rows=24, width=0.25):
+        super().__init__()
+        self.db = parent.db
+        self.rows = rows
+        self.width = width
+        self.plotting = False
+        self.rect = QtCore.QRectF()
+
+        self.buyBars = RectArray()
+        self.sellBars = RectArray()
+        self.pen = pg.mkPen(None)
+        self.buyBrush = pg.mkBrush(0, 255, 0, 90)
+        self.sellBrush = pg.mkBrush(255, 0, 0, 90)
+        # Profiles are summed on a worker, the bars change on the GUI thread
+        # between paints
+        self.sigProfile.connect(self.setProfile)
+
+    def updateProfile(self):
+        vb = self.getViewBox()
+        if vb is None:
+            self.plotting = False
+            return  # no ViewBox yet
+
+        # Pans that land while a profile is being summed are picked up before
+        # the worker exits, so the last view always gets its profile
+        while True:
+            start, stop = vb.viewRange()[0]
+            profile = self.db.visibleProfile(start, stop, self.rows)
+            self.sigProfile.emit((profile, start, stop))
+            if vb.viewRange()[0] == [start, stop]:
+                break
+        self.plotting = False
+
+    def setProfile(self, update):
+        profile, start, stop = update
+        if profile is None:
+            empty = np.empty(0)
+            self.buyBars.set(empty, empty, empty, empty)
+            self.sellBars.set(empty, empty, empty, empty)
+            rect = QtCore.QRectF()
+        else:
+            # Rows grow leftwards from the right edge of the view
+            edges, buy, sell = profile
+            scale = self.width * (stop - start) / max((buy + sell).max(), 1e-12)
+            y = edges[:-1]
+            h = np.diff(edges) * 0.9
+            buyWidth = buy * scale
+            sellWidth = sell * scale
+            left = stop - buyWidth - sellWidth
+            self.buyBars.set(left, y, buyWidth, h)
+            self.sellBars.set(left + buyWidth, y, sellWidth, h)
+            rect = QtCore.QRectF(
+                stop - self.width * (stop - start),
+                edges[0],
+                self.width * (stop - start),
+                edges[-1] - edges[0],
+            )
+
+        self.prepareGeometryChange()
+        self.rect = rect
+        self.update()
+
+    def paint(self, p, *args):
+        p.setPen(self.pen)
+        p.setBrush(self.buyBrush)
+        self.buyBars.draw(p)
+        p.setBrush(self.sellBrush)
+        self.sellBars.draw(p)
+
+    def boundingRect(self):
+        return self.rect
+
+    def dataBounds(self, ax, frac=1.0, orthoRange=None):
+        return (None, None)
+
+    def refresh(self):
+        # Pans and live ticks share one worker, a busy item skips the request
+        if not self.plotting:
+            self.plotting = True
+            worker = Worker(self.updateProfile)
+            QtCore.QThreadPool.globalInstance().start(worker)
+
+    def viewRangeChanged(self):
+        self.refresh()
@@ -0,0 +1,71 @@
+import numpy as np
+import pyqtgraph as pg
+from pyqtgraph import QtCore
+
+from utils import Worker
+
+
+class WhaleItem(pg.ScatterPlotItem):
+    sigMarkers = QtCore.pyqtSignal(object)
+
+    def __init__(self, parent, minSize, spacing=8, minPx=6, maxPx=40):
+        super().__init__(pxMode=True, pen=None)
+        self.db = parent.db
+        self.minSize = minSize
+        self.spacing = spacing
+        self.minPx = minPx
+        self.maxPx = maxPx
+        self.plotting = False
+
+        self.buyBrush = pg.mkBrush(0, 255, 0, 110)
+        self.sellBrush = pg.mkBrush(255, 0, 0, 110)
+        # Markers are found on a worker and handed to the GUI thread
+        self.sigMarkers.connect(self.setMarkers)
+
+    def updateMarkers(self):
+        vb = self.getViewBox()
+        if vb is None:
+            self.plotting = False
+            return  # no ViewBox yet
+
+        while True:
+            start, stop = vb.viewRange()[0]
+            trades = self.db.largeTrades(start, stop, self.minSize)
+            self.sigMarkers.emit(self.thin(trades, start, stop, vb.width()))
+            if vb.viewRange()[0] == [start, stop]:
+                break
+        self.plotting = False
+
+    def thin(self, trades, start, stop, width):
+        if trades is None or not len(trades[0]) or stop <= start:
+            return None
+
+        # Trades come largest first, so the first one in each few pixels of
+        # width is the one kept; zoomed out, small whales give way
+        time, price, size, buy = trades
+        scale = width / self.spacing / (stop - start)
+        column = ((time - start) * scale).astype(np.int64)
+        _, keep = np.unique(column, return_index=True)
+        return time[keep], price[keep], size[keep], buy[keep]
+
+    def setMarkers(self, markers):
+        if markers is None:
+            self.setData(x=[], y=[])
+            return
+
+        # Area grows with size, from minPx at the threshold
+        time, price, size, buy = markers
+        px = np.clip(self.minPx * np.sqrt(size / self.minSize), self.minPx, self.maxPx)
+        brushes = np.where(buy, self.buyBrush, self.sellBrush)
+        self.setData(x=time, y=price, size=px, brush=list(brushes))
+
+    def refresh(self):
+        # Pans and live ticks share one worker, a busy item skips the request
+        if not self.plotting:
+            self.plotting = True
+            worker = Worker(self.updateMarkers)
+            QtCore.QThreadPool.globalInstance().start(worker)
+
+    def viewRangeChanged(self):
+        super().viewRangeChanged()
+        self.refresh()
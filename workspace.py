@@ -0,0 +1,91 @@
+from PyQt5 import QtCore, QtWidgets
+from pyqtgraph.dockarea import Dock, DockArea
+
+from database import Database
+from utils import logger, toInterval
+from visualizer import Visualizer
+
+
+class ChartWidget(QtWidgets.QWidget):
+    def __init__(self, parent, service, index, text, intervals):
+        super().__init__(parent)
+        # Only view state lives here, data comes from the shared service
+        interval = toInterval(text)
+        self.db = Database(index, interval, service)
+        self.visualizer = Visualizer(self, self.db)
+        self.visualizer.dateFormat = self.visualizer.getDateFormat(interval)
+
+        self.cbSymbol = QtWidgets.QComboBox(self)
+        self.cbSymbol.addItems(self.db.symbols)
+        self.cbSymbol.setCurrentIndex(index)
+        self.cbSymbol.currentIndexChanged.connect(self.cbSymbolSelect)
+
+        self.cbInterval = QtWidgets.QComboBox(self)
+        self.cbInterval.addItems(intervals)
+        # Intervals typed into the toolbar are not in the startup list
+        known = [toInterval(label) for label in intervals]
+        if interval not in known:
+            self.cbInterval.addItem(text)
+            known.append(interval)
+        self.cbInterval.setCurrentIndex(known.index(interval))
+        self.cbInterval.activated.connect(self.cbIntervalSelect)
+
+        header = QtWidgets.QHBoxLayout()
+        header.addWidget(self.cbSymbol)
+        header.addWidget(self.cbInterval)
+        header.addStretch()
+
+        layout = QtWidgets.QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addLayout(header)
+        layout.addWidget(self.visualizer.dockArea)
+
+    def refresh(self):
+        self.visualizer.candlestick.refresh()
+
+    def release(self):
+        self.db.close()
+
+    @QtCore.pyqtSlot(int)
+    def cbSymbolSelect(self, i):
+        self.visualizer.setIndex(i)
+
+    @QtCore.pyqtSlot(int)
+    def cbIntervalSelect(self, i):
+        self.visualizer.setInterval(toInterval(self.cbInterval.currentText()))
+
+
+class Workspace(object):
+    def __init__(self, parent, service, intervals):
+        self.parent = parent
+        self.service = service
+        self.intervals = intervals
+        self.dockArea = DockArea(parent)
+        self.charts = {}
+        self.count = 0
+
+    def addMain(self, widget):
+        dock = Dock("main", hideTitle=True)
+        dock.addWidget(widget)
+        self.dockArea.addDock(dock)
+
+    def addChart(self, index, text):
+        self.count += 1
+        name = "chart {}".format(self.count)
+
+        chart = ChartWidget(self.parent, self.service, index, text, self.intervals)
+        dock = Dock(name, closable=True)
+        dock.addWidget(chart)
+        dock.sigClosed.connect(self.removeChart)
+        self.dockArea.addDock(dock, "right")
+
+        self.charts[name] = chart
+        logger.debug("Workspace | Opened {} {}".format(name, text))
+
+    def removeChart(self, dock):
+        chart = self.charts.pop(dock.name())
+        chart.release()
+
+    def refresh(self):
+        for chart in self.charts.values():
+            chart.refresh()